@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks.runner import Benchmark, uncovered_routes
+from benchmarks.scenarios import SCENARIOS
+
+
+class Command(BaseCommand):
+    """
+    Load tests every product and sales route (see benchmarks.scenarios) and
+    reports throughput, p50/p95/p99 latency and queries per request. The
+    results can be saved as JSON to compare runs across commits.
+
+    By default requests go through Django in this process; with --base-url
+    they are sent to a running server instead (queries are then not
+    counted). Write routes create rows: use a database filled by
+    `manage.py seed_data`, not production.
+
+    To compare database profiles, run the same routes under each
+    DATABASE_PROFILE, e.g. concurrent checkout write throughput:
+    DATABASE_PROFILE=sqlite-untuned manage.py benchmark --route sales-checkout
+    --concurrency 8, then again with DATABASE_PROFILE=sqlite.
+    """
+
+    help = "Benchmark the API routes against the current database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Measured requests per route (default: 200).",
+        )
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=10,
+            help="Unmeasured requests per route before measuring (default: 10).",
+        )
+        parser.add_argument(
+            "--route",
+            action="append",
+            dest="routes",
+            metavar="PATTERN",
+            help=(
+                "Only routes whose 'METHOD url-name' contains PATTERN "
+                "(repeatable), e.g. 'GET product' or 'sales-report'."
+            ),
+        )
+        parser.add_argument("--base-url", help="Benchmark a running server instead.")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        for name in uncovered_routes():
+            self.stderr.write(f"Warning: no benchmark scenario for route {name}")
+        routes = list(SCENARIOS)
+        if options["routes"]:
+            routes = [
+                key for key in routes if any(p in key for p in options["routes"])
+            ]
+            if not routes:
+                raise CommandError("No route matches --route.")
+        benchmark = Benchmark(
+            routes,
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            warmup=options["warmup"],
+        )
+        profile = getattr(settings, "DATABASE_PROFILE", connection.vendor)
+        self.stdout.write(f"Database profile: {profile}")
+        self.stdout.write(
+            f"{'route':<45} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'queries':>8} {'errors':>7}"
+        )
+        try:
+            results = benchmark.run(options["base_url"], progress=self.report)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+            saved = f"Results saved to {options['output']}"
+            self.stdout.write(self.style.SUCCESS(saved))
+
+    def report(self, key, summary):
+        latency, queries = summary["latency_ms"], summary["queries_per_request"]
+        self.stdout.write(
+            f"{key:<45} {summary['throughput'] or 0:>9.1f} "
+            f"{latency['p50'] or 0:>9.2f} {latency['p95'] or 0:>9.2f} "
+            f"{latency['p99'] or 0:>9.2f} {queries['mean'] or 0:>8.1f} "
+            f"{summary['errors']:>7}"
+        )
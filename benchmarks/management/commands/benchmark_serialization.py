@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from products.models import Products
+from products.serializers import ProductSerializer
+from products.views import PRODUCT_ROWS
+from retail_software.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    """
+    Compares the list read paths on the products in the database: model
+    instances through ProductSerializer and DRF's JSONRenderer (the old
+    path) against `.values_list()` rows through RowSerializer and the
+    FastJSONRenderer. Both produce the same bytes. Fetching the rows and
+    serializing them (to rendered JSON) are timed separately.
+    Seed the products first (manage.py seed_data).
+    """
+
+    help = "Measure product list serialization throughput, old and fast paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=50000,
+            help="Products serialized per run (default: 50000).",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="Best of N runs.")
+
+    def handle(self, *args, **options):
+        products = Products.objects.order_by("id")[: options["rows"]]
+        count = products.count()
+        if not count:
+            raise CommandError("Seed the database first (manage.py seed_data).")
+        paths = {
+            "model": (
+                lambda: list(products.all()),
+                lambda rows: JSONRenderer().render(
+                    ProductSerializer(rows, many=True).data
+                ),
+            ),
+            "rows": (
+                lambda: list(PRODUCT_ROWS.values(products)),
+                lambda rows: FastJSONRenderer().render(PRODUCT_ROWS.serialize(rows)),
+            ),
+        }
+        outputs = [serialize(fetch()) for fetch, serialize in paths.values()]
+        if outputs[0] != outputs[1]:
+            raise CommandError("The fast path does not match ProductSerializer.")
+
+        self.stdout.write(f"{count} products, best of {options['repeat']}")
+        self.stdout.write(
+            f"{'path':<6} {'fetch ms':>10} {'serialize ms':>13} {'rows/s':>10}"
+        )
+        timings = {}
+        for name, (fetch, serialize) in paths.items():
+            fetched = serialized = None
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                rows = fetch()
+                middle = time.perf_counter()
+                serialize(rows)
+                finished = time.perf_counter()
+                fetched = min(fetched or middle - started, middle - started)
+                serialized = min(serialized or finished - middle, finished - middle)
+            timings[name] = (fetched, serialized)
+            self.stdout.write(
+                f"{name:<6} {fetched * 1000:>10.1f} {serialized * 1000:>13.1f} "
+                f"{count / serialized:>10,.0f}"
+            )
+        (model_fetch, model_serialize), (row_fetch, row_serialize) = timings.values()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Serialization {model_serialize / row_serialize:.1f}x faster, "
+                f"fetch and serialization "
+                f"{(model_fetch + model_serialize) / (row_fetch + row_serialize):.1f}x"
+            )
+        )
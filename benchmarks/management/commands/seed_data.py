@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.seeding import SEED_BATCH_SIZE, Seeder
+
+
+class Command(BaseCommand):
+    """
+    Fills the database with synthetic categories, products, sales and sale
+    items for benchmarks (see `manage.py benchmark`). Rows are bulk inserted
+    in batches, so millions of them can be generated; the same --seed gives
+    the same data. Adds to whatever the database already holds.
+    """
+
+    help = "Bulk insert synthetic data for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--products", type=int, default=5000)
+        parser.add_argument("--sales", type=int, default=50000)
+        parser.add_argument(
+            "--items-per-sale",
+            type=int,
+            default=5,
+            help="Maximum items per sale; each gets 1 to this many (default: 5).",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="Sales are spread over this many past days (default: 90).",
+        )
+        parser.add_argument("--seed", type=int, help="Seed for repeatable data.")
+        parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            progress=lambda message: self.stderr.write(message),
+        )
+        try:
+            counts = seeder.run(
+                categories=options["categories"],
+                products=options["products"],
+                sales=options["sales"],
+                items_per_sale=max(1, options["items_per_sale"]),
+                days=options["days"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Created {categories} categories, {products} products, "
+                "{sales} sales and {items} items.".format(**counts)
+            )
+        )
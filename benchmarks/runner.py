@@ -0,0 +1,284 @@
+import asyncio
+import http.client
+import json
+import logging
+import platform
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from products.urls import urlpatterns as product_urlpatterns
+from sales.payments.fake import FakeProvider
+from sales.urls import urlpatterns as sales_urlpatterns
+from .scenarios import SCENARIOS, Fixtures
+
+PERCENTILES = (50, 95, 99)
+
+
+def uncovered_routes():
+    # Names of the product and sales routes no scenario calls
+    names = {pattern.name for pattern in product_urlpatterns + sales_urlpatterns}
+    covered = {entry.name for entry in SCENARIOS.values()}
+    return sorted(names - covered)
+
+
+def percentile(ordered, percent):
+    # Nearest-rank percentile of an ascending list
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    Statistics of one route: `samples` are (seconds, status, queries) per
+    request and `elapsed` the wall time of the whole measured run.
+    """
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    statuses = Counter(str(status) for _, status, _ in samples)
+    summary = {
+        "requests": len(samples),
+        "errors": sum(count for code, count in statuses.items() if code >= "500"),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "queries_per_request": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "max": max(queries) if queries else None,
+        },
+    }
+    for percent in PERCENTILES:
+        value = percentile(latencies, percent)
+        summary["latency_ms"][f"p{percent}"] = (
+            None if value is None else round(value, 3)
+        )
+    return summary
+
+
+class InProcessTransport:
+    """
+    Sends requests through Django's test client in this process, so no
+    server is needed and the queries of every request can be counted.
+    Each worker thread has its own client and database connection.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, method, request):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            # Errors are measured as 500 responses rather than raised
+            client = self.local.client = Client(raise_request_exception=False)
+        body = request.body
+        if body is not None and not isinstance(body, str):
+            body = json.dumps(body)
+        kwargs = {}
+        if body is not None:
+            kwargs = {"data": body, "content_type": request.content_type}
+        with CaptureQueriesContext(connection) as queries:
+            response = client.generic(method, request.path, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:  # Time the whole stream
+                    pass
+        return response.status_code, len(queries)
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """
+    Sends requests to a running server (e.g. gunicorn or uvicorn) over one
+    keep-alive connection per worker thread. Queries cannot be counted.
+    """
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.netloc, self.prefix = url.netloc, url.path.rstrip("/")
+        self.local = threading.local()
+
+    def send(self, method, request):
+        conn = getattr(self.local, "connection", None)
+        if conn is None:
+            conn = self.local.connection = self.connection_class(self.netloc)
+        body = request.body
+        if body is not None and not isinstance(body, str):
+            body = json.dumps(body)
+        headers = {} if body is None else {"Content-Type": request.content_type}
+        try:
+            conn.request(method, self.prefix + request.path, body, headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.connection = None
+            return "failed", None
+        return response.status, None
+
+    def close(self):
+        conn = getattr(self.local, "connection", None)
+        if conn is not None:
+            conn.close()
+            self.local.connection = None
+
+
+class FakeProviderThread:
+    """
+    Serves the fake mobile money provider from a background event loop, so
+    the payment route can be benchmarked in process without the real API.
+    """
+
+    def __init__(self, **options):
+        self.fake = FakeProvider(**options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            self.fake.serve(port=0), self.loop
+        ).result()
+        return "http://127.0.0.1:%d" % self.server.sockets[0].getsockname()[1]
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def shutdown(self):
+        # Stop serving, then let the handlers of open connections finish
+        self.server.close()
+        self.fake.close()
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+
+
+class Benchmark:
+    """
+    Calls every selected route `requests` times from `concurrency` threads,
+    after `warmup` unmeasured calls, one route at a time, and reports per
+    route throughput, latency percentiles and queries per request.
+
+    Routes that write create rows (named after the run's tag); run it on a
+    database seeded for the purpose (manage.py seed_data).
+    """
+
+    def __init__(self, routes=None, requests=200, concurrency=4, warmup=10):
+        self.scenarios = [
+            SCENARIOS[key] for key in (routes if routes is not None else SCENARIOS)
+        ]
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = warmup
+
+    def run(self, base_url=None, progress=None):
+        progress = progress or (lambda key, summary: None)
+        meta = self.meta(base_url)
+        fixtures = Fixtures()
+        if base_url is not None:
+            routes = self.run_routes(fixtures, HttpTransport(base_url), progress)
+        else:
+            routes = self.run_in_process(fixtures, progress)
+        return {"meta": meta, "routes": routes}
+
+    def run_in_process(self, fixtures, progress):
+        # 4xx answers are expected (e.g. unknown callback references)
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with FakeProviderThread(delay=1.0, failure_rate=0.1) as provider_url:
+                provider = dict(settings.PAYMENT_PROVIDER, BASE_URL=provider_url)
+                hosts = [*settings.ALLOWED_HOSTS, "testserver"]  # The client's host
+                with override_settings(
+                    PAYMENT_PROVIDER=provider, ALLOWED_HOSTS=hosts
+                ):
+                    return self.run_routes(fixtures, InProcessTransport(), progress)
+        finally:
+            request_logger.setLevel(level)
+
+    def run_routes(self, fixtures, transport, progress):
+        routes = {}
+        for entry in self.scenarios:
+            total = self.warmup + self.requests
+            prepared = entry.prepare(fixtures, total) if entry.prepare else None
+            calls = [
+                (entry.method, entry.build(fixtures, index, prepared))
+                for index in range(total)
+            ]
+            self.call_all(transport, calls[: self.warmup])
+            started = time.perf_counter()
+            samples = self.call_all(transport, calls[self.warmup :])
+            routes[entry.key] = summarize(samples, time.perf_counter() - started)
+            progress(entry.key, routes[entry.key])
+        return routes
+
+    def call_all(self, transport, calls):
+        # Spread the calls over the worker threads; returns their samples
+        pending = iter(calls)
+        lock = threading.Lock()
+
+        def work():
+            samples = []
+            try:
+                while True:
+                    with lock:
+                        call = next(pending, None)
+                    if call is None:
+                        return samples
+                    started = time.perf_counter()
+                    status, queries = transport.send(*call)
+                    samples.append((time.perf_counter() - started, status, queries))
+            finally:
+                transport.close()
+
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            workers = [executor.submit(work) for _ in range(self.concurrency)]
+            return [sample for worker in workers for sample in worker.result()]
+
+    def meta(self, base_url):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "target": base_url or "in-process",
+            "database": connection.vendor,
+            "database_profile": getattr(settings, "DATABASE_PROFILE", None),
+            "requests": self.requests,
+            "concurrency": self.concurrency,
+            "warmup": self.warmup,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        }
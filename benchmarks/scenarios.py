@@ -0,0 +1,435 @@
+import csv
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from urllib.parse import urlencode
+
+from django.urls import reverse
+from django.utils import timezone
+
+from products.cache import catalog_version, invalidate_catalog
+from products.models import Category, Products
+from sales.models import Sales, SaleItems
+
+FIXTURE_SAMPLE_SIZE = 1000  # Existing rows of each kind the requests pick from
+JSON = "application/json"
+
+
+@dataclass
+class Request:
+    path: str
+    body: object = None  # Sent as JSON unless it is a str
+    content_type: str = JSON
+
+
+@dataclass
+class Scenario:
+    """
+    How to call one route (URL name and method) repeatedly.
+    `build(fixtures, index, prepared)` returns the Request for the index-th
+    call; `prepare(fixtures, count)`, for routes that use up what they act
+    on (deletes, payments), creates a disposable object per call first.
+    """
+
+    method: str
+    name: str
+    build: object
+    prepare: object = None
+
+    @property
+    def key(self):
+        return f"{self.method} {self.name}"
+
+
+SCENARIOS = {}  # "METHOD url-name" -> Scenario
+
+
+def scenario(method, name, prepare=None):
+    # Register the decorated request builder for a route
+    def register(build):
+        entry = Scenario(method, name, build, prepare)
+        SCENARIOS[entry.key] = entry
+        return build
+
+    return register
+
+
+class Fixtures:
+    """
+    Ids and values sampled from the database once before a run, so building
+    a request costs no queries. Objects created by the requests are named
+    after the run's `tag`, so runs never collide.
+    """
+
+    def __init__(self, sample_size=FIXTURE_SAMPLE_SIZE):
+        self.tag = uuid.uuid4().hex[:8]
+        self.category_ids = list(
+            Category.objects.order_by("pk").values_list("pk", flat=True)[:sample_size]
+        )
+        self.products = list(
+            Products.objects.order_by("pk").values(
+                "pk", "sku", "name", "unit_price", "category__name", "stock_quantity"
+            )[:sample_size]
+        )
+        self.sale_ids = list(
+            Sales.objects.order_by("-pk").values_list("pk", flat=True)[:sample_size]
+        )
+        # Sales that have a receipt (rendered on their first reprint if seeded)
+        self.completed_sale_ids = list(
+            Sales.objects.filter(status="completed")
+            .order_by("-pk")
+            .values_list("pk", flat=True)[:sample_size]
+        )
+        self.item_ids = list(
+            SaleItems.objects.order_by("-pk").values_list("pk", flat=True)[
+                :sample_size
+            ]
+        )
+        self.catalog_version = catalog_version()
+        self.export_from = (timezone.now() - timedelta(days=1)).isoformat()
+        if not (self.category_ids and self.products and self.sale_ids):
+            raise ValueError("Seed the database first (manage.py seed_data).")
+
+    def pick(self, values, index, offset=0):
+        # Deterministic spread over the samples
+        return values[(index * 7919 + offset) % len(values)]
+
+    def product(self, index, offset=0):
+        return self.pick(self.products, index, offset)
+
+    def cart(self, index, size=3):
+        return [
+            {"product": self.product(index, line)["pk"], "quantity": "1"}
+            for line in range(size)
+        ]
+
+
+# Disposable objects for routes that consume them
+
+
+def new_categories(fixtures, count):
+    return Category.objects.bulk_create(
+        Category(name=f"Bench {fixtures.tag} {i}") for i in range(count)
+    )
+
+
+def new_products(fixtures, count):
+    products = Products.objects.bulk_create(
+        Products(
+            name=f"Bench {fixtures.tag} {i}",
+            unit_price=Decimal("1.00"),
+            category_id=fixtures.category_ids[0],
+            sku=f"BENCH-{fixtures.tag}-{i}",
+            stock_quantity=0,
+        )
+        for i in range(count)
+    )
+    invalidate_catalog()
+    return products
+
+
+def new_sales(fixtures, count, payment_method="cash"):
+    return Sales.objects.bulk_create(
+        Sales(status="pending", payment_method=payment_method) for _ in range(count)
+    )
+
+
+def new_mobile_sales(fixtures, count):
+    return new_sales(fixtures, count, "mobile payment")
+
+
+def new_items(fixtures, count):
+    # Items of pending sales, which hold no stock and are not in the rollups
+    sales = new_sales(fixtures, count)
+    items = SaleItems.objects.bulk_create(
+        SaleItems(
+            sales=sale,
+            product_id=fixtures.product(i)["pk"],
+            quantity=1,
+            subtotal=fixtures.product(i)["unit_price"],
+        )
+        for i, sale in enumerate(sales)
+    )
+    Sales.objects.filter(pk__in=[sale.pk for sale in sales]).recompute_totals()
+    return items
+
+
+# Products
+
+
+@scenario("GET", "product-list-create")
+def list_products(fixtures, index, prepared):
+    return Request(reverse("product-list-create"))
+
+
+@scenario("POST", "product-list-create")
+def create_product(fixtures, index, prepared):
+    return Request(
+        reverse("product-list-create"),
+        {
+            "name": f"Bench product {index}",
+            "unit_price": "4.99",
+            "category": fixtures.pick(fixtures.category_ids, index),
+            "sku": f"BENCH-{fixtures.tag}-new-{index}",
+            "stock_quantity": 100,
+        },
+    )
+
+
+@scenario("GET", "product-list-update-delete")
+def get_product(fixtures, index, prepared):
+    pk = fixtures.product(index)["pk"]
+    return Request(reverse("product-list-update-delete", args=[pk]))
+
+
+@scenario("PATCH", "product-list-update-delete")
+def update_product(fixtures, index, prepared):
+    product = fixtures.product(index)
+    return Request(
+        reverse("product-list-update-delete", args=[product["pk"]]),
+        {"unit_price": str(product["unit_price"])},
+    )
+
+
+@scenario("DELETE", "product-list-update-delete", prepare=new_products)
+def delete_product(fixtures, index, prepared):
+    pk = prepared[index].pk
+    return Request(reverse("product-list-update-delete", args=[pk]))
+
+
+@scenario("GET", "product-stock")
+def product_stock(fixtures, index, prepared):
+    at = (timezone.now() - timedelta(days=index % 30)).isoformat()
+    pk = fixtures.product(index)["pk"]
+    return Request(reverse("product-stock", args=[pk]) + "?" + urlencode({"at": at}))
+
+
+@scenario("GET", "product-movements")
+def product_movements(fixtures, index, prepared):
+    pk = fixtures.product(index)["pk"]
+    return Request(reverse("product-movements", args=[pk]))
+
+
+@scenario("GET", "product-changes")
+def product_changes(fixtures, index, prepared):
+    query = f"?since={fixtures.catalog_version}"
+    return Request(reverse("product-changes") + query)
+
+
+@scenario("GET", "product-low-stock")
+def list_low_stock(fixtures, index, prepared):
+    return Request(reverse("product-low-stock"))
+
+
+@scenario("GET", "stock-alert-feed")
+def stock_alerts(fixtures, index, prepared):
+    return Request(reverse("stock-alert-feed") + "?expand=product")
+
+
+@scenario("GET", "product-search")
+def search_products(fixtures, index, prepared):
+    term = fixtures.product(index)["name"].split()[0]
+    return Request(reverse("product-search") + f"?q={term}")
+
+
+@scenario("POST", "product-import")
+def import_products(fixtures, index, prepared):
+    # Re-import 50 existing products unchanged: validation and diffing
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["sku", "name", "unit_price", "category", "stock_quantity"])
+    for line in range(50):
+        product = fixtures.product(index, line)
+        writer.writerow(
+            [
+                product["sku"],
+                product["name"],
+                product["unit_price"],
+                product["category__name"],
+                product["stock_quantity"],
+            ]
+        )
+    return Request(reverse("product-import"), output.getvalue(), "text/csv")
+
+
+@scenario("POST", "product-adjust")
+def adjust_products(fixtures, index, prepared):
+    lines = {fixtures.product(index, line)["pk"] for line in range(20)}
+    return Request(
+        reverse("product-adjust"),
+        {"adjustments": [{"product": pk, "stock_delta": 1} for pk in lines]},
+    )
+
+
+@scenario("POST", "product-sku-resolve")
+def resolve_skus(fixtures, index, prepared):
+    skus = [fixtures.product(index, line)["sku"] for line in range(50)]
+    return Request(reverse("product-sku-resolve"), {"skus": skus})
+
+
+@scenario("GET", "product-sku")
+def get_sku(fixtures, index, prepared):
+    return Request(reverse("product-sku", args=[fixtures.product(index)["sku"]]))
+
+
+@scenario("GET", "category-list-create")
+def list_categories(fixtures, index, prepared):
+    return Request(reverse("category-list-create"))
+
+
+@scenario("POST", "category-list-create")
+def create_category(fixtures, index, prepared):
+    name = f"Bench {fixtures.tag} new {index}"
+    return Request(reverse("category-list-create"), {"name": name})
+
+
+@scenario("GET", "category-list-update")
+def get_category(fixtures, index, prepared):
+    pk = fixtures.pick(fixtures.category_ids, index)
+    return Request(reverse("category-list-update", args=[pk]))
+
+
+@scenario("PUT", "category-list-update", prepare=new_categories)
+def update_category(fixtures, index, prepared):
+    category = prepared[index]
+    return Request(
+        reverse("category-list-update", args=[category.pk]),
+        {"name": category.name + " renamed"},
+    )
+
+
+@scenario("DELETE", "category-list-update", prepare=new_categories)
+def delete_category(fixtures, index, prepared):
+    return Request(reverse("category-list-update", args=[prepared[index].pk]))
+
+
+# Sales (heavy and light views have the same scenarios)
+
+
+def sale_scenarios(list_name, detail_name):
+    @scenario("GET", list_name)
+    def list_sales(fixtures, index, prepared):
+        return Request(reverse(list_name))
+
+    @scenario("POST", list_name)
+    def create_sale(fixtures, index, prepared):
+        return Request(
+            reverse(list_name), {"status": "pending", "payment_method": "cash"}
+        )
+
+    @scenario("GET", detail_name)
+    def get_sale(fixtures, index, prepared):
+        pk = fixtures.pick(fixtures.sale_ids, index)
+        return Request(reverse(detail_name, args=[pk]))
+
+    @scenario("PATCH", detail_name, prepare=new_sales)
+    def update_sale(fixtures, index, prepared):
+        return Request(
+            reverse(detail_name, args=[prepared[index].pk]),
+            {"payment_method": "mobile payment"},
+        )
+
+    @scenario("DELETE", detail_name, prepare=new_sales)
+    def delete_sale(fixtures, index, prepared):
+        return Request(reverse(detail_name, args=[prepared[index].pk]))
+
+
+def item_scenarios(list_name, detail_name):
+    @scenario("GET", list_name)
+    def list_items(fixtures, index, prepared):
+        return Request(reverse(list_name))
+
+    @scenario("POST", list_name, prepare=new_sales)
+    def create_item(fixtures, index, prepared):
+        return Request(
+            reverse(list_name),
+            {
+                "sales": prepared[index].pk,
+                "product": fixtures.product(index)["pk"],
+                "quantity": "1",
+            },
+        )
+
+    @scenario("GET", detail_name)
+    def get_item(fixtures, index, prepared):
+        pk = fixtures.pick(fixtures.item_ids, index)
+        return Request(reverse(detail_name, args=[pk]))
+
+    @scenario("PATCH", detail_name, prepare=new_items)
+    def update_item(fixtures, index, prepared):
+        pk = prepared[index].pk
+        return Request(reverse(detail_name, args=[pk]), {"quantity": "2"})
+
+    @scenario("DELETE", detail_name, prepare=new_items)
+    def delete_item(fixtures, index, prepared):
+        return Request(reverse(detail_name, args=[prepared[index].pk]))
+
+
+sale_scenarios("sales-heavy-list-create", "sales-heavy-detail")
+sale_scenarios("sales-light-list-create", "sales-light-detail")
+item_scenarios("sales-item-heavy-list-create", "sales-item-heavy-detail")
+item_scenarios("sales-item-light-list-create", "sales-item-light-detail")
+
+
+@scenario("POST", "sales-checkout")
+def checkout(fixtures, index, prepared):
+    return Request(
+        reverse("sales-checkout"),
+        {"payment_method": "cash", "items": fixtures.cart(index)},
+    )
+
+
+@scenario("POST", "sales-sync")
+def sync(fixtures, index, prepared):
+    sales = [
+        {
+            "idempotency_key": f"bench-{fixtures.tag}-{index}-{sale}",
+            "payment_method": "cash",
+            "items": fixtures.cart(index * 20 + sale),
+        }
+        for sale in range(20)
+    ]
+    return Request(reverse("sales-sync"), {"sales": sales})
+
+
+@scenario("GET", "sales-report")
+def sales_report(fixtures, index, prepared):
+    return Request(reverse("sales-report") + "?granularity=day")
+
+
+@scenario("GET", "sales-report-products")
+def product_report(fixtures, index, prepared):
+    return Request(reverse("sales-report-products") + "?granularity=day")
+
+
+@scenario("GET", "sales-report-categories")
+def category_report(fixtures, index, prepared):
+    return Request(reverse("sales-report-categories") + "?granularity=day")
+
+
+@scenario("GET", "sales-export")
+def export(fixtures, index, prepared):
+    # The last day of sales, so the cost does not grow with the history
+    query = urlencode({"date_from": fixtures.export_from})
+    return Request(reverse("sales-export", args=["csv"]) + "?" + query)
+
+
+@scenario("GET", "sales-receipt")
+def reprint_receipt(fixtures, index, prepared):
+    pk = fixtures.pick(fixtures.completed_sale_ids or fixtures.sale_ids, index)
+    return Request(reverse("sales-receipt", args=[pk, "txt"]))
+
+
+@scenario("POST", "sales-pay", prepare=new_mobile_sales)
+def pay(fixtures, index, prepared):
+    path = reverse("sales-pay", args=[prepared[index].pk])
+    return Request(path, {"phone": "233240000000"})
+
+
+@scenario("POST", "sales-payment-callback")
+def payment_callback(fixtures, index, prepared):
+    # Unknown references: the lookup and the 404, not the provider call
+    body = {"referenceId": f"bench-{fixtures.tag}-{index}"}
+    return Request(reverse("sales-payment-callback"), body)
@@ -0,0 +1,171 @@
+import random
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from products import ledger
+from products.cache import invalidate_catalog
+from products.models import Category, Products, StockMovement
+from sales.models import CENTS, Sales, SaleItems
+
+SEED_BATCH_SIZE = 2000  # Rows per bulk insert
+SKU_PREFIX = "SEED-"
+SEED_STOCK = 10**6  # Plenty, so benchmarked sales never run out
+
+# Product names are built from these, so search has realistic text to match
+ADJECTIVES = ["Fresh", "Classic", "Organic", "Premium", "Spicy", "Sweet", "Light"]
+NOUNS = ["Milk", "Bread", "Rice", "Juice", "Soap", "Biscuits", "Tea", "Noodles"]
+SIZES = ["250ml", "500ml", "1L", "100g", "500g", "1kg", "Pack of 6"]
+
+# (status, payment method, weight) of seeded sales
+SALE_MIX = [
+    ("completed", "cash", 80),
+    ("completed", "mobile payment", 14),
+    ("cancelled", "mobile payment", 3),
+    ("pending", "mobile payment", 3),
+]
+
+
+def batched(count, batch_size):
+    # (start, size) of each batch covering `count` rows
+    for start in range(0, count, batch_size):
+        yield start, min(batch_size, count - start)
+
+
+class Seeder:
+    """
+    Bulk inserts synthetic categories, products, sales and sale items for
+    load testing, in batches of `batch_size` rows, so millions of rows can
+    be generated in bounded memory. The same `seed` produces the same data.
+
+    Products get SKUs after the ones already seeded and ample stock. Sales
+    get 1 to `items_per_sale` items and dates spread over the last `days`
+    days, and do not move stock (they are history). The rollups are
+    rebuilt at the end so the reports cover the new sales.
+    """
+
+    def __init__(self, seed=None, batch_size=SEED_BATCH_SIZE, progress=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+
+    def run(self, categories=0, products=0, sales=0, items_per_sale=3, days=30):
+        category_ids = self.seed_categories(categories)
+        if not category_ids:
+            category_ids = list(Category.objects.values_list("pk", flat=True))
+        product_ids, prices = self.seed_products(products, category_ids)
+        if not product_ids:
+            for pk, price in Products.objects.values_list("pk", "unit_price"):
+                product_ids.append(pk)
+                prices.append(int(price * 100))
+        items = self.seed_sales(sales, items_per_sale, days, product_ids, prices)
+        invalidate_catalog()
+        if sales:
+            self.progress("Rebuilding sales rollups")
+            call_command("rebuild_rollups", stdout=StringIO())
+        return {
+            "categories": categories,
+            "products": products,
+            "sales": sales,
+            "items": items,
+        }
+
+    def seed_categories(self, count):
+        created = Category.objects.bulk_create(
+            Category(name=f"Category {self.random.randrange(10**6)}")
+            for _ in range(count)
+        )
+        return [category.pk for category in created]
+
+    def seed_products(self, count, category_ids):
+        # Returns the ids and prices (in cents) of the created products
+        product_ids, prices = array("q"), array("q")
+        if count and not category_ids:
+            raise ValueError("Products need at least one category.")
+        start = Products.objects.filter(sku__startswith=SKU_PREFIX).count()
+        for offset, size in batched(count, self.batch_size):
+            batch = []
+            for number in range(start + offset, start + offset + size):
+                name = " ".join(
+                    [
+                        self.random.choice(ADJECTIVES),
+                        self.random.choice(NOUNS),
+                        self.random.choice(SIZES),
+                    ]
+                )
+                batch.append(
+                    Products(
+                        name=name,
+                        unit_price=Decimal(self.random.randrange(50, 20000)) / 100,
+                        category_id=self.random.choice(category_ids),
+                        sku=f"{SKU_PREFIX}{number:08d}",
+                        stock_quantity=SEED_STOCK,
+                    )
+                )
+            created = Products.objects.bulk_create(batch)
+            for product in created:
+                product_ids.append(product.pk)
+                prices.append(int(product.unit_price * 100))
+            # The opening stock is received, so the ledger matches it
+            ledger.record(
+                {product.pk: SEED_STOCK for product in created},
+                StockMovement.RECEIPT,
+                "seed",
+            )
+            self.progress(f"{offset + size} products")
+        return product_ids, prices
+
+    def seed_sales(self, count, items_per_sale, days, product_ids, prices):
+        # Returns the number of items created
+        if count and not product_ids:
+            raise ValueError("Sales need at least one product.")
+        statuses = [(status, method) for status, method, _ in SALE_MIX]
+        weights = [weight for _, _, weight in SALE_MIX]
+        now, span = timezone.now(), timedelta(days=days).total_seconds()
+        item_count = 0
+        for offset, size in batched(count, self.batch_size):
+            sales, lines = [], []
+            for status, payment_method in self.random.choices(
+                statuses, weights, k=size
+            ):
+                sale_lines = []
+                for _ in range(self.random.randint(1, items_per_sale)):
+                    index = self.random.randrange(len(product_ids))
+                    quantity = self.random.randint(1, 5)
+                    subtotal = (Decimal(prices[index] * quantity) / 100).quantize(
+                        CENTS
+                    )
+                    sale_lines.append((product_ids[index], quantity, subtotal))
+                sales.append(
+                    Sales(
+                        status=status,
+                        payment_method=payment_method,
+                        total_amount=sum(line[2] for line in sale_lines),
+                    )
+                )
+                lines.append(sale_lines)
+            with transaction.atomic():
+                Sales.objects.bulk_create(sales)
+                # The date is set on insert; backdate with one CASE update
+                for sale in sales:
+                    sale.date = now - timedelta(seconds=self.random.random() * span)
+                Sales.objects.bulk_update(sales, ["date"])
+                items = [
+                    SaleItems(
+                        sales=sale,
+                        product_id=product_id,
+                        quantity=quantity,
+                        subtotal=subtotal,
+                    )
+                    for sale, sale_lines in zip(sales, lines)
+                    for product_id, quantity, subtotal in sale_lines
+                ]
+                SaleItems.objects.bulk_create(items, batch_size=self.batch_size)
+            item_count += len(items)
+            self.progress(f"{offset + size} sales")
+        return item_count
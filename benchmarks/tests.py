@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+
+from products.models import Category, Products
+from sales.models import Sales, SaleItems, SalesRollup
+from .runner import Benchmark, percentile, summarize, uncovered_routes
+from .scenarios import SCENARIOS
+from .seeding import Seeder
+
+
+class SeedTests(TestCase):
+    def test_seeds_consistent_data(self):
+        counts = Seeder(seed=1, batch_size=7).run(
+            categories=2, products=20, sales=30, items_per_sale=3, days=5
+        )
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Products.objects.count(), 20)
+        self.assertEqual(Sales.objects.count(), 30)
+        self.assertEqual(SaleItems.objects.count(), counts["items"])
+        self.assertTrue(30 <= counts["items"] <= 90)
+        # Totals match the items and the reports include the seeded sales
+        for sale in Sales.objects.annotate(items_total=Sum("saleitems__subtotal")):
+            self.assertEqual(sale.total_amount, sale.items_total)
+        settled = Sales.objects.filter(status__in=["completed", "cancelled"])
+        rolled_up = SalesRollup.objects.filter(granularity="day").aggregate(
+            count=Sum("sale_count")
+        )
+        self.assertEqual(rolled_up["count"], settled.count())
+        # Seeding again continues the SKU sequence
+        Seeder(seed=1).run(products=5)
+        self.assertEqual(Products.objects.values("sku").distinct().count(), 25)
+
+    def test_command_needs_products_for_sales(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "seed_data", "--categories", "0", "--products", "0", stderr=StringIO()
+            )
+
+
+class StatisticsTests(TestCase):
+    def test_percentiles_and_summary(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(percentile(ordered, 50), 50)
+        self.assertEqual(percentile(ordered, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        summary = summarize([(0.001, 200, 2), (0.003, 500, 4)], elapsed=0.5)
+        self.assertEqual(summary["throughput"], 4.0)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["latency_ms"]["p50"], 1.0)
+        self.assertEqual(summary["queries_per_request"], {"mean": 3.0, "max": 4})
+
+
+class BenchmarkTests(TransactionTestCase):
+    def setUp(self):
+        Seeder(seed=2).run(categories=2, products=60, sales=20, days=1)
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(uncovered_routes(), [])
+
+    def test_runs_every_route_without_server_errors(self):
+        results = Benchmark(requests=2, concurrency=2, warmup=1).run()
+        self.assertEqual(set(results["routes"]), set(SCENARIOS))
+        for key, summary in results["routes"].items():
+            self.assertEqual(summary["errors"], 0, key)
+            self.assertEqual(summary["requests"], 2, key)
+        self.assertEqual(
+            results["routes"]["GET product-sku"]["queries_per_request"]["max"], 0
+        )
+        self.assertEqual(results["meta"]["concurrency"], 2)
+
+    def test_command_saves_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            output = StringIO()
+            call_command(
+                "benchmark",
+                "--requests",
+                "3",
+                "--warmup",
+                "0",
+                "--route",
+                "GET product",
+                "--output",
+                path,
+                stdout=output,
+            )
+            with open(path) as results:
+                routes = json.load(results)["routes"]
+        self.assertIn("GET product-search", routes)
+        self.assertNotIn("POST product-list-create", routes)
+        self.assertIn("p99", routes["GET product-search"]["latency_ms"])
+        self.assertIn("GET product-search", output.getvalue())
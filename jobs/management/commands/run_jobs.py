@@ -0,0 +1,97 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs import queue
+from jobs.metrics import metrics_server
+
+
+class Command(BaseCommand):
+    """
+    Runs background jobs queued in the database (see jobs/queue.py) on a
+    pool of worker threads, each with its own database connection, until
+    interrupted (Ctrl+C or SIGTERM, which let running batches finish).
+    Run several processes for more throughput; they never run the same
+    job at once. With --once, runs the due jobs and exits (for cron).
+    """
+
+    help = "Run the background job workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.JOBS["WORKERS"],
+            help=f"Worker threads (default: {settings.JOBS['WORKERS']}).",
+        )
+        parser.add_argument(
+            "--kind",
+            action="append",
+            dest="kinds",
+            help="Only run jobs of this kind (repeatable; default: all).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Most jobs per batch (default: each handler's batch size).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOBS["POLL_INTERVAL"],
+            help="Seconds a worker waits when no job is due "
+            f"(default: {settings.JOBS['POLL_INTERVAL']}).",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the jobs that are due, then exit.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Serve this process's job metrics for Prometheus on this port "
+            "(needs PERFORMANCE_METRICS=1 and scrapers sending METRICS_TOKEN).",
+        )
+        parser.add_argument(
+            "--metrics-host",
+            default="127.0.0.1",
+            help="Address the metrics server listens on (default: 127.0.0.1).",
+        )
+
+    def handle(self, *args, **options):
+        kinds, batch_size = options["kinds"], options["batch_size"]
+        if options["once"]:
+            queue.requeue_stale()
+            ran = queue.drain(kinds, batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs."))
+            return
+        if options["metrics_port"]:
+            server = metrics_server(options["metrics_host"], options["metrics_port"])
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        workers = [
+            threading.Thread(
+                target=queue.work,
+                args=(stop, kinds, batch_size, options["poll_interval"]),
+                name=f"jobs-{index}",
+            )
+            for index in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Running jobs on {len(workers)} workers.")
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(1)  # A timeout, so Ctrl+C is handled
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        self.stdout.write("Workers stopped.")
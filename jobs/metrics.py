@@ -0,0 +1,121 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db import connection
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from retail_software.metrics import (
+    DURATION_BUCKETS,
+    PROMETHEUS_CONTENT_TYPE,
+    Counter,
+    Gauge,
+    Histogram,
+    has_metrics_token,
+    metrics_enabled,
+    registry,
+)
+
+from .models import Job
+
+# Upper bounds (seconds) of the buckets of the time jobs wait for a worker
+WAIT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def queue_depth():
+    # (kind, status) -> number of jobs, read when the metrics are scraped
+    rows = (
+        Job.objects.order_by()
+        .values("kind", "status")
+        .annotate(count=Count("pk"))
+        .values_list("kind", "status", "count")
+    )
+    return {(kind, status): count for kind, status, count in rows}
+
+
+def oldest_due():
+    # (kind,) -> seconds the longest waiting due job has been waiting
+    now = timezone.now()
+    rows = (
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by()
+        .values("kind")
+        .annotate(oldest=Min("run_at"))
+        .values_list("kind", "oldest")
+    )
+    return {(kind,): (now - oldest).total_seconds() for kind, oldest in rows}
+
+
+# Read from the database, so every process serving /metrics reports them
+jobs_queued = registry.register(
+    Gauge(
+        "jobs_queued",
+        "Jobs in the queue, by kind and status (failed jobs stay until deleted).",
+        ("kind", "status"),
+        queue_depth,
+    )
+)
+jobs_oldest_due = registry.register(
+    Gauge(
+        "jobs_oldest_due_seconds",
+        "Time the longest waiting due job of each kind has been waiting.",
+        ("kind",),
+        oldest_due,
+    )
+)
+
+# Recorded by the worker processes (manage.py run_jobs --metrics-port)
+jobs_processed = registry.register(
+    Counter(
+        "jobs_processed_total",
+        "Jobs run, by kind and outcome (done, retried or failed).",
+        ("kind", "outcome"),
+    )
+)
+job_wait = registry.register(
+    Histogram(
+        "job_wait_seconds",
+        "Time from a job falling due to a worker starting it.",
+        ("kind",),
+        WAIT_BUCKETS,
+    )
+)
+job_duration = registry.register(
+    Histogram(
+        "job_batch_seconds",
+        "Time spent running a batch of jobs.",
+        ("kind",),
+        DURATION_BUCKETS,
+    )
+)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    # Serves the process's metrics in the Prometheus text format at any path,
+    # under the same rules as /metrics: not found when the metrics are
+    # disabled, forbidden without the metrics token (there are no staff
+    # sessions here)
+
+    def do_GET(self):
+        if not metrics_enabled():
+            self.send_error(404)
+            return
+        if not has_metrics_token(self.headers.get("Authorization", "")):
+            self.send_error(403)
+            return
+        try:
+            body = registry.render().encode()
+        finally:
+            connection.close()  # Each request runs on its own thread
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a log line each
+
+
+def metrics_server(host, port):
+    # An HTTP server for the metrics of a worker process (not started)
+    return ThreadingHTTPServer((host, port), MetricsHandler)
@@ -0,0 +1,49 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A unit of background work: `payload` for the handler registered under
+    `kind` (see jobs/queue.py). Jobs are written in the transaction whose
+    changes they follow up on, so workers see them once it commits. A job
+    is deleted once it ran; failed jobs are kept for inspection.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=100)  # Name of the handler that runs it
+    payload = models.JSONField(default=dict)  # Arguments for the handler
+    status = models.CharField(
+        choices=STATUS_CHOICES, max_length=10, default=QUEUED
+    )  # Queued until a worker claims it, failed once out of attempts
+    attempts = models.PositiveIntegerField(default=0)  # Runs started so far
+    run_at = models.DateTimeField(
+        default=timezone.now
+    )  # When it is due (pushed back after a failed attempt)
+    created_at = models.DateTimeField(default=timezone.now)  # When it was queued
+    started_at = models.DateTimeField(
+        null=True, blank=True
+    )  # When its current or last run started
+    worker = models.CharField(
+        max_length=100, blank=True
+    )  # Worker thread that claimed it last
+    last_error = models.TextField(blank=True)  # Traceback of the last failure
+
+    class Meta:
+        indexes = [
+            # The next due job of any kind, then a batch of that kind
+            models.Index(fields=["status", "run_at"], name="job_due"),
+            models.Index(fields=["status", "kind", "run_at"], name="job_due_kind"),
+        ]
+
+    def __str__(self):
+        # Returns a short description for display in admin and logs
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,278 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_BATCH_SIZE = 500  # Jobs written per INSERT
+
+HANDLERS = {}  # Job kind -> Handler
+
+
+@dataclass
+class Handler:
+    """
+    A registered job handler: `function` is called with a list of at most
+    `batch_size` payloads of jobs of `kind`.
+    """
+
+    kind: str
+    function: object
+    batch_size: int = 1
+    max_attempts: int = None  # None: settings.JOBS["MAX_ATTEMPTS"]
+
+    def attempts(self):
+        return self.max_attempts or settings.JOBS["MAX_ATTEMPTS"]
+
+
+def handler(kind, batch_size=1, max_attempts=None):
+    """
+    Register the decorated function as the handler of the jobs of `kind`.
+    It is called with a list of up to `batch_size` payloads of due jobs of
+    that kind, so like jobs are handled together (one query for many rows
+    rather than one per job). A job can run more than once, e.g. when a
+    worker stops after running it and before deleting it, so handlers must
+    be idempotent. Register handlers in modules imported at startup (e.g.
+    by the app's models), so that every worker knows them.
+    """
+
+    def register(function):
+        HANDLERS[kind] = Handler(kind, function, batch_size, max_attempts)
+        return function
+
+    return register
+
+
+def enqueue(kind, payloads, delay=None):
+    """
+    Queue a job of `kind` per payload (a JSON serializable dict), in one
+    INSERT, due after `delay` (a timedelta) or now. Call it in the
+    transaction whose changes the jobs follow up on: they are committed or
+    rolled back with it, and workers only see them after the commit.
+
+    With settings.JOBS["EAGER"] the handler runs in this process right
+    after the commit instead, and no job is stored (tests, development).
+    """
+    payloads = list(payloads)
+    if not payloads:
+        return
+    if kind not in HANDLERS:
+        raise ValueError(f"No handler is registered for {kind!r} jobs.")
+    if settings.JOBS["EAGER"]:
+        transaction.on_commit(lambda: run_eagerly(HANDLERS[kind], payloads))
+        return
+    now = timezone.now()
+    run_at = now + delay if delay else now
+    Job.objects.bulk_create(
+        [
+            Job(kind=kind, payload=payload, run_at=run_at, created_at=now)
+            for payload in payloads
+        ],
+        batch_size=ENQUEUE_BATCH_SIZE,
+    )
+
+
+def run_eagerly(handler, payloads):
+    # Run the handler in batches in this process; errors propagate
+    for start in range(0, len(payloads), handler.batch_size):
+        handler.function(payloads[start : start + handler.batch_size])
+
+
+def worker_name():
+    # Identifies the thread that claims a batch, in the jobs it claims
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:100]
+
+
+def claim(kinds=None, batch_size=None):
+    """
+    Take the due jobs of one kind, that of the job due first, up to the
+    handler's batch size (and `batch_size`), and mark them running.
+    Only kinds with a registered handler are claimed, and of those only
+    `kinds` when given. Returns (handler, jobs), or (None, []) when no job
+    is due. On PostgreSQL, concurrent workers skip the rows another one is
+    claiming (SKIP LOCKED); on SQLite the claim's write transaction
+    serializes them.
+    """
+    kinds = [kind for kind in kinds or HANDLERS if kind in HANDLERS]
+    now = timezone.now()
+    name = worker_name()
+    with transaction.atomic():
+        due = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now, kind__in=kinds)
+            .order_by("run_at", "pk")
+        )
+        kind = due.values_list("kind", flat=True).first()
+        if kind is None:
+            return None, []
+        handler = HANDLERS[kind]
+        size = min(handler.batch_size, batch_size or handler.batch_size)
+        jobs = list(due.filter(kind=kind).only("payload", "run_at", "attempts")[:size])
+        ids = [job.pk for job in jobs]
+        claimed = Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            attempts=F("attempts") + 1,
+            started_at=now,
+            worker=name,
+        )
+        if claimed != len(ids):
+            # Another worker claimed some of them first (SQLite without
+            # IMMEDIATE transactions): keep only ours
+            ours = set(
+                Job.objects.filter(
+                    pk__in=ids, status=Job.RUNNING, worker=name, started_at=now
+                ).values_list("pk", flat=True)
+            )
+            jobs = [job for job in jobs if job.pk in ours]
+    for job in jobs:
+        job.attempts += 1
+        job.started_at = now
+    return handler, jobs
+
+
+def isolate(handler, jobs):
+    """
+    Run the jobs of a failed batch one at a time, so that a job that
+    always fails does not hold back the others of its batch.
+    Returns the tracebacks of the ones that failed, by job id.
+    """
+    errors = {}
+    for job in jobs:
+        try:
+            handler.function([job.payload])
+        except Exception:
+            errors[job.pk] = traceback.format_exc()
+    return errors
+
+
+def backoff(attempts):
+    # RETRY_DELAY seconds after the first attempt, doubled after each other
+    delay = settings.JOBS["RETRY_DELAY"] * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.JOBS["MAX_RETRY_DELAY"]))
+
+
+def retry(handler, jobs, errors):
+    """
+    Queue failed jobs again after their backoff, or mark them failed once
+    they have used up the handler's attempts. One UPDATE for the batch.
+    """
+    now = timezone.now()
+    for job in jobs:
+        job.last_error = errors[job.pk]
+        if job.attempts >= handler.attempts():
+            job.status = Job.FAILED
+            logger.error(
+                "%s job %s failed after %s attempts:\n%s",
+                handler.kind,
+                job.pk,
+                job.attempts,
+                job.last_error,
+            )
+        else:
+            job.status = Job.QUEUED
+            job.run_at = now + backoff(job.attempts)
+            logger.warning(
+                "%s job %s failed, retrying at %s", handler.kind, job.pk, job.run_at
+            )
+        outcome = "failed" if job.status == Job.FAILED else "retried"
+        metrics.jobs_processed.inc((handler.kind, outcome))
+    Job.objects.bulk_update(jobs, ["status", "run_at", "last_error"])
+
+
+def run_once(kinds=None, batch_size=None):
+    """
+    Claim a batch of due jobs and run it: the jobs that succeed are
+    deleted, the others retried or failed. A failing batch of several jobs
+    is run again one job at a time to tell the failing ones apart.
+    Returns the number of jobs run, 0 when none was due.
+    """
+    handler, jobs = claim(kinds, batch_size)
+    if not jobs:
+        return 0
+    labels = (handler.kind,)
+    for job in jobs:
+        metrics.job_wait.observe(
+            labels, max((job.started_at - job.run_at).total_seconds(), 0)
+        )
+    started = time.perf_counter()
+    try:
+        handler.function([job.payload for job in jobs])
+        errors = {}
+    except Exception:
+        if len(jobs) == 1:
+            errors = {jobs[0].pk: traceback.format_exc()}
+        else:
+            errors = isolate(handler, jobs)
+    metrics.job_duration.observe(labels, time.perf_counter() - started)
+    done = [job.pk for job in jobs if job.pk not in errors]
+    Job.objects.filter(pk__in=done).delete()
+    metrics.jobs_processed.inc(labels + ("done",), len(done))
+    if errors:
+        retry(handler, [job for job in jobs if job.pk in errors], errors)
+    return len(jobs)
+
+
+def drain(kinds=None, batch_size=None):
+    # Run batches until no job is due; returns the number of jobs run
+    total = 0
+    while ran := run_once(kinds, batch_size):
+        total += ran
+    return total
+
+
+def requeue_stale():
+    """
+    Recover the jobs of workers that stopped mid-batch: jobs running for
+    longer than settings.JOBS["LEASE"] seconds are queued again, or marked
+    failed when they have used up their attempts (e.g. a job that kills
+    its worker). Returns the number of jobs recovered.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        started_at__lt=now - timedelta(seconds=settings.JOBS["LEASE"]),
+    )
+    recovered = 0
+    for kind, handler in HANDLERS.items():
+        recovered += stale.filter(kind=kind, attempts__gte=handler.attempts()).update(
+            status=Job.FAILED, last_error="The worker running it stopped."
+        )
+    return recovered + stale.update(status=Job.QUEUED, run_at=now)
+
+
+def work(stop, kinds=None, batch_size=None, poll_interval=None):
+    """
+    Run batches of jobs until `stop` (a threading.Event) is set, waiting
+    `poll_interval` seconds (default: settings.JOBS["POLL_INTERVAL"])
+    whenever none is due, and recovering stale jobs every LEASE seconds.
+    Runs on its own database connection, closed when it returns.
+    """
+    poll_interval = poll_interval or settings.JOBS["POLL_INTERVAL"]
+    next_recovery = time.monotonic()
+    try:
+        while not stop.is_set():
+            try:
+                if time.monotonic() >= next_recovery:
+                    requeue_stale()
+                    next_recovery = time.monotonic() + settings.JOBS["LEASE"]
+                if not run_once(kinds, batch_size):
+                    stop.wait(poll_interval)
+            except Exception:
+                # E.g. the database is unreachable: keep polling
+                logger.exception("Job worker error")
+                stop.wait(poll_interval)
+    finally:
+        connection.close()
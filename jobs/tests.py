@@ -0,0 +1,206 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from retail_software.metrics import registry
+from . import queue
+from .metrics import metrics_server
+from .models import Job
+
+calls = []  # Payload lists the test handlers were called with
+calls_lock = threading.Lock()
+
+
+@queue.handler("tests.record", batch_size=2)
+def record(payloads):
+    with calls_lock:
+        calls.append([payload["n"] for payload in payloads])
+
+
+@queue.handler("tests.other", batch_size=10)
+def other(payloads):
+    calls.append(["other"] * len(payloads))
+
+
+@queue.handler("tests.fragile", batch_size=10, max_attempts=2)
+def fragile(payloads):
+    if any(payload.get("fail") for payload in payloads):
+        raise RuntimeError("Broken payload")
+    calls.append([payload["n"] for payload in payloads])
+
+
+def payloads(*numbers, **extra):
+    return [dict(extra, n=n) for n in numbers]
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_are_written_with_the_transaction(self):
+        queue.enqueue("tests.record", payloads(1, 2))
+        self.assertEqual(Job.objects.count(), 2)
+        try:
+            with transaction.atomic():
+                queue.enqueue("tests.record", payloads(3))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(Job.objects.count(), 2)
+        with self.assertRaises(ValueError):
+            queue.enqueue("tests.unknown", payloads(1))
+
+    def test_like_jobs_run_in_batches(self):
+        queue.enqueue("tests.record", payloads(1, 2, 3))
+        queue.enqueue("tests.other", payloads(4, 5))
+        queue.enqueue("tests.record", payloads(6), delay=timedelta(hours=1))
+        # Claim (3 queries in a savepoint here), run, then delete the batch
+        with self.assertNumQueries(6):
+            self.assertEqual(queue.run_once(), 2)
+        self.assertEqual(queue.drain(), 3)
+        # Batches of each kind, the kind due first first; the delayed job waits
+        self.assertEqual(calls, [[1, 2], [3], ["other", "other"]])
+        self.assertEqual(
+            list(Job.objects.values_list("payload", flat=True)), [{"n": 6}]
+        )
+        calls.clear()
+        queue.enqueue("tests.record", payloads(7, 8))
+        self.assertEqual(queue.drain(kinds=["tests.other"]), 0)
+        self.assertEqual(queue.drain(batch_size=1), 2)
+        self.assertEqual(calls, [[7], [8]])
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        queue.enqueue("tests.fragile", payloads(1, 3) + payloads(2, fail=True))
+        started = timezone.now()
+        with self.assertLogs("jobs.queue", "WARNING"):
+            self.assertEqual(queue.run_once(), 3)
+        # The batch failed, then ran one job at a time: only the broken one failed
+        self.assertEqual(calls, [[1], [3]])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("RuntimeError: Broken payload", job.last_error)
+        delay = timedelta(seconds=settings.JOBS["RETRY_DELAY"])
+        self.assertGreaterEqual(job.run_at, started + delay)
+        self.assertEqual(queue.run_once(), 0)  # Not due yet
+        Job.objects.update(run_at=started)
+        with self.assertLogs("jobs.queue", "ERROR"):
+            self.assertEqual(queue.run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        Job.objects.update(run_at=started)
+        self.assertEqual(queue.run_once(), 0)  # Failed jobs are not run again
+
+    @override_settings(JOBS=dict(settings.JOBS, RETRY_DELAY=2, MAX_RETRY_DELAY=10))
+    def test_backoff_doubles_up_to_the_maximum(self):
+        self.assertEqual(
+            [queue.backoff(attempts).total_seconds() for attempts in range(1, 6)],
+            [2, 4, 8, 10, 10],
+        )
+
+    def test_stale_jobs_are_requeued(self):
+        queue.enqueue("tests.record", payloads(1))
+        queue.enqueue("tests.fragile", payloads(2))
+        long_ago = timezone.now() - timedelta(seconds=settings.JOBS["LEASE"] + 1)
+        Job.objects.update(status=Job.RUNNING, started_at=long_ago, attempts=1)
+        Job.objects.filter(kind="tests.fragile").update(attempts=2)
+        self.assertEqual(queue.requeue_stale(), 2)
+        self.assertEqual(
+            dict(Job.objects.values_list("kind", "status")),
+            {"tests.record": Job.QUEUED, "tests.fragile": Job.FAILED},
+        )
+        self.assertEqual(queue.drain(), 1)
+        self.assertEqual(calls, [[1]])
+
+    @override_settings(JOBS=dict(settings.JOBS, EAGER=True))
+    def test_eager_jobs_run_after_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            queue.enqueue("tests.record", payloads(1, 2, 3))
+        self.assertEqual(calls, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(calls, [[1, 2], [3]])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(PERFORMANCE_METRICS={"ENABLED": True, "TOKEN": "token"})
+    def test_metrics(self):
+        registry.clear()
+        queue.enqueue("tests.record", payloads(1, 2, 3))
+        queue.enqueue("tests.fragile", payloads(4, fail=True))
+        with self.assertLogs("jobs.queue", "WARNING"):
+            queue.drain()
+        queue.enqueue("tests.other", payloads(5), delay=timedelta(minutes=-1))
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer token"
+        )
+        body = response.content.decode()
+        self.assertIn('jobs_queued{kind="tests.fragile",status="queued"} 1', body)
+        self.assertIn('jobs_queued{kind="tests.other",status="queued"} 1', body)
+        self.assertIn('jobs_oldest_due_seconds{kind="tests.other"} 6', body)
+        self.assertIn(
+            'jobs_processed_total{kind="tests.record",outcome="done"} 3', body
+        )
+        self.assertIn(
+            'jobs_processed_total{kind="tests.fragile",outcome="retried"} 1', body
+        )
+        self.assertIn('job_wait_seconds_count{kind="tests.record"} 3', body)
+        self.assertIn('job_batch_seconds_count{kind="tests.record"} 2', body)
+
+    @override_settings(PERFORMANCE_METRICS={"ENABLED": True, "TOKEN": "token"})
+    def test_worker_metrics_server_needs_the_token(self):
+        server = metrics_server("127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+
+        def status(**headers):
+            try:
+                with urlopen(Request(url, headers=headers), timeout=5) as response:
+                    return response.status
+            except HTTPError as error:
+                return error.code
+
+        self.assertEqual(status(), 403)
+        self.assertEqual(status(Authorization="Bearer wrong"), 403)
+        self.assertEqual(status(Authorization="Bearer token"), 200)
+        with override_settings(PERFORMANCE_METRICS={"ENABLED": False}):
+            self.assertEqual(status(Authorization="Bearer token"), 404)
+
+    def test_command_runs_due_jobs_once(self):
+        queue.enqueue("tests.record", payloads(1, 2, 3))
+        output = StringIO()
+        call_command("run_jobs", "--once", "--kind", "tests.record", stdout=output)
+        self.assertIn("Ran 3 jobs.", output.getvalue())
+        self.assertFalse(Job.objects.exists())
+
+
+class ParallelWorkerTests(TransactionTestCase):
+    def test_workers_never_run_a_job_twice(self):
+        calls.clear()
+        queue.enqueue("tests.record", payloads(*range(40)))
+        stop = threading.Event()
+        workers = [
+            threading.Thread(
+                target=queue.work, args=(stop, ["tests.record"], None, 0.01)
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        deadline = timezone.now() + timedelta(seconds=30)
+        while Job.objects.exists() and timezone.now() < deadline:
+            stop.wait(0.05)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(sorted(n for batch in calls for n in batch), list(range(40)))
+        self.assertFalse(Job.objects.exists())
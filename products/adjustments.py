@@ -0,0 +1,150 @@
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Value, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import ledger
+from .cache import invalidate_catalog
+from .models import Products, StockMovement
+
+
+class NegativeStock(APIException):
+    """
+    Raised when a stock delta would take a product's stock below zero.
+    `shortages` maps each offending product id to its current stock.
+    The whole batch is rolled back.
+    """
+
+    status_code = status.HTTP_409_CONFLICT
+    default_code = "negative_stock"
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(
+            {
+                "detail": "The adjustment would take stock below zero.",
+                "products": shortages,
+            }
+        )
+
+
+def resolve_lines(lines):
+    """
+    Map every line to its product id with a single query. Raises a
+    ValidationError (400) listing, by line index, the products that do not
+    exist and those adjusted more than once.
+    """
+    ids = {line["product"] for line in lines if "product" in line}
+    skus = {line["sku"] for line in lines if "sku" in line}
+    by_id, by_sku = set(), {}
+    rows = Products.objects.filter(Q(pk__in=ids) | Q(sku__in=skus)).values_list(
+        "pk", "sku"
+    )
+    for pk, sku in rows:
+        by_id.add(pk)
+        by_sku[sku] = pk
+    adjustments, errors = {}, {}
+    for index, line in enumerate(lines):
+        pk = line["product"] if "product" in line else by_sku.get(line["sku"])
+        if pk is None or pk not in by_id:
+            errors[index] = ["Product not found."]
+        elif pk in adjustments:
+            errors[index] = ["Product is adjusted more than once."]
+        else:
+            adjustments[pk] = line
+    if errors:
+        raise ValidationError({"adjustments": errors})
+    return adjustments
+
+
+def adjust_products(lines):
+    """
+    Apply a batch of price, stock and reorder level adjustments in one
+    transaction.
+    Every change is written by a single UPDATE with per-product CASE
+    expressions: prices and absolute stock levels are set, and deltas are
+    applied to the stored stock in the database (F expressions), so
+    concurrent sales are never overwritten. The UPDATE only matches rows
+    whose stock stays at or above zero; if any row did not match, nothing
+    is applied and NegativeStock lists the products that fell short.
+    Stock changes are appended to the ledger in the same transaction:
+    positive deltas as receipts, the rest as adjustments.
+    The catalog version is bumped once for the whole batch.
+    Returns the ids of the adjusted products.
+    """
+    adjustments = resolve_lines(lines)
+    prices, deltas, levels, reorder_levels = [], [], [], []
+    absolute = {}  # Product id -> stock level set by the batch
+    for pk, line in adjustments.items():
+        if "unit_price" in line:
+            prices.append(When(pk=pk, then=Value(line["unit_price"])))
+        if "stock_delta" in line:
+            deltas.append((pk, line["stock_delta"]))
+            levels.append(When(pk=pk, then=F("stock_quantity") + line["stock_delta"]))
+        elif "stock_quantity" in line:
+            levels.append(When(pk=pk, then=Value(line["stock_quantity"])))
+            absolute[pk] = line["stock_quantity"]
+        if "reorder_level" in line:
+            reorder_levels.append(When(pk=pk, then=Value(line["reorder_level"])))
+    changes = {"updated_at": timezone.now()}
+    if prices:
+        changes["unit_price"] = Case(
+            *prices,
+            default=F("unit_price"),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    if levels:
+        changes["stock_quantity"] = Case(
+            *levels, default=F("stock_quantity"), output_field=IntegerField()
+        )
+    if reorder_levels:
+        changes["reorder_level"] = Case(
+            *reorder_levels, default=F("reorder_level"), output_field=IntegerField()
+        )
+    # Rows with a delta must hold at least -delta; other rows always match
+    minimum = Case(
+        *(When(pk=pk, then=Value(-delta)) for pk, delta in deltas),
+        default=F("stock_quantity"),
+        output_field=IntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            stored = {}
+            if absolute:
+                # The ledger records absolute levels as a change from the stored stock
+                stored = dict(
+                    Products.objects.select_for_update()
+                    .filter(pk__in=absolute)
+                    .values_list("pk", "stock_quantity")
+                )
+            updated = Products.objects.filter(
+                pk__in=adjustments, stock_quantity__gte=minimum
+            ).update(**changes)
+            if updated != len(adjustments):
+                raise NegativeStock({})
+            ledger.write(
+                ledger.movements(
+                    {pk: delta for pk, delta in deltas if delta > 0},
+                    StockMovement.RECEIPT,
+                    "adjust",
+                )
+                + ledger.movements(
+                    {pk: delta for pk, delta in deltas if delta < 0}
+                    | {pk: level - stored[pk] for pk, level in absolute.items()},
+                    StockMovement.ADJUSTMENT,
+                    "adjust",
+                )
+            )
+            invalidate_catalog()
+    except NegativeStock:
+        # Only reached on failure: report which products fell short
+        stock = dict(
+            Products.objects.filter(pk__in=dict(deltas)).values_list(
+                "pk", "stock_quantity"
+            )
+        )
+        raise NegativeStock(
+            {pk: stock[pk] for pk, delta in deltas if stock[pk] + delta < 0}
+        )
+    return list(adjustments)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Connect the catalog cache, search index and stock alert signals
+        from django.db.models.signals import post_migrate
+        from . import signals
+
+        post_migrate.connect(signals.ensure_search_index, sender=self)
+        post_migrate.connect(signals.ensure_stock_alerts, sender=self)
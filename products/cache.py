@@ -0,0 +1,193 @@
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Products
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_DELETED_KEY = "catalog:deleted"  # Version of the last product deletion
+CATALOG_CACHE_TIMEOUT = 60 * 60  # Seconds a rendered catalog page is kept
+STOCK_VERSION_KEY = "catalog:stock_version"  # Version of the stock levels served
+STOCK_CHANGED_KEY = "catalog:stock_changed"  # Time (ms) of the last stock change
+# Seconds cached pages may show stock levels from before a sale, so a busy
+# till starts a new stock version at most this often instead of per sale
+STOCK_STALENESS = 5
+DELETIONS_KEY = "catalog:deletions"  # Number of product deletions logged
+DELETION_KEY = "catalog:deletion:{}"  # Id of the product deleted n-th
+DELETION_TIMEOUT = 24 * 60 * 60  # Seconds a logged deletion is kept
+# Above this many deletions, reloading a copy of the catalog is cheaper
+DELETIONS_LIMIT = 1000
+# Changes are looked up from slightly before a version, so products saved in
+# a transaction that committed after the version was read are not missed.
+CHANGES_OVERLAP = timedelta(seconds=60)
+
+
+def now_version():
+    # Versions are millisecond timestamps so they can be compared with updated_at
+    return int(time.time() * 1000)
+
+
+def catalog_version():
+    """
+    Return the current catalog version, starting a new one if the cache
+    has none yet (first request, restart or eviction).
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, now_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def next_version():
+    # Above both the catalog and the stock version, so stock_version() grows
+    current = cache.get_many([CATALOG_VERSION_KEY, STOCK_VERSION_KEY]).values()
+    return max(now_version(), max(current, default=0) + 1)
+
+
+def bump_catalog_version(deleted=False):
+    """
+    Start a new catalog version, invalidating every cached catalog response.
+    The new version is never lower than the previous one.
+    """
+    version = next_version()
+    cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+    if deleted:
+        cache.set(CATALOG_DELETED_KEY, version, timeout=None)
+    return version
+
+
+def invalidate_catalog(deleted=False):
+    """
+    Bump the catalog version once the current transaction commits, so a
+    reader can never cache data from before the change under the new version.
+    """
+    transaction.on_commit(lambda: bump_catalog_version(deleted=deleted))
+
+
+def invalidate_stock():
+    """
+    Record a change of stock levels (e.g. a sale) once the current
+    transaction commits. Unlike other product writes it does not start a
+    new catalog version: see stock_version().
+    """
+    transaction.on_commit(
+        lambda: cache.set(STOCK_CHANGED_KEY, now_version(), timeout=None)
+    )
+
+
+def stock_version():
+    """
+    Return the version of the catalog including stock levels, for the
+    responses that show them. It moves with the catalog version, and after
+    stock changes, but at most once every STOCK_STALENESS seconds: such
+    responses stay cached through a run of sales and show stock levels at
+    most that old. Catalog responses without stock levels never follow it.
+    """
+    version = catalog_version()
+    values = cache.get_many([STOCK_VERSION_KEY, STOCK_CHANGED_KEY])
+    stock = max(version, values.get(STOCK_VERSION_KEY, 0))
+    changed = values.get(STOCK_CHANGED_KEY, 0)
+    if changed >= stock and now_version() - stock >= STOCK_STALENESS * 1000:
+        stock = next_version()
+        cache.set(STOCK_VERSION_KEY, stock, timeout=None)
+    return stock
+
+
+def log_deletion(product_id):
+    """
+    Log a product deletion once the current transaction commits, so that
+    in-process copies of the catalog (the SKU index) can drop just that
+    product. Call it before invalidate_catalog(), so the deletion is logged
+    by the time the new catalog version is seen.
+    """
+
+    def log():
+        cache.add(DELETIONS_KEY, 0, timeout=None)
+        number = cache.incr(DELETIONS_KEY)
+        cache.set(DELETION_KEY.format(number), product_id, DELETION_TIMEOUT)
+
+    transaction.on_commit(log)
+
+
+def deletion_count():
+    return cache.get(DELETIONS_KEY, 0)
+
+
+def deleted_since(count):
+    """
+    Return (product ids, count): the ids of the products deleted after the
+    first `count` logged deletions, and the number logged so far. The ids
+    are None when some deletions are no longer known (cache evicted or
+    cleared) or there are more than DELETIONS_LIMIT of them: the caller
+    must reload instead.
+    """
+    current = deletion_count()
+    if current < count or current - count > DELETIONS_LIMIT:
+        return None, current
+    keys = [DELETION_KEY.format(number) for number in range(count + 1, current + 1)]
+    deleted = cache.get_many(keys)
+    if len(deleted) != len(keys):
+        return None, current
+    return list(deleted.values()), current
+
+
+def last_deletion_version():
+    return cache.get(CATALOG_DELETED_KEY)
+
+
+def changes_since(since, limit=None):
+    """
+    Return (products, full_refresh) for catalog version `since`: the products
+    updated after it, oldest change first, and whether the caller must reload
+    the whole catalog instead (products were deleted, or more than `limit`
+    changed, in which case the list is truncated).
+    """
+    changed_after = datetime.fromtimestamp(since / 1000, tz=timezone.utc)
+    changed = Products.objects.filter(updated_at__gt=changed_after - CHANGES_OVERLAP)
+    changed = changed.order_by("updated_at", "id")
+    products = list(changed if limit is None else changed[: limit + 1])
+    deleted = last_deletion_version()
+    full_refresh = (limit is not None and len(products) > limit) or (
+        deleted is not None and deleted > since
+    )
+    return products, full_refresh
+
+
+def catalog_cached(get=None, *, stock=False):
+    """
+    Decorator for catalog GET handlers.
+    Responses carry the catalog version as their ETag; a request whose
+    If-None-Match matches gets an empty 304. Otherwise the response data is
+    served from the cache, keyed by version and full path, and only built
+    (queried and serialized) on a miss.
+    Handlers whose data includes stock levels are decorated with
+    `stock=True` and use stock_version() instead, so sales do not throw
+    away every cached page as they happen.
+    """
+    if get is None:
+        return lambda get: catalog_cached(get, stock=stock)
+
+    @wraps(get)
+    def wrapper(view, request, *args, **kwargs):
+        version = stock_version() if stock else catalog_version()
+        etag = f'"{version}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        key = f"catalog:{version}:{request.get_full_path()}"
+        data = cache.get(key)
+        if data is None:
+            response = get(view, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+        return Response(data, headers={"ETag": etag})
+
+    return wrapper
@@ -0,0 +1,277 @@
+import codecs
+import csv
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import ledger
+from .cache import invalidate_catalog
+from .models import Category, Products, StockMovement
+from .serializers import ProductImportSerializer
+
+IMPORT_FORMATS = ("csv", "json")
+IMPORT_BATCH_SIZE = 2000  # Rows validated and upserted together
+MAX_REPORTED_ERRORS = 1000  # Errors listed in a report; all are counted
+READ_SIZE = 64 * 1024  # Characters read from a JSON stream at a time
+UPSERT_FIELDS = ["name", "unit_price", "category", "stock_quantity"]
+
+
+class ImportFormatError(Exception):
+    """
+    Raised when the input file cannot be parsed at all (as opposed to
+    individual rows being invalid, which are reported per row).
+    """
+
+
+def text_stream(stream):
+    # Decode a binary stream lazily, dropping a UTF-8 byte order mark
+    return codecs.getreader("utf-8-sig")(stream)
+
+
+def iter_csv(stream):
+    # Rows of a CSV file with a header line, as dicts
+    yield from csv.DictReader(text_stream(stream))
+
+
+def iter_json(stream):
+    """
+    Yield the elements of a top-level JSON array one at a time, decoding the
+    stream incrementally so the whole document is never held in memory.
+    """
+    reader, decoder = text_stream(stream), json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def skip_whitespace():
+        nonlocal position
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+
+    def fill():
+        # Read more input, dropping what has been consumed; False at the end
+        nonlocal buffer, position, eof
+        chunk = reader.read(READ_SIZE)
+        buffer, position = buffer[position:] + chunk, 0
+        eof = not chunk
+        return not eof
+
+    def next_char():
+        skip_whitespace()
+        while position >= len(buffer) and fill():
+            skip_whitespace()
+        return buffer[position] if position < len(buffer) else ""
+
+    if next_char() != "[":
+        raise ImportFormatError("Expected a JSON array of products.")
+    position += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            # A value may be cut off at the end of the buffer: read more, retry
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError as exc:
+                if eof:
+                    raise ImportFormatError(f"Invalid JSON: {exc}")
+            fill()
+        position = end
+        yield element
+        separator = next_char()
+        position += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ImportFormatError("Invalid JSON: expected ',' or ']'.")
+
+
+def iter_rows(stream, import_format):
+    if import_format == "csv":
+        return iter_csv(stream)
+    return iter_json(stream)
+
+
+def batches(rows, size):
+    # Group rows into lists of `size`, numbering rows from 1
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        batch.append((number, row))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ProductImporter:
+    """
+    Upserts products by SKU from an iterable of row dicts.
+
+    Rows are validated with ProductImportSerializer one batch at a time.
+    Category names are resolved with a name -> id map loaded once (missing
+    categories are created on demand when `create_categories` is set).
+    Each batch then costs one query to read the existing products with
+    those SKUs, one INSERT ... ON CONFLICT (sku) DO UPDATE for the rows
+    that are new or changed (unchanged rows are not written) and one
+    INSERT of their stock movements into the ledger.
+
+    Invalid rows are reported and skipped instead of failing the import.
+    Each batch is committed on its own, and the catalog version is bumped
+    once at the end rather than once per product.
+    """
+
+    def __init__(self, create_categories=False, batch_size=IMPORT_BATCH_SIZE):
+        self.create_categories = create_categories
+        self.batch_size = batch_size
+        self.validator = ProductImportSerializer()
+        self.categories = {}  # Category name -> id (lowest id on duplicates)
+        self.report = {
+            "created": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "categories_created": 0,
+            "error_count": 0,
+            "errors": [],
+            "aborted": None,  # Why the file could not be read to the end
+        }
+
+    def run(self, rows):
+        """
+        Import every row and return the report: counts of created, updated
+        and unchanged products, the errors of rejected rows by number, and
+        whether the file stopped being readable part way (`aborted`).
+        """
+        self.categories = dict(
+            Category.objects.order_by("-id").values_list("name", "id")
+        )
+        try:
+            for batch in batches(rows, self.batch_size):
+                with transaction.atomic():
+                    self.import_batch(batch)
+        except (ImportFormatError, csv.Error, UnicodeDecodeError) as exc:
+            # The batches before the unreadable part stay imported
+            self.report["aborted"] = str(exc)
+        finally:
+            report = self.report
+            if report["created"] or report["updated"] or report["categories_created"]:
+                invalidate_catalog()
+        return self.report
+
+    def reject(self, number, row, errors):
+        self.report["error_count"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            sku = row.get("sku") if isinstance(row, dict) else None
+            self.report["errors"].append(
+                {"row": number, "sku": sku, "errors": errors}
+            )
+
+    def validate(self, batch):
+        # Validated data by SKU; a SKU repeated in the batch keeps its last row
+        valid = {}
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self.reject(
+                    number, row, {"non_field_errors": ["Expected an object."]}
+                )
+                continue
+            try:
+                data = self.validator.run_validation(row)
+            except serializers.ValidationError as exc:
+                self.reject(number, row, exc.detail)
+                continue
+            if data["sku"] in valid:
+                previous, _ = valid[data["sku"]]
+                self.reject(previous, row, {"sku": ["Repeated later in the file."]})
+            valid[data["sku"]] = (number, data)
+        return valid
+
+    def resolve_categories(self, valid):
+        # Replace category names by ids, creating missing ones if allowed
+        missing = {
+            data["category"]
+            for _, data in valid.values()
+            if data["category"] not in self.categories
+        }
+        if missing and self.create_categories:
+            created = Category.objects.bulk_create(
+                [Category(name=name) for name in sorted(missing)]
+            )
+            if any(category.pk is None for category in created):
+                created = Category.objects.filter(name__in=missing)
+            self.report["categories_created"] += len(missing)
+            self.categories.update(
+                (category.name, category.pk) for category in created
+            )
+        for sku, (number, data) in list(valid.items()):
+            category_id = self.categories.get(data["category"])
+            if category_id is None:
+                self.reject(number, data, {"category": ["Unknown category."]})
+                del valid[sku]
+            else:
+                data["category"] = category_id
+
+    def import_batch(self, batch):
+        valid = self.validate(batch)
+        self.resolve_categories(valid)
+        existing, ids = {}, {}
+        rows = Products.objects.filter(sku__in=list(valid)).values_list(
+            "sku", "pk", "name", "unit_price", "category_id", "stock_quantity"
+        )
+        for sku, pk, *values in rows:
+            existing[sku], ids[sku] = tuple(values), pk
+        products = []
+        for sku, (_, data) in valid.items():
+            values = tuple(data[field] for field in UPSERT_FIELDS)
+            if sku not in existing:
+                self.report["created"] += 1
+            elif existing[sku] == values:
+                self.report["unchanged"] += 1
+                continue
+            else:
+                self.report["updated"] += 1
+            products.append(
+                Products(
+                    sku=sku,
+                    name=data["name"],
+                    unit_price=data["unit_price"],
+                    category_id=data["category"],
+                    stock_quantity=data["stock_quantity"],
+                )
+            )
+        Products.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=UPSERT_FIELDS + ["updated_at"],
+        )
+        self.record_stock(products, existing, ids)
+
+    def record_stock(self, products, existing, ids):
+        """
+        Append the batch's stock changes to the ledger in one INSERT: new
+        products receive their stock, updated ones are adjusted by the change.
+        """
+        missing = [p.sku for p in products if p.sku not in ids and p.pk is None]
+        if missing:  # Backends that do not return the ids of upserted rows
+            rows = Products.objects.filter(sku__in=missing).values_list("sku", "pk")
+            ids.update(rows)
+        received, adjusted = {}, {}
+        for product in products:
+            if product.sku in existing:
+                stored = existing[product.sku][-1]
+                adjusted[ids[product.sku]] = product.stock_quantity - stored
+            else:
+                received[ids.get(product.sku, product.pk)] = product.stock_quantity
+        ledger.write(
+            ledger.movements(received, StockMovement.RECEIPT, "import")
+            + ledger.movements(adjusted, StockMovement.ADJUSTMENT, "import")
+        )
+
+
+def import_products(stream, import_format, create_categories=False):
+    # Import products from a binary CSV or JSON stream and return the report
+    importer = ProductImporter(create_categories=create_categories)
+    return importer.run(iter_rows(stream, import_format))
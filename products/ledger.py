@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Products, StockMovement, StockSnapshot
+
+LEDGER_BATCH_SIZE = 1000  # Movements written per INSERT
+CHUNK_SIZE = 5000  # Product ids snapshotted or reconciled per query
+# Snapshots are taken this long in the past, so that movements written by
+# transactions still open when a snapshot is taken are never left out of it
+SNAPSHOT_SETTLE = timedelta(minutes=1)
+BEGINNING = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+QUANTITY = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Value(Decimal("0"), output_field=QUANTITY)
+
+
+def movements(quantities, reason, reference=""):
+    # Unsaved movements for a product id -> signed quantity map (zeros skipped)
+    return [
+        StockMovement(
+            product_id=product_id, quantity=quantity, reason=reason, reference=reference
+        )
+        for product_id, quantity in quantities.items()
+        if quantity
+    ]
+
+
+def write(entries):
+    """
+    Append movements to the ledger, LEDGER_BATCH_SIZE rows per INSERT.
+    Call it in the transaction that changes the stock, so the ledger and
+    stock_quantity are always committed together.
+    """
+    if entries:
+        StockMovement.objects.bulk_create(entries, batch_size=LEDGER_BATCH_SIZE)
+
+
+def record(quantities, reason, reference=""):
+    # Append one movement per product id -> signed quantity, in one batch
+    write(movements(quantities, reason, reference))
+
+
+def with_ledger_stock(products, at=None):
+    """
+    Annotate `products` with `ledger_stock`, the stock according to the
+    ledger at `at` (now when None): the last snapshot taken up to then
+    (`snapshot_stock`, at `snapshot_at`) plus the sum of the movements
+    after it (`tail_stock`, None when there are none). Both are read
+    through the (product, time) indexes, so the cost per product is one
+    snapshot and the movements since it, not the product's whole history.
+    """
+    snapshots = StockSnapshot.objects.filter(product=OuterRef("pk"))
+    if at is not None:
+        snapshots = snapshots.filter(taken_at__lte=at)
+    latest = snapshots.order_by("-taken_at")[:1]
+    tail = StockMovement.objects.filter(
+        product=OuterRef("pk"),
+        created_at__gt=Coalesce(OuterRef("snapshot_at"), Value(BEGINNING)),
+    )
+    if at is not None:
+        tail = tail.filter(created_at__lte=at)
+    tail_sum = tail.order_by().values("product").annotate(total=Sum("quantity"))
+    return (
+        products.annotate(
+            snapshot_at=Subquery(latest.values("taken_at")),
+            snapshot_stock=Subquery(latest.values("stock_quantity")),
+        )
+        .annotate(tail_stock=Subquery(tail_sum.values("total")))
+        .annotate(
+            ledger_stock=Coalesce("snapshot_stock", ZERO)
+            + Coalesce("tail_stock", ZERO)
+        )
+    )
+
+
+def stock_at(product_id, at):
+    # The product's stock at `at` according to the ledger (None if no product)
+    products = with_ledger_stock(Products.objects.filter(pk=product_id), at)
+    return products.values_list("ledger_stock", flat=True).first()
+
+
+def id_ranges(chunk_size=CHUNK_SIZE):
+    # [start, end) ranges of product ids covering every product
+    bounds = Products.objects.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return []
+    return [
+        (start, start + chunk_size)
+        for start in range(bounds["low"], bounds["high"] + 1, chunk_size)
+    ]
+
+
+def take_snapshots(at=None, chunk_size=CHUNK_SIZE):
+    """
+    Snapshot, at `at` (default: SNAPSHOT_SETTLE ago), the ledger stock of
+    every product with movements since its last snapshot, one chunk of
+    product ids per query. Run it periodically: stock-at-time queries then
+    never read more than one period of movements per product.
+    Returns the number of snapshots taken.
+    """
+    at = at or timezone.now() - SNAPSHOT_SETTLE
+    taken = 0
+    for start, end in id_ranges(chunk_size):
+        moved = with_ledger_stock(
+            Products.objects.filter(pk__gte=start, pk__lt=end), at
+        ).filter(tail_stock__isnull=False)
+        snapshots = StockSnapshot.objects.bulk_create(
+            StockSnapshot(product_id=pk, taken_at=at, stock_quantity=stock)
+            for pk, stock in moved.values_list("pk", "ledger_stock")
+        )
+        taken += len(snapshots)
+    return taken
+
+
+def discrepancies(start, end):
+    """
+    (product id, stock_quantity, ledger stock) of the products with ids in
+    [start, end) whose stock disagrees with the ledger, read in one query.
+    """
+    products = with_ledger_stock(Products.objects.filter(pk__gte=start, pk__lt=end))
+    return [
+        (pk, stock, ledger)
+        for pk, stock, ledger in products.order_by("pk").values_list(
+            "pk", "stock_quantity", "ledger_stock"
+        )
+        if stock != ledger
+    ]
+
+
+def in_own_connection(function):
+    # Run `function` on the worker thread's connection, closed afterwards
+    def run(*args):
+        try:
+            return function(*args)
+        finally:
+            connection.close()
+
+    return run
+
+
+def reconcile(chunk_size=CHUNK_SIZE, workers=4, fix=False):
+    """
+    Compare every product's stock_quantity with the ledger, one chunk of
+    product ids per query, with `workers` chunks checked in parallel on
+    their own database connections. Returns the disagreeing products as
+    (product id, stock_quantity, ledger stock), in id order.
+
+    With `fix`, the chunks that disagree are checked again in a transaction
+    and CORRECTION movements bring the ledger in line with stock_quantity,
+    which the application keeps authoritative (the difference is the
+    shrinkage or unrecorded change).
+    """
+    ranges = id_ranges(chunk_size)
+    if workers > 1 and len(ranges) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(in_own_connection(discrepancies), *zip(*ranges)))
+    else:
+        chunks = [discrepancies(start, end) for start, end in ranges]
+    found = [row for chunk in chunks for row in chunk]
+    if fix:
+        for (start, end), chunk in zip(ranges, chunks):
+            if chunk:
+                with transaction.atomic():
+                    record(
+                        {
+                            pk: stock - ledger
+                            for pk, stock, ledger in discrepancies(start, end)
+                        },
+                        StockMovement.CORRECTION,
+                        "reconcile",
+                    )
+    return found
@@ -0,0 +1,122 @@
+from .models import LOW_STOCK, Products, StockAlert
+
+ALERT_TABLE = StockAlert._meta.db_table
+
+# Whether a row of products_products is low on stock; NULL levels never are
+IS_LOW = "coalesce({row}.stock_quantity <= {row}.reorder_level, 0)"
+
+# Triggers appending a StockAlert whenever a product crosses its reorder
+# level, on insert or on any update of its stock or level: sales, batch
+# adjustments, imports and edits alike, whether they go through the ORM, a
+# bulk UPDATE or raw SQL. Updates that stay on the same side of the level
+# write nothing.
+SQLITE_ALERT_SCHEMA = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ALERT_TABLE}_insert
+    AFTER INSERT ON products_products
+    WHEN {IS_LOW.format(row="new")} BEGIN
+        INSERT INTO {ALERT_TABLE}(
+            product_id, low, stock_quantity, reorder_level, created_at
+        )
+        VALUES (
+            new.id, 1, new.stock_quantity, new.reorder_level,
+            strftime('%Y-%m-%d %H:%M:%f', 'now')
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ALERT_TABLE}_update
+    AFTER UPDATE OF stock_quantity, reorder_level ON products_products
+    WHEN {IS_LOW.format(row="new")} != {IS_LOW.format(row="old")} BEGIN
+        INSERT INTO {ALERT_TABLE}(
+            product_id, low, stock_quantity, reorder_level, created_at
+        )
+        VALUES (
+            new.id, {IS_LOW.format(row="new")}, new.stock_quantity,
+            new.reorder_level, strftime('%Y-%m-%d %H:%M:%f', 'now')
+        );
+    END
+    """,
+]
+
+# The same triggers for PostgreSQL, as one row-level trigger function
+POSTGRESQL_ALERT_SCHEMA = [
+    f"""
+    CREATE OR REPLACE FUNCTION {ALERT_TABLE}_record() RETURNS trigger AS $$
+    DECLARE
+        low boolean := coalesce(NEW.stock_quantity <= NEW.reorder_level, false);
+    BEGIN
+        IF TG_OP = 'INSERT' AND NOT low THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'UPDATE' AND low = coalesce(
+            OLD.stock_quantity <= OLD.reorder_level, false
+        ) THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO {ALERT_TABLE}(
+            product_id, low, stock_quantity, reorder_level, created_at
+        )
+        VALUES (NEW.id, low, NEW.stock_quantity, NEW.reorder_level, now());
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS {ALERT_TABLE}_record ON products_products",
+    f"""
+    CREATE TRIGGER {ALERT_TABLE}_record
+    AFTER INSERT OR UPDATE OF stock_quantity, reorder_level ON products_products
+    FOR EACH ROW EXECUTE FUNCTION {ALERT_TABLE}_record()
+    """,
+]
+
+ALERT_SCHEMA = {"sqlite": SQLITE_ALERT_SCHEMA, "postgresql": POSTGRESQL_ALERT_SCHEMA}
+
+DROP_ALERT_SCHEMA = {
+    "sqlite": [
+        f"DROP TRIGGER IF EXISTS {ALERT_TABLE}_{kind}" for kind in ("insert", "update")
+    ],
+    "postgresql": [
+        f"DROP TRIGGER IF EXISTS {ALERT_TABLE}_record ON products_products",
+        f"DROP FUNCTION IF EXISTS {ALERT_TABLE}_record()",
+    ],
+}
+
+
+def install_stock_alerts(conn):
+    """
+    Create the stock alert triggers if they are missing.
+    SQLite drops a table's triggers when a migration rebuilds the table, so
+    this also runs after every migrate. Alerts for changes made while the
+    triggers were missing are not recorded; the low-stock list itself is
+    always current, as it is read from the products table.
+    Does nothing on databases other than SQLite and PostgreSQL.
+    """
+    if conn.vendor not in ALERT_SCHEMA:
+        return
+    tables = conn.introspection.table_names()
+    if Products._meta.db_table not in tables or ALERT_TABLE not in tables:
+        return  # Products not migrated (yet)
+    with conn.cursor() as cursor:
+        for statement in ALERT_SCHEMA[conn.vendor]:
+            cursor.execute(statement)
+
+
+def drop_stock_alerts(conn):
+    with conn.cursor() as cursor:
+        for statement in DROP_ALERT_SCHEMA.get(conn.vendor, []):
+            cursor.execute(statement)
+
+
+def low_stock_products():
+    """
+    Products whose stock is at or below their reorder level. The condition
+    matches the partial index products_low_stock, which only holds those
+    products, so reading them is proportional to how many are low.
+    """
+    return Products.objects.filter(LOW_STOCK)
+
+
+def alerts_after(after, limit):
+    # Up to `limit` stock alerts recorded after the alert with id `after`
+    return StockAlert.objects.filter(pk__gt=after).order_by("pk")[:limit]
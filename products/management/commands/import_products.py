@@ -0,0 +1,62 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import (
+    IMPORT_BATCH_SIZE,
+    IMPORT_FORMATS,
+    ProductImporter,
+    iter_rows,
+)
+
+
+class Command(BaseCommand):
+    """
+    Upserts products by SKU from a CSV or JSON file, the same way as
+    POST /products/import/. The file is read as a stream and imported in
+    batches; invalid rows are skipped and listed in the report.
+    """
+
+    help = "Import (create or update by SKU) products from a CSV or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header line, or JSON array.")
+        parser.add_argument(
+            "--format",
+            choices=IMPORT_FORMATS,
+            dest="fmt",
+            help="File format (default: taken from the file extension).",
+        )
+        parser.add_argument(
+            "--create-categories",
+            action="store_true",
+            help="Create categories that do not exist yet.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Rows validated and written together (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        import_format = options["fmt"] or path.suffix.lstrip(".").lower()
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError("Cannot tell the file format; use --format.")
+        importer = ProductImporter(
+            create_categories=options["create_categories"],
+            batch_size=options["batch_size"],
+        )
+        with path.open("rb") as stream:
+            report = importer.run(iter_rows(stream, import_format))
+        for error in report["errors"]:
+            self.stderr.write(json.dumps(error))
+        summary = (
+            f"{report['created']} created, {report['updated']} updated, "
+            f"{report['unchanged']} unchanged, {report['error_count']} rejected."
+        )
+        if report["aborted"]:
+            raise CommandError(f"Import stopped early: {report['aborted']}. {summary}")
+        self.stdout.write(self.style.SUCCESS(summary))
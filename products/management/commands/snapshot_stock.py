@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from products import ledger
+
+
+class Command(BaseCommand):
+    """
+    Snapshots the ledger stock of every product that moved since its last
+    snapshot. Run it periodically (e.g. nightly from cron): stock-at-time
+    queries read the last snapshot and the movements after it, so the
+    interval bounds how many movements a query sums.
+    """
+
+    help = "Take stock snapshots of the products whose stock moved."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=ledger.CHUNK_SIZE,
+            help=f"Product ids snapshotted per query (default: {ledger.CHUNK_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        taken = ledger.take_snapshots(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Took {taken} stock snapshots."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def install(apps, schema_editor):
+    from products.low_stock import install_stock_alerts
+
+    install_stock_alerts(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from products.low_stock import drop_stock_alerts
+
+    drop_stock_alerts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='reorder_level',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('stock_quantity__lte', models.F('reorder_level'))), fields=['id'], name='products_low_stock'),
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('low', models.BooleanField()),
+                ('stock_quantity', models.IntegerField()),
+                ('reorder_level', models.IntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+            ],
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
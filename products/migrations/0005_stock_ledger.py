@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Existing stock levels become the products' opening snapshots
+    Products = apps.get_model('products', 'Products')
+    StockSnapshot = apps.get_model('products', 'StockSnapshot')
+    now = django.utils.timezone.now()
+    stock = Products.objects.order_by('pk').values_list('pk', 'stock_quantity')
+    StockSnapshot.objects.bulk_create(
+        (
+            StockSnapshot(product_id=pk, taken_at=now, stock_quantity=quantity)
+            for pk, quantity in stock.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_low_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reason', models.CharField(choices=[('sale', 'Sale'), ('cancellation', 'Cancellation'), ('receipt', 'Receipt'), ('adjustment', 'Adjustment'), ('correction', 'Correction')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stock_movement_product_time')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('stock_quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'taken_at'), name='stock_snapshot_product_time')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:44
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='products_name_lower'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(django.db.models.functions.text.Lower('sku'), name='products_sku_lower'),
+        ),
+    ]
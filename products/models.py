@@ -1,4 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+# A product is low on stock once its stock falls to its reorder level
+LOW_STOCK = Q(stock_quantity__lte=F("reorder_level"))
 
 
 class Category(models.Model):
@@ -29,13 +35,180 @@ class Products(models.Model):
         max_length=100, unique=True
     )  # Unique Stock Keeping Unit identifier
     stock_quantity = models.IntegerField()  # Current stock level
+    reorder_level = models.IntegerField(
+        null=True, blank=True
+    )  # Stock level at or below which the product needs reordering (None: never)
     created_at = models.DateTimeField(
         auto_now_add=True
     )  # Timestamp when product was created
     updated_at = models.DateTimeField(
-        auto_now=True
-    )  # Timestamp when product was last updated
+        auto_now=True, db_index=True
+    )  # Timestamp when product was last updated (indexed for catalog deltas)
+
+    class Meta:
+        indexes = [
+            # Holds only the products that are low on stock, so listing them
+            # costs the same whatever the size of the catalog
+            models.Index(fields=["id"], condition=LOW_STOCK, name="products_low_stock"),
+            # Case-insensitive prefix search on names and SKUs (products/search.py)
+            models.Index(Lower("name"), name="products_name_lower"),
+            models.Index(Lower("sku"), name="products_sku_lower"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the stock level to record what a save changes in the ledger
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get("stock_quantity")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the product and append the change in stock to the ledger in the
+        same transaction: a new product's stock is received. An edited
+        product's stock is never written back as loaded, since sales may
+        have moved it since: only the difference the edit made is applied,
+        as stock_quantity + difference in the UPDATE, and recorded as an
+        adjustment; the instance then holds the stock as stored.
+        """
+        if self._state.adding:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if self.stock_quantity:
+                    StockMovement.objects.create(
+                        product=self,
+                        quantity=self.stock_quantity,
+                        reason=StockMovement.RECEIPT,
+                    )
+            self._loaded_stock = self.stock_quantity
+            return
+        previous = getattr(self, "_loaded_stock", None)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+            ]
+        if previous is None or "stock_quantity" not in update_fields:
+            super().save(*args, **kwargs)  # Stock not loaded, or not saved
+            return
+        delta = self.stock_quantity - previous
+        with transaction.atomic():
+            if delta:
+                self.stock_quantity = F("stock_quantity") + delta
+                super().save(*args, **kwargs)
+                StockMovement.objects.create(
+                    product=self, quantity=delta, reason=StockMovement.ADJUSTMENT
+                )
+            else:
+                fields = [name for name in update_fields if name != "stock_quantity"]
+                super().save(*args, **{**kwargs, "update_fields": fields})
+            self.refresh_from_db(fields=["stock_quantity"])
+        self._loaded_stock = self.stock_quantity
 
     def __str__(self):
         # Returns the product name for display in admin and logs
         return self.name
+
+
+class StockMovement(models.Model):
+    """
+    One change to a product's stock in the append-only inventory ledger:
+    `quantity` is added to the stock (taken from it when negative).
+    Movements are written in the transaction that changes stock_quantity,
+    in one INSERT per stock update (see products/ledger.py).
+    """
+
+    SALE = "sale"
+    CANCELLATION = "cancellation"
+    RECEIPT = "receipt"
+    ADJUSTMENT = "adjustment"
+    CORRECTION = "correction"
+    REASON_CHOICES = [
+        (SALE, "Sale"),
+        (CANCELLATION, "Cancellation"),
+        (RECEIPT, "Receipt"),
+        (ADJUSTMENT, "Adjustment"),
+        (CORRECTION, "Correction"),
+    ]
+
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE, db_index=False
+    )  # Product whose stock moved (indexed by stock_movement_product_time)
+    quantity = models.DecimalField(
+        max_digits=12, decimal_places=2
+    )  # Signed change in stock
+    reason = models.CharField(
+        choices=REASON_CHOICES, max_length=20
+    )  # Why the stock moved
+    reference = models.CharField(
+        max_length=100, blank=True
+    )  # What moved it, e.g. "sale 42" or "import"
+    created_at = models.DateTimeField(
+        default=timezone.now
+    )  # Timestamp of the change
+
+    class Meta:
+        indexes = [
+            # A product's movements after its last snapshot (stock at a time)
+            models.Index(
+                fields=["product", "created_at"], name="stock_movement_product_time"
+            ),
+        ]
+
+    def __str__(self):
+        # Returns a short description for display in admin and logs
+        return f"{self.product_id} {self.quantity:+} ({self.reason})"
+
+
+class StockSnapshot(models.Model):
+    """
+    A product's stock according to the ledger at `taken_at`: the sum of
+    all its movements up to then. Stock at any later time is the snapshot
+    plus the movements after it, so snapshots bound how much of the ledger
+    a query has to read. Taken periodically by manage.py snapshot_stock.
+    """
+
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE, db_index=False
+    )  # Product the snapshot is of (indexed by stock_snapshot_product_time)
+    taken_at = models.DateTimeField()  # Time the stock level is for
+    stock_quantity = models.DecimalField(
+        max_digits=12, decimal_places=2
+    )  # Stock level at that time
+
+    class Meta:
+        constraints = [
+            # One snapshot per product and time; also finds the latest one
+            models.UniqueConstraint(
+                fields=["product", "taken_at"], name="stock_snapshot_product_time"
+            ),
+        ]
+
+    def __str__(self):
+        # Returns a short description for display in admin and logs
+        return f"{self.product_id} {self.stock_quantity} at {self.taken_at}"
+
+
+class StockAlert(models.Model):
+    """
+    Records a product crossing its reorder level: `low` is true when its
+    stock fell to or below the level, false when it went back above it.
+    Written by database triggers (see products/low_stock.py), so every
+    stock change is covered, whichever code path makes it.
+    """
+
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE
+    )  # Product whose stock crossed its reorder level
+    low = models.BooleanField()  # True: ran low, False: restocked
+    stock_quantity = models.IntegerField()  # Stock level after the change
+    reorder_level = models.IntegerField(null=True)  # Reorder level after the change
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )  # Timestamp of the change
+
+    def __str__(self):
+        # Returns a short description for display in admin and logs
+        return f"{self.product_id} {'low' if self.low else 'restocked'}"
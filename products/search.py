@@ -0,0 +1,178 @@
+from django.db import connection
+from django.db.models import Q
+
+from .models import Products
+
+SEARCH_TABLE = "products_search"
+
+# SQLite FTS5 index over product names and SKUs. The trigram tokenizer
+# matches any substring of three characters or more, and the index is an
+# external-content table, so it stores no copy of the rows: triggers on
+# products_products keep it in sync with every insert, update and delete,
+# whether it comes from the ORM, a bulk operation or raw SQL.
+SQLITE_SEARCH_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, sku, content='products_products', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert
+    AFTER INSERT ON products_products BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, name, sku)
+        VALUES (new.id, new.name, new.sku);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete
+    AFTER DELETE ON products_products BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, sku)
+        VALUES ('delete', old.id, old.name, old.sku);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF name, sku ON products_products BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, sku)
+        VALUES ('delete', old.id, old.name, old.sku);
+        INSERT INTO {SEARCH_TABLE}(rowid, name, sku)
+        VALUES (new.id, new.name, new.sku);
+    END
+    """,
+]
+
+TRIGGER_NAMES = [f"{SEARCH_TABLE}_{kind}" for kind in ("insert", "delete", "update")]
+
+# Shortest query the trigram index can answer
+MIN_INDEXED_LENGTH = 3
+
+# FTS matches ranked per search: bm25 is computed for every ranked row, so
+# ranking a fixed window keeps common terms as fast as rare ones
+SEARCH_WINDOW = 200
+
+
+def install_search_index(conn):
+    """
+    Create the search index and its triggers if they are missing.
+    SQLite drops a table's triggers when a migration rebuilds the table, so
+    this also runs after every migrate; if any trigger had to be recreated
+    the index is rebuilt from the products table.
+    Does nothing on databases other than SQLite.
+    """
+    if conn.vendor != "sqlite":
+        return
+    if Products._meta.db_table not in conn.introspection.table_names():
+        return  # Products not migrated (yet)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN "
+            f"({', '.join(['%s'] * len(TRIGGER_NAMES))})",
+            TRIGGER_NAMES,
+        )
+        complete = cursor.fetchone()[0] == len(TRIGGER_NAMES)
+        for statement in SQLITE_SEARCH_SCHEMA:
+            cursor.execute(statement)
+        if not complete:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"
+            )
+
+
+def drop_search_index(conn):
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def fts_phrase(term):
+    # Quote the term as a single FTS5 phrase so user input is never parsed
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_products(term, category=None, limit=20):
+    """
+    Return up to `limit` products whose name or SKU contains `term`,
+    optionally restricted to one category.
+    Products whose name or SKU starts with the term come first, by name,
+    then the rest by FTS relevance (bm25). However many products match,
+    the work is bounded: prefix matches are read from the first `limit`
+    entries of the name and SKU indexes from the term on, and only the
+    first SEARCH_WINDOW FTS matches are ranked.
+    """
+    term = term.strip()
+    if connection.vendor != "sqlite" or len(term) < MIN_INDEXED_LENGTH:
+        return fallback_search(term, category, limit)
+    sql, params = search_query(term, category, limit)
+    return list(Products.objects.raw(sql, params))
+
+
+def search_query(term, category, limit):
+    """
+    Build the SQL and parameters of search_products.
+    """
+    category_clause = ""
+    category_params = []
+    if category is not None:
+        # The unary + keeps SQLite off the category index: walking a whole
+        # category would cost as much as the unbounded search
+        category_clause = "AND +p.category_id = %s"
+        category_params = [category]
+    prefixes = []
+    params = []
+    for column in ("name", "sku"):
+        # A range on the lower() expression index, not LIKE, so SQLite seeks
+        # to the term and stops after `limit` rows; char(1114111) is U+10FFFF,
+        # the highest code point, so the range holds every value starting
+        # with the term
+        prefixes.append(
+            f"""
+            SELECT id FROM (
+                SELECT p.id FROM products_products p
+                WHERE lower(p.{column}) >= lower(%s)
+                AND lower(p.{column}) < lower(%s) || char(1114111)
+                {category_clause}
+                LIMIT %s
+            )
+            """
+        )
+        params += [term, term, *category_params, limit]
+    params += [fts_phrase(term), *category_params, max(limit, SEARCH_WINDOW)]
+    sql = f"""
+        WITH prefixed AS ({" UNION ".join(prefixes)}),
+        ranked AS (
+            SELECT * FROM (
+                SELECT s.rowid AS id, s.rank AS rank FROM {SEARCH_TABLE} s
+                JOIN products_products p ON p.id = s.rowid
+                WHERE {SEARCH_TABLE} MATCH %s {category_clause}
+                LIMIT %s
+            )
+        ), candidates AS (
+            SELECT id, 1 AS prefixed, NULL AS rank FROM prefixed
+            UNION ALL
+            SELECT id, 0, rank FROM ranked WHERE id NOT IN prefixed
+        )
+        SELECT p.* FROM candidates c
+        JOIN products_products p ON p.id = c.id
+        ORDER BY c.prefixed DESC, c.rank, lower(p.name), p.id
+        LIMIT %s
+    """
+    return sql, params + [limit]
+
+
+def fallback_search(term, category=None, limit=20):
+    """
+    Search without the FTS index: terms too short for trigrams, or
+    databases other than SQLite. Short terms only match prefixes.
+    """
+    if len(term) < MIN_INDEXED_LENGTH:
+        condition = Q(name__istartswith=term) | Q(sku__startswith=term)
+    else:
+        condition = Q(name__icontains=term) | Q(sku__icontains=term)
+    products = Products.objects.filter(condition)
+    if category is not None:
+        products = products.filter(category_id=category)
+    return list(products.order_by("name", "id")[:limit])
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Products, Category
+from .models import Products, Category, StockAlert, StockMovement
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -24,3 +24,150 @@ class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = "__all__"  # Serialize all fields in the Category model
+
+
+class CatalogChangesSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the catalog changes endpoint.
+    `since` is a catalog version previously returned by the API (ETag or delta).
+    """
+
+    since = serializers.IntegerField(min_value=0)
+
+
+class ProductSearchSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the product search endpoint.
+    """
+
+    q = serializers.CharField(max_length=100)  # Text to find in name or SKU
+    category = serializers.IntegerField(required=False)  # Restrict to a category
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class SkuResolveSerializer(serializers.Serializer):
+    """
+    Input serializer for resolving a batch of scanned SKUs.
+    """
+
+    skus = serializers.ListField(
+        child=serializers.CharField(max_length=100), allow_empty=False, max_length=500
+    )
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """
+    Validates one row of a bulk product import with the ProductSerializer
+    field rules. The category is given by name and resolved by the importer,
+    and the SKU is not checked for uniqueness: an existing SKU is updated.
+    """
+
+    category = serializers.CharField(max_length=100)
+
+    class Meta:
+        model = Products
+        fields = ["sku", "name", "unit_price", "category", "stock_quantity"]
+        extra_kwargs = {"sku": {"validators": []}}
+
+
+class ProductImportOptionsSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the bulk product import.
+    """
+
+    create_categories = serializers.BooleanField(default=False)
+
+
+class ProductAdjustmentSerializer(serializers.Serializer):
+    """
+    One line of a batch adjustment. The product is referenced either by id
+    (`product`) or by `sku`; the line may set a new `unit_price`, either
+    change the stock by `stock_delta` or set it to `stock_quantity`, and set
+    the `reorder_level` (null for none).
+    """
+
+    product = serializers.IntegerField(required=False)
+    sku = serializers.CharField(max_length=100, required=False)
+    unit_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False
+    )
+    stock_delta = serializers.IntegerField(required=False)
+    stock_quantity = serializers.IntegerField(min_value=0, required=False)
+    reorder_level = serializers.IntegerField(
+        min_value=0, allow_null=True, required=False
+    )
+
+    def validate(self, attrs):
+        if ("product" in attrs) == ("sku" in attrs):
+            raise serializers.ValidationError(
+                "Provide either 'product' or 'sku' for each line."
+            )
+        if "stock_delta" in attrs and "stock_quantity" in attrs:
+            raise serializers.ValidationError(
+                "Provide either 'stock_delta' or 'stock_quantity', not both."
+            )
+        changes = {"unit_price", "stock_delta", "stock_quantity", "reorder_level"}
+        if not changes & set(attrs):
+            raise serializers.ValidationError("The line changes nothing.")
+        return attrs
+
+
+class ProductBatchAdjustmentSerializer(serializers.Serializer):
+    """
+    Input serializer for adjusting many products in one request.
+    """
+
+    adjustments = ProductAdjustmentSerializer(
+        many=True, allow_empty=False, max_length=1000
+    )
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the StockMovement model (read only: the ledger is
+    appended to by the code that changes stock).
+    """
+
+    class Meta:
+        model = StockMovement
+        fields = "__all__"  # Serialize all fields in the StockMovement model
+
+
+class StockLevelQuerySerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the stock-at-time endpoint.
+    `at` defaults to now.
+    """
+
+    at = serializers.DateTimeField(required=False)
+
+
+class StockLevelSerializer(serializers.Serializer):
+    """
+    A product's stock according to the ledger at a point in time.
+    """
+
+    product = serializers.IntegerField()
+    at = serializers.DateTimeField()
+    stock_quantity = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the StockAlert model (read only: alerts are written by
+    the database when a product crosses its reorder level).
+    """
+
+    class Meta:
+        model = StockAlert
+        fields = "__all__"  # Serialize all fields in the StockAlert model
+
+
+class StockAlertFeedSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the stock alert feed.
+    `after` is the id of the last alert the client has seen (0 for all).
+    """
+
+    after = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
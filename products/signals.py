@@ -0,0 +1,34 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog, log_deletion
+from .models import Category, Products
+from .low_stock import install_stock_alerts
+from .search import install_search_index
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_save, sender=Category)
+def catalog_saved(sender, **kwargs):
+    # Any product or category write makes cached catalog responses stale
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=Products)
+@receiver(post_delete, sender=Category)
+def catalog_deleted(sender, instance, **kwargs):
+    # Deletions cannot be expressed as a delta, so terminals must refresh fully
+    if sender is Products:
+        log_deletion(instance.pk)  # The SKU index drops just this product
+    invalidate_catalog(deleted=True)
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # Migrations that rebuild products_products drop the search triggers
+    install_search_index(connections[using])
+
+
+def ensure_stock_alerts(sender, using, **kwargs):
+    # The same holds for the stock alert triggers
+    install_stock_alerts(connections[using])
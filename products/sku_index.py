@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+
+from django.db import DatabaseError
+
+from .cache import (
+    catalog_version,
+    changes_since,
+    deleted_since,
+    deletion_count,
+    stock_version,
+)
+from .models import Products
+from .serializers import ProductSerializer
+
+logger = logging.getLogger(__name__)
+
+# Fields a sale changes: re-read on their own when stock levels move
+STOCK_FIELDS = ("stock_quantity", "updated_at")
+
+
+class SkuIndex:
+    """
+    In-process map of SKU -> serialized product for barcode scans.
+
+    The map is warmed once per worker and tagged with the catalog version it
+    reflects. Each lookup compares that tag with the current catalog version
+    (a cache read, no database query, at most once per `max_staleness`
+    seconds); when the catalog changed, only the products updated since
+    then are fetched and applied, and deleted products are dropped one by
+    one from the deletion log. A SKU missing from the map falls back to a
+    single database lookup.
+
+    Sales do not move the catalog version, only the stock version (see
+    products.cache.stock_version). Each entry remembers the stock version
+    its stock level was read at; a scanned product whose stock version is
+    behind has its stock re-read, in one query for the whole scan, so scans
+    show stock levels no older than product pages do.
+    """
+
+    max_staleness = 1.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.products = {}  # sku -> serialized product
+        self.skus = {}  # product id -> sku, to drop entries whose SKU changed
+        self.version = None  # Catalog version the map reflects
+        self.stock = None  # Stock version as of the last version check
+        self.stock_read = {}  # product id -> stock version its stock was read at
+        self.deletions = 0  # Logged product deletions the map reflects
+        self.checked_at = 0.0  # Monotonic time of the last version check
+
+    def warm(self):
+        # Load every product; versions are read first so no change is missed
+        stock, version, deletions = stock_version(), catalog_version(), deletion_count()
+        products, skus = {}, {}
+        for data in ProductSerializer(Products.objects.all(), many=True).data:
+            products[data["sku"]] = data
+            skus[data["id"]] = data["sku"]
+        with self.lock:
+            self.products, self.skus = products, skus
+            self.stock_read = dict.fromkeys(skus, stock)
+            self.version, self.deletions, self.stock = version, deletions, stock
+
+    def refresh(self):
+        """
+        Bring the map up to date with the catalog if its version moved, and
+        note the current stock version.
+        """
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < self.max_staleness:
+            return
+        self.checked_at = now
+        stock, version = stock_version(), catalog_version()
+        if version == self.version:
+            self.stock = stock
+            return
+        if self.version is None:
+            self.warm()
+            return
+        deleted, deletions = deleted_since(self.deletions)
+        if deleted is None:
+            self.warm()
+            return
+        changed, _ = changes_since(self.version)  # Deletions are applied here
+        with self.lock:
+            for product_id in deleted:
+                self.evict(product_id)
+            for data in ProductSerializer(changed, many=True).data:
+                # After the evictions, in case a SKU was reused
+                self.store(data, stock)
+            self.version, self.deletions, self.stock = version, deletions, stock
+
+    def evict(self, product_id):
+        sku = self.skus.pop(product_id, None)
+        self.stock_read.pop(product_id, None)
+        if sku in self.products and self.products[sku]["id"] == product_id:
+            del self.products[sku]
+
+    def store(self, data, stock):
+        previous = self.skus.get(data["id"])
+        if previous is not None and previous != data["sku"]:
+            self.products.pop(previous, None)
+        self.products[data["sku"]] = data
+        self.skus[data["id"]] = data["sku"]
+        self.stock_read[data["id"]] = stock
+
+    def refresh_stock(self, found):
+        """
+        Re-read the stock of the products in `found` (sku -> data) whose
+        stock was read at an older stock version, in one query.
+        """
+        stock = self.stock
+        stale = {
+            data["id"]: sku
+            for sku, data in found.items()
+            if self.stock_read.get(data["id"]) != stock
+        }
+        if not stale:
+            return
+        fields = ProductSerializer().fields
+        rows = list(Products.objects.filter(pk__in=stale).values("pk", *STOCK_FIELDS))
+        with self.lock:
+            for row in rows:
+                sku = stale[row["pk"]]
+                data = dict(found[sku])  # Readers may hold the old dict
+                for name in STOCK_FIELDS:
+                    data[name] = fields[name].to_representation(row[name])
+                found[sku] = data
+                if self.skus.get(row["pk"]) == sku:
+                    self.store(data, stock)
+
+    def get_many(self, skus):
+        """
+        Resolve several SKUs at once. Returns a dict of the SKUs found;
+        those missing from the map are looked up in one database query, and
+        those with outdated stock levels have them re-read in another.
+        """
+        self.refresh()
+        found = {sku: self.products[sku] for sku in skus if sku in self.products}
+        self.refresh_stock(found)
+        missing = [sku for sku in skus if sku not in found]
+        if missing:
+            stock = self.stock  # Read before the query, so never ahead of it
+            fetched = Products.objects.filter(sku__in=missing)
+            with self.lock:
+                for data in ProductSerializer(fetched, many=True).data:
+                    self.store(data, stock)
+                    found[data["sku"]] = data
+        return found
+
+    def get(self, sku):
+        return self.get_many([sku]).get(sku)
+
+
+sku_index = SkuIndex()
+
+
+def warm_sku_index():
+    """
+    Warm the SKU index at worker startup. A database that is not ready yet
+    (e.g. before migrations) is not fatal: the index warms on first use.
+    """
+    try:
+        sku_index.warm()
+    except DatabaseError:
+        logger.warning("SKU index not warmed at startup; it will warm on first use")
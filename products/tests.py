@@ -1,3 +1,877 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from datetime import timedelta
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from retail_software.pagination import KeysetPagination
+from . import ledger
+from .cache import bump_catalog_version, catalog_version
+from .low_stock import drop_stock_alerts, low_stock_products
+from .models import Category, Products, StockAlert, StockMovement, StockSnapshot
+from .search import search_query
+from .serializers import ProductSerializer
+from .signals import ensure_stock_alerts
+from .sku_index import SkuIndex
+
+
+class ProductListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Snacks")
+        Products.objects.bulk_create(
+            Products(
+                name=f"Product {i}",
+                unit_price=Decimal("1.00"),
+                category=self.category,
+                sku=f"SKU-{i}",
+                stock_quantity=10,
+            )
+            for i in range(7)
+        )
+
+    def test_products_are_paginated_by_cursor(self):
+        response = self.client.get(reverse("product-list-create"), {"page_size": 5})
+        body = response.json()
+        self.assertEqual(len(body["results"]), 5)
+        rest = self.client.get(body["next"]).json()
+        self.assertIsNone(rest["next"])
+        ids = [row["id"] for row in body["results"] + rest["results"]]
+        expected = Products.objects.order_by("id").values_list("id", flat=True)
+        self.assertEqual(ids, list(expected))
+        url = reverse("product-list-create")
+        for position in (["abc"], [{"x": 1}], [[1]]):
+            cursor = KeysetPagination().encode_cursor(position)
+            self.assertEqual(self.client.get(url, {"cursor": cursor}).status_code, 404)
+
+    def test_list_matches_the_model_serializer_byte_for_byte(self):
+        Products.objects.create(
+            name="Caf\u00e9 \u2028 \"line\" \U0001f600",
+            unit_price=Decimal("1234567.05"),
+            category=self.category,
+            sku="SKU-odd",
+            stock_quantity=-3,
+        )
+        response = self.client.get(reverse("product-list-create"), {"page_size": 5})
+        next_page = self.client.get(response.json()["next"])
+        for page, products in [(response, [0, 5]), (next_page, [5, 10])]:
+            rows = Products.objects.order_by("id")[products[0] : products[1]]
+            expected = ProductSerializer(rows, many=True).data
+            body = json.loads(page.content)
+            self.assertEqual(
+                page.content,
+                JSONRenderer().render({"next": body["next"], "results": expected}),
+            )
+
+    def test_fields_select_only_the_requested_columns(self):
+        url = reverse("product-list-create")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"fields": "name", "page_size": 5})
+        body = response.json()
+        self.assertEqual(body["results"][0], {"name": "Product 0"})
+        self.assertNotIn("stock_quantity", queries[0]["sql"])
+        rest = self.client.get(body["next"]).json()  # Paged by the unselected id
+        names = [row["name"] for row in rest["results"]]
+        self.assertEqual(names, ["Product 5", "Product 6"])
+
+    def test_expand_category(self):
+        url = reverse("product-list-create")
+        with self.assertNumQueries(1):  # Joined, not fetched per product
+            body = self.client.get(url, {"expand": "category"}).json()
+        product = body["results"][0]
+        category = {"id": self.category.pk, "name": "Snacks"}
+        self.assertEqual(product["category"], category)
+        self.assertEqual(product["sku"], "SKU-0")
+        body = self.client.get(url, {"fields": "sku,category.name"}).json()
+        self.assertEqual(
+            body["results"][0], {"sku": "SKU-0", "category": {"name": "Snacks"}}
+        )
+        pk = Products.objects.get(sku="SKU-1").pk
+        detail = reverse("product-list-update-delete", args=[pk])
+        self.assertEqual(
+            self.client.get(detail, {"fields": "sku"}).json(), {"sku": "SKU-1"}
+        )
+
+    def test_invalid_projections(self):
+        url = reverse("product-list-create")
+        response = self.client.get(url, {"fields": "id,colour"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown field 'colour'", response.json()["fields"][0])
+        self.assertEqual(self.client.get(url, {"expand": "name"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"fields": ""}).status_code, 400)
+
+    def test_categories_are_paginated(self):
+        body = self.client.get(reverse("category-list-create")).json()
+        self.assertEqual([row["name"] for row in body["results"]], ["Snacks"])
+        self.assertIsNone(body["next"])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Catalog endpoints must answer in a fixed number of queries.
+    """
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Snacks")
+        self.product = Products.objects.create(
+            name="Chips",
+            unit_price=Decimal("1.00"),
+            category=category,
+            sku="CHIPS",
+            stock_quantity=10,
+        )
+
+    def test_read_endpoints(self):
+        budgets = {
+            reverse("product-list-create"): 1,
+            reverse("category-list-create"): 1,
+            reverse("product-list-update-delete", args=[self.product.pk]): 1,
+            reverse("category-list-update", args=[self.product.category_id]): 1,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url), self.assertNumQueries(budget):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Snacks")
+        self.product = Products.objects.create(
+            name="Chips",
+            unit_price=Decimal("1.00"),
+            category=self.category,
+            sku="CHIPS",
+            stock_quantity=10,
+        )
+        self.url = reverse("product-list-create")
+
+    def test_unchanged_catalog_returns_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.json(), first.json())
+
+    def test_writes_through_views_invalidate(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("product-list-update-delete", args=[self.product.pk]),
+                {"unit_price": "1.50"},
+                content_type="application/json",
+            )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["unit_price"], "1.50")
+
+    def test_orm_writes_invalidate(self):
+        etag = self.client.get(reverse("category-list-create"))["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Drinks")
+        response = self.client.get(
+            reverse("category-list-create"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_changes_since_version(self):
+        version = bump_catalog_version()
+        Products.objects.filter(pk=self.product.pk).update(
+            updated_at=self.product.updated_at.replace(year=2000)
+        )
+        url = reverse("product-changes")
+        body = self.client.get(url, {"since": version}).json()
+        self.assertEqual(body["products"], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock_quantity = 5
+            self.product.save()
+        body = self.client.get(url, {"since": version}).json()
+        self.assertGreater(body["version"], version)
+        self.assertFalse(body["full_refresh"])
+        self.assertEqual([p["sku"] for p in body["products"]], ["CHIPS"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        body = self.client.get(url, {"since": version}).json()
+        self.assertTrue(body["full_refresh"])
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        drinks = Category.objects.create(name="Drinks")
+        snacks = Category.objects.create(name="Snacks")
+        self.drinks = drinks
+        for name, sku, category in [
+            ("Coca Cola 500ml", "DRK-COKE-500", drinks),
+            ("Chocolate Cookies", "SNK-COOKIE", snacks),
+            ("Hot Chocolate", "DRK-HOTCHOC", drinks),
+            ("Plantain Chips", "SNK-CHIPS", snacks),
+        ]:
+            Products.objects.create(
+                name=name,
+                unit_price=Decimal("1.00"),
+                category=category,
+                sku=sku,
+                stock_quantity=10,
+            )
+        self.url = reverse("product-search")
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.json()["results"]]
+
+    def test_substring_matches_rank_prefix_first(self):
+        self.assertEqual(
+            self.search(q="choc"), ["Chocolate Cookies", "Hot Chocolate"]
+        )
+
+    def test_prefix_matches_are_found_among_many_matches(self):
+        # Added after hundreds of substring matches, in rowid order
+        category = Category.objects.create(name="Bulk")
+        Products.objects.bulk_create(
+            Products(
+                name=f"Mint choc {i}",
+                unit_price=Decimal("1.00"),
+                category=category,
+                sku=f"MINT-{i}",
+                stock_quantity=1,
+            )
+            for i in range(600)
+        )
+        Products.objects.create(
+            name="Chocolate Bar",
+            unit_price=Decimal("1.00"),
+            category=category,
+            sku="BAR",
+            stock_quantity=1,
+        )
+        self.assertEqual(
+            self.search(q="choc")[:2], ["Chocolate Bar", "Chocolate Cookies"]
+        )
+
+    @skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite")
+    def test_common_terms_rank_a_bounded_window(self):
+        category = Category.objects.create(name="Bulk")
+        Products.objects.bulk_create(
+            Products(
+                name=f"Mint choc {i}",
+                unit_price=Decimal("1.00"),
+                category=category,
+                sku=f"CHOC-{i}",
+                stock_quantity=1,
+            )
+            for i in range(2000)
+        )
+        for category in (None, category.pk):
+            sql, params = search_query("choc", category, 20)
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = "\n".join(row[-1] for row in cursor.fetchall())
+            with self.subTest(category=category, plan=plan):
+                # Prefix matches seek into the lower() indexes
+                self.assertIn("SEARCH p USING INDEX products_name_lower", plan)
+                self.assertIn("SEARCH p USING INDEX products_sku_lower", plan)
+                # The FTS window is read in index order and capped: the only
+                # sort is the final one, over the candidates
+                self.assertIn("SCAN s VIRTUAL TABLE", plan)
+                self.assertEqual(plan.count("TEMP B-TREE FOR ORDER BY"), 1)
+                self.assertNotRegex(plan, r"SCAN p\s*$|SCAN p\n")
+        # SKU prefix matches count as prefix matches too, ordered by name
+        self.assertEqual(
+            self.search(q="choc")[:3],
+            ["Chocolate Cookies", "Mint choc 0", "Mint choc 1"],
+        )
+
+    def test_sku_and_category_filter(self):
+        self.assertEqual(self.search(q="COOKIE"), ["Chocolate Cookies"])
+        self.assertEqual(self.search(q="snk-coo"), ["Chocolate Cookies"])
+        self.assertEqual(
+            self.search(q="choc", category=self.drinks.pk), ["Hot Chocolate"]
+        )
+
+    def test_short_terms_match_prefixes(self):
+        self.assertEqual(self.search(q="Pl"), ["Plantain Chips"])
+
+    def test_index_follows_writes(self):
+        product = Products.objects.get(sku="SNK-CHIPS")
+        product.name = "Cassava Crisps"
+        product.save()
+        self.assertEqual(self.search(q="plantain"), [])
+        self.assertEqual(self.search(q="cassava"), ["Cassava Crisps"])
+        Products.objects.filter(sku="DRK-HOTCHOC").delete()
+        self.assertEqual(self.search(q="chocolate"), ["Chocolate Cookies"])
+
+    def test_query_is_not_parsed_as_fts_syntax(self):
+        self.assertEqual(self.search(q='choc" OR "coca'), [])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class SkuLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Drinks")
+        self.product = Products.objects.create(
+            name="Water 1.5l",
+            unit_price=Decimal("0.80"),
+            category=category,
+            sku="6001234500012",
+            stock_quantity=24,
+        )
+        self.index = SkuIndex()
+        self.index.max_staleness = 0
+        self.index.warm()
+        patcher = mock.patch("products.views.sku_index", self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scan_is_served_without_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("product-sku", args=[self.product.sku]))
+        self.assertEqual(response.json()["name"], "Water 1.5l")
+        missing = self.client.get(reverse("product-sku", args=["unknown"]))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_changes_are_picked_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.sku = "6001234500029"
+            self.product.unit_price = Decimal("0.90")
+            self.product.save()
+        self.assertIsNone(self.index.get("6001234500012"))
+        self.assertEqual(self.index.get("6001234500029")["unit_price"], "0.90")
+
+    def test_deletions_are_evicted_without_reloading(self):
+        other = Products.objects.create(
+            name="Water 0.5l",
+            unit_price=Decimal("0.50"),
+            category=self.product.category,
+            sku="6001234500036",
+            stock_quantity=12,
+        )
+        self.index.get(other.sku)  # Stored by the database fallback
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        with mock.patch.object(self.index, "warm") as warm:
+            self.assertIsNone(self.index.get("6001234500012"))
+        warm.assert_not_called()
+        self.assertEqual(list(self.index.products), [other.sku])
+        # A deletion log the index cannot follow (e.g. cleared) reloads it
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        cache.delete("catalog:deletions")
+        self.assertIsNone(self.index.get(other.sku))
+        self.assertEqual(self.index.products, {})
+
+    def test_scans_show_stock_after_a_sale(self):
+        from sales.stock import deduct
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deduct({self.product.pk: 4})
+        # Within STOCK_STALENESS of the last stock version, like product pages
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.get(self.product.sku)["stock_quantity"], 24)
+        with mock.patch("products.cache.STOCK_STALENESS", 0):
+            with mock.patch.object(self.index, "warm") as warm:
+                # Only the stock is re-read, once per stock version
+                with self.assertNumQueries(1):
+                    data = self.index.get(self.product.sku)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.index.get(self.product.sku), data)
+            warm.assert_not_called()
+        self.assertEqual(data["stock_quantity"], 20)
+        self.assertEqual(data["name"], "Water 1.5l")
+
+    def test_bulk_resolve(self):
+        response = self.client.post(
+            reverse("product-sku-resolve"),
+            {"skus": [self.product.sku, "unknown"]},
+            content_type="application/json",
+        )
+        body = response.json()
+        self.assertEqual(list(body["products"]), [self.product.sku])
+        self.assertEqual(body["missing"], ["unknown"])
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Snacks")
+        self.product = Products.objects.create(
+            name="Chips",
+            unit_price=Decimal("1.00"),
+            category=self.category,
+            sku="CHIPS",
+            stock_quantity=10,
+        )
+        self.url = reverse("product-import")
+
+    def post(self, body, content_type, **params):
+        url = self.url
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        return self.client.post(url, body, content_type=content_type)
+
+    def test_csv_upserts_by_sku_and_reports_bad_rows(self):
+        body = (
+            "sku,name,unit_price,category,stock_quantity\n"
+            "CHIPS,Chips XL,1.50,Snacks,12\n"
+            "NUTS,Nuts,2.00,Snacks,5\n"
+            "BAD,Bad,not-a-price,Snacks,1\n"
+            "SODA,Soda,1.00,Drinks,3\n"
+        )
+        response = self.post(body, "text/csv")
+        self.assertEqual(response.status_code, 200)
+        report = response.json()["content"]
+        self.assertEqual((report["created"], report["updated"]), (1, 1))
+        self.assertEqual(
+            [(error["row"], list(error["errors"])) for error in report["errors"]],
+            [(3, ["unit_price"]), (4, ["category"])],
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, "Chips XL")
+        self.assertEqual(self.product.stock_quantity, 12)
+        self.assertTrue(Products.objects.filter(sku="NUTS").exists())
+
+    def test_json_array_and_category_creation(self):
+        rows = [
+            {
+                "sku": f"SODA-{i}",
+                "name": f"Soda {i}",
+                "unit_price": "1.00",
+                "category": "Drinks",
+                "stock_quantity": i,
+            }
+            for i in range(25)
+        ]
+        rows.append(
+            {
+                "sku": "CHIPS",
+                "name": "Chips",
+                "unit_price": "1.00",
+                "category": "Snacks",
+                "stock_quantity": 10,
+            }
+        )
+        rows.append("not a product")
+        response = self.post(
+            json.dumps(rows), "application/json", create_categories="true"
+        )
+        report = response.json()["content"]
+        self.assertEqual(report["created"], 25)
+        self.assertEqual(report["unchanged"], 1)
+        self.assertEqual(report["categories_created"], 1)
+        self.assertEqual(report["errors"][0]["row"], 27)
+        self.assertEqual(
+            Products.objects.filter(category__name="Drinks").count(), 25
+        )
+
+    def test_json_is_read_in_pieces(self):
+        rows = [
+            {
+                "sku": f"SKU-{i}",
+                "name": "Name " * 10,
+                "unit_price": "1.00",
+                "category": "Snacks",
+                "stock_quantity": 1,
+            }
+            for i in range(300)
+        ]
+        with mock.patch("products.importer.READ_SIZE", 7):
+            response = self.post(json.dumps(rows, indent=2), "application/json")
+        self.assertEqual(response.json()["content"]["created"], 300)
+
+    def test_malformed_files(self):
+        response = self.post('{"sku": "X"}', "application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()["content"]["aborted"])
+        response = self.post('[{"sku": "X"', "application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post("x", "text/plain").status_code, 400)
+
+    def test_import_bumps_catalog_version_once(self):
+        body = "sku,name,unit_price,category,stock_quantity\n" + "".join(
+            f"S{i},Item,1.00,Snacks,1\n" for i in range(50)
+        )
+        with mock.patch("products.importer.invalidate_catalog") as invalidate:
+            # Categories once, then per batch: savepoint, SKU lookup, upsert,
+            # ledger movements, release
+            with self.assertNumQueries(6):
+                self.post(body, "text/csv")
+        invalidate.assert_called_once()
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("sku,name,unit_price,category,stock_quantity\n")
+            file.write("CHIPS,Chips,1.00,Snacks,99\n")
+        self.addCleanup(os.unlink, file.name)
+        output = StringIO()
+        call_command("import_products", file.name, stdout=output, stderr=StringIO())
+        self.assertIn("1 updated", output.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 99)
+
+
+class ProductAdjustTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Snacks")
+        self.products = Products.objects.bulk_create(
+            Products(
+                name=f"Product {i}",
+                unit_price=Decimal("1.00"),
+                category=category,
+                sku=f"SKU-{i}",
+                stock_quantity=10,
+            )
+            for i in range(100)
+        )
+        self.url = reverse("product-adjust")
+
+    def adjust(self, adjustments):
+        return self.client.post(
+            self.url, {"adjustments": adjustments}, content_type="application/json"
+        )
+
+    def stock(self):
+        return dict(Products.objects.values_list("sku", "stock_quantity"))
+
+    def test_prices_and_stock_in_one_request(self):
+        response = self.adjust(
+            [
+                {"product": self.products[0].pk, "unit_price": "2.25"},
+                {"sku": "SKU-1", "stock_delta": 5},
+                {"sku": "SKU-2", "stock_delta": -10, "unit_price": "0.50"},
+                {"product": self.products[3].pk, "stock_quantity": 0},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["products"]), 4)
+        stock = self.stock()
+        self.assertEqual(
+            [stock[f"SKU-{i}"] for i in range(5)], [10, 15, 0, 0, 10]
+        )
+        prices = dict(Products.objects.values_list("sku", "unit_price"))
+        self.assertEqual(prices["SKU-0"], Decimal("2.25"))
+        self.assertEqual(prices["SKU-2"], Decimal("0.50"))
+        self.assertEqual(prices["SKU-1"], Decimal("1.00"))
+
+    def test_batch_is_all_or_nothing(self):
+        response = self.adjust(
+            [{"sku": "SKU-0", "stock_delta": 3}, {"sku": "SKU-1", "stock_delta": -11}]
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["products"], {str(self.products[1].pk): "10"})
+        self.assertEqual(set(self.stock().values()), {10})
+        response = self.adjust(
+            [{"sku": "SKU-0", "stock_delta": 3}, {"sku": "nope", "stock_delta": 1}]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("1", response.json()["adjustments"])
+        response = self.adjust([{"sku": "SKU-0"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(self.stock().values()), {10})
+
+    def test_constant_queries_and_one_version_bump(self):
+        lines = [{"product": p.pk, "stock_delta": 1} for p in self.products]
+        version = catalog_version()
+        with mock.patch(
+            "products.adjustments.invalidate_catalog",
+            wraps=lambda: bump_catalog_version(),
+        ) as invalidate:
+            # Lookup, savepoint, UPDATE, ledger movements, release, then the
+            # products returned
+            with self.assertNumQueries(6):
+                self.assertEqual(self.adjust(lines).status_code, 200)
+        invalidate.assert_called_once()
+        self.assertGreater(catalog_version(), version)
+        self.assertEqual(set(self.stock().values()), {11})
+
+
+class LowStockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Snacks")
+        self.products = Products.objects.bulk_create(
+            Products(
+                name=f"Product {i}",
+                unit_price=Decimal("1.00"),
+                category=category,
+                sku=f"SKU-{i}",
+                stock_quantity=10,
+                reorder_level=5 if i % 2 else None,
+            )
+            for i in range(6)
+        )
+        self.url = reverse("product-low-stock")
+
+    def low(self):
+        return [row["sku"] for row in self.client.get(self.url).json()["results"]]
+
+    def alerts(self, **params):
+        return self.client.get(reverse("stock-alert-feed"), params).json()
+
+    # Cached pages follow stock levels without delay (see STOCK_STALENESS)
+    @mock.patch("products.cache.STOCK_STALENESS", 0)
+    def test_every_stock_change_updates_the_low_stock_list(self):
+        from sales.stock import deduct, restore
+
+        first, second, third = [p.pk for p in self.products[1::2]]
+        self.assertEqual(self.low(), [])
+        # Sales (the stock version moves on commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            deduct({first: 5, third: 1})
+        self.assertEqual(self.low(), ["SKU-1"])
+        with self.captureOnCommitCallbacks(execute=True):
+            restore({first: 1})
+        self.assertEqual(self.low(), [])
+        # Batch adjustments, of the stock or of the reorder level
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("product-adjust"),
+                {
+                    "adjustments": [
+                        {"product": second, "stock_quantity": 2},
+                        {"product": third, "reorder_level": 9},
+                        {"sku": "SKU-0", "reorder_level": 20},
+                    ]
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.low(), ["SKU-0", "SKU-3", "SKU-5"])
+        # Product edits
+        url = reverse("product-list-update-delete", args=[self.products[0].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                url, {"reorder_level": None}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.low(), ["SKU-3", "SKU-5"])
+
+        alerts = self.alerts()["alerts"]
+        self.assertEqual(
+            [(a["product"], a["low"], a["stock_quantity"]) for a in alerts],
+            [
+                (first, True, 5),
+                (first, False, 6),
+                # One UPDATE for the batch, which SQLite applies in id order
+                (self.products[0].pk, True, 10),
+                (second, True, 2),
+                (third, True, 9),
+                (self.products[0].pk, False, 10),
+            ],
+        )
+
+    def test_alert_feed_resumes_after_the_last_alert(self):
+        Products.objects.filter(reorder_level=5).update(stock_quantity=0)
+        body = self.alerts(limit=2, expand="product", fields="id,product.sku")
+        self.assertEqual(
+            [alert["product"]["sku"] for alert in body["alerts"]], ["SKU-1", "SKU-3"]
+        )
+        self.assertEqual(body["last"], body["alerts"][-1]["id"])
+        rest = self.alerts(after=body["last"])
+        self.assertEqual([a["low"] for a in rest["alerts"]], [True])
+        self.assertEqual(
+            self.alerts(after=rest["last"]), {"last": rest["last"], "alerts": []}
+        )
+        response = self.client.get(reverse("stock-alert-feed"), {"after": -1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_low_stock_list_reads_only_the_partial_index(self):
+        Products.objects.filter(reorder_level=5).update(stock_quantity=0)
+        plan = low_stock_products().order_by("id").filter(id__gt=0)[:51].explain()
+        self.assertIn("products_low_stock", plan)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.low(), ["SKU-1", "SKU-3", "SKU-5"])
+
+    def test_triggers_are_restored_after_migrate(self):
+        drop_stock_alerts(connection)
+        Products.objects.filter(pk=self.products[1].pk).update(stock_quantity=0)
+        self.assertFalse(StockAlert.objects.exists())
+        ensure_stock_alerts(sender=None, using="default")
+        Products.objects.filter(pk=self.products[3].pk).update(stock_quantity=0)
+        self.assertEqual(
+            list(StockAlert.objects.values_list("product", flat=True)),
+            [self.products[3].pk],
+        )
+        self.assertEqual(self.low(), ["SKU-1", "SKU-3"])
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(name="Snacks")
+        response = self.client.post(
+            reverse("product-list-create"),
+            {
+                "name": "Chips",
+                "unit_price": "1.00",
+                "category": Category.objects.get().pk,
+                "sku": "CHIPS",
+                "stock_quantity": 10,
+            },
+            content_type="application/json",
+        )
+        self.product = Products.objects.get(pk=response.json()["product"]["id"])
+
+    def movements(self):
+        return list(
+            StockMovement.objects.order_by("id").values_list(
+                "reason", "quantity", "reference"
+            )
+        )
+
+    def test_every_stock_change_is_recorded(self):
+        from sales.checkout import checkout
+
+        url = reverse("product-list-update-delete", args=[self.product.pk])
+        self.client.patch(url, {"stock_quantity": 12}, content_type="application/json")
+        self.client.patch(url, {"name": "Crisps"}, content_type="application/json")
+        self.client.post(
+            reverse("product-adjust"),
+            {"adjustments": [{"sku": "CHIPS", "stock_delta": 5}]},
+            content_type="application/json",
+        )
+        self.client.post(
+            reverse("product-adjust"),
+            {"adjustments": [{"sku": "CHIPS", "stock_quantity": 3}]},
+            content_type="application/json",
+        )
+        self.client.post(
+            reverse("product-import"),
+            "sku,name,unit_price,category,stock_quantity\n"
+            "CHIPS,Crisps,1.00,Snacks,20\nNUTS,Nuts,2.00,Snacks,7\n",
+            content_type="text/csv",
+        )
+        sale = checkout([{"product": self.product.pk, "quantity": 4}], "cash")
+        sale.status = "cancelled"
+        sale.save()
+
+        self.assertEqual(
+            self.movements(),
+            [
+                ("receipt", 10, ""),
+                ("adjustment", 2, ""),
+                ("receipt", 5, "adjust"),
+                ("adjustment", -14, "adjust"),
+                ("receipt", 7, "import"),
+                ("adjustment", 17, "import"),
+                ("sale", -4, f"sale {sale.pk}"),
+                ("cancellation", 4, f"sale {sale.pk}"),
+            ],
+        )
+        self.assertEqual(ledger.reconcile(workers=1), [])
+
+    def test_edits_keep_sales_made_since_the_product_was_loaded(self):
+        from sales.checkout import checkout
+
+        product = Products.objects.get(pk=self.product.pk)
+        checkout([{"product": product.pk, "quantity": 4}], "cash")
+        product.name = "Crisps"
+        product.save()
+        self.assertEqual(product.stock_quantity, 6)
+
+        product = Products.objects.get(pk=self.product.pk)
+        checkout([{"product": product.pk, "quantity": 2}], "cash")
+        product.stock_quantity += 5  # Received 5 more, on a stale copy
+        product.save()
+        self.assertEqual(product.stock_quantity, 9)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, "Crisps")
+        self.assertEqual(self.product.stock_quantity, 9)
+        self.assertEqual(
+            [(reason, quantity) for reason, quantity, _ in self.movements()],
+            [("receipt", 10), ("sale", -4), ("sale", -2), ("adjustment", 5)],
+        )
+        self.assertEqual(ledger.reconcile(workers=1), [])
+
+    def test_stock_at_reads_the_last_snapshot_and_the_movements_after_it(self):
+        now = timezone.now()
+        StockMovement.objects.update(created_at=now - timedelta(days=10))
+        for days, quantity in [(8, -3), (5, 4), (2, -1)]:
+            StockMovement.objects.create(
+                product=self.product,
+                quantity=quantity,
+                reason="sale",
+                created_at=now - timedelta(days=days),
+            )
+        for days, quantity in {9: 10, 7: 7, 5: 11, 1: 10}.items():
+            at = now - timedelta(days=days)
+            self.assertEqual(ledger.stock_at(self.product.pk, at), quantity)
+        self.assertEqual(ledger.take_snapshots(at=now - timedelta(days=6)), 1)
+        self.assertEqual(ledger.take_snapshots(at=now - timedelta(days=6)), 0)
+        # Movements before the snapshot are no longer needed
+        StockMovement.objects.filter(created_at__lt=now - timedelta(days=6)).delete()
+        for days, quantity in {5: 11, 1: 10}.items():
+            at = now - timedelta(days=days)
+            self.assertEqual(ledger.stock_at(self.product.pk, at), quantity)
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual(snapshot.stock_quantity, 7)
+
+        url = reverse("product-stock", args=[self.product.pk])
+        with self.assertNumQueries(1):
+            body = self.client.get(url, {"at": (now - timedelta(days=3)).isoformat()})
+        self.assertEqual(body.json()["stock_quantity"], "11.00")
+        self.assertEqual(self.client.get(url).json()["stock_quantity"], "10.00")
+        missing = reverse("product-stock", args=[self.product.pk + 100])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_movements_are_listed_newest_first(self):
+        url = reverse("product-list-update-delete", args=[self.product.pk])
+        self.client.patch(url, {"stock_quantity": 8}, content_type="application/json")
+        body = self.client.get(reverse("product-movements", args=[self.product.pk]))
+        rows = body.json()["results"]
+        self.assertEqual([row["quantity"] for row in rows], ["-2.00", "10.00"])
+        self.assertEqual(rows[0]["reason"], "adjustment")
+
+    def test_reconcile_command_reports_and_fixes_drift(self):
+        Products.objects.filter(pk=self.product.pk).update(stock_quantity=6)
+        output = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 products disagree"):
+            call_command("reconcile_stock", workers=1, stdout=output)
+        self.assertIn(
+            f"Product {self.product.pk}: stock 6, ledger 10", output.getvalue()
+        )
+        call_command("reconcile_stock", workers=1, fix=True, stdout=output)
+        self.assertEqual(self.movements()[-1], ("correction", -4, "reconcile"))
+        call_command("reconcile_stock", workers=1, stdout=output)
+        self.assertIn("Stock matches the ledger.", output.getvalue())
+
+
+class ParallelReconcileTests(TransactionTestCase):
+    def test_chunks_are_checked_in_parallel(self):
+        category = Category.objects.create(name="Snacks")
+        for i in range(10):
+            Products.objects.create(
+                name=f"Product {i}",
+                unit_price=Decimal("1.00"),
+                category=category,
+                sku=f"SKU-{i}",
+                stock_quantity=i,
+            )
+        drifted = Products.objects.filter(sku__in=["SKU-3", "SKU-8"])
+        drifted.update(stock_quantity=100)
+        found = ledger.reconcile(chunk_size=3, workers=3)
+        self.assertEqual(
+            [(stock, expected) for _, stock, expected in found], [(100, 3), (100, 8)]
+        )
+        expected_ids = sorted(drifted.values_list("pk", flat=True))
+        self.assertEqual([pk for pk, _, _ in found], expected_ids)
@@ -4,6 +4,16 @@ from .views import (
     CategoryUpdateListView,
     ProductListUpdateView,
     ProductListCreateView,
+    ProductChangesView,
+    ProductSearchView,
+    ProductSkuView,
+    ProductSkuResolveView,
+    ProductImportView,
+    ProductAdjustView,
+    ProductLowStockView,
+    StockAlertFeedView,
+    ProductStockView,
+    ProductMovementsView,
 )
 
 urlpatterns = [
@@ -20,6 +30,46 @@ urlpatterns = [
         ProductListUpdateView.as_view(),
         name="product-list-update-delete",
     ),
+    # Inventory ledger of a product
+    # GET: /products/<id>/stock/?at=<time> - stock level at a point in time
+    # GET: /products/<id>/movements/ - stock movements, newest first
+    path("products/<int:pk>/stock/", ProductStockView.as_view(), name="product-stock"),
+    path(
+        "products/<int:pk>/movements/",
+        ProductMovementsView.as_view(),
+        name="product-movements",
+    ),
+    # Incremental catalog refresh
+    # GET: /products/changes/?since=<version> - products changed since a version
+    path(
+        "products/changes/", ProductChangesView.as_view(), name="product-changes"
+    ),
+    # Products that need reordering and the alerts raised as stock crosses
+    # reorder levels
+    # GET: /products/low-stock/ - products at or below their reorder level
+    # GET: /products/low-stock/alerts/?after=<id> - alerts recorded after an alert
+    path(
+        "products/low-stock/", ProductLowStockView.as_view(), name="product-low-stock"
+    ),
+    path(
+        "products/low-stock/alerts/",
+        StockAlertFeedView.as_view(),
+        name="stock-alert-feed",
+    ),
+    # Search products by name or SKU
+    # GET: /products/search/?q=<text>&category=<id> - ranked matching products
+    path("products/search/", ProductSearchView.as_view(), name="product-search"),
+    # Bulk import of a supplier catalog
+    # POST: /products/import/ - upserts products by SKU from a CSV or JSON file
+    path("products/import/", ProductImportView.as_view(), name="product-import"),
+    # Batch price changes and stock receiving
+    # POST: /products/adjust/ - applies many adjustments in one transaction
+    path("products/adjust/", ProductAdjustView.as_view(), name="product-adjust"),
+    # Barcode scans by SKU
+    # POST: /products/sku/ - resolves a list of SKUs in one request
+    # GET: /products/sku/<sku>/ - returns the product with that SKU
+    path("products/sku/", ProductSkuResolveView.as_view(), name="product-sku-resolve"),
+    path("products/sku/<path:sku>/", ProductSkuView.as_view(), name="product-sku"),
     # List all categories or create a new category
     # GET: /category/ - returns all categories
     # POST: /category/ - creates a new category
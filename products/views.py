@@ -1,23 +1,62 @@
 from django.http import Http404
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from .models import Products, Category
-from .serializers import ProductSerializer, CategorySerializer
+from .models import Products, Category, StockMovement
+from .serializers import (
+    ProductSerializer,
+    CategorySerializer,
+    CatalogChangesSerializer,
+    ProductSearchSerializer,
+    SkuResolveSerializer,
+    ProductImportOptionsSerializer,
+    ProductBatchAdjustmentSerializer,
+    StockAlertSerializer,
+    StockAlertFeedSerializer,
+    StockLevelQuerySerializer,
+    StockLevelSerializer,
+    StockMovementSerializer,
+)
+from .adjustments import adjust_products
+from .importer import IMPORT_FORMATS, import_products
+from .ledger import stock_at
+from .low_stock import alerts_after, low_stock_products
+from .search import search_products
+from .sku_index import sku_index
+from .cache import catalog_cached, catalog_version, changes_since
+from retail_software.pagination import KeysetPagination, ordering_fields
+from retail_software.rows import RowSerializer
+
+# Read-only fast path for product reads (same output as ProductSerializer)
+PRODUCT_ROWS = RowSerializer(
+    ProductSerializer, expandable={"category": CategorySerializer}
+)
+STOCK_ALERT_ROWS = RowSerializer(
+    StockAlertSerializer, expandable={"product": ProductSerializer}
+)
 
 
 # Product Views
 class ProductListCreateView(APIView):
     """
     Handles listing all products and creating a new product.
-    GET: Returns a list of all products.
+    GET: Returns a page of products (cursor paginated).
+    `fields` selects the fields to return (e.g. ?fields=id,name,unit_price)
+    and `expand=category` returns the category as an object.
     POST: Creates a new product with the provided data.
     """
 
+    pagination_class = KeysetPagination
+    ordering = ("id",)
+
+    @catalog_cached(stock=True)
     def get(self, request):
-        products = Products.objects.all()  # Fetch all products
-        serializer = ProductSerializer(products, many=True)  # Serialize product list
-        return Response(serializer.data)
+        rows = PRODUCT_ROWS.for_request(request)  # Only the requested fields
+        products = rows.values(Products.objects.all(), *ordering_fields(self.ordering))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)  # One page
+        return paginator.get_paginated_response(rows.serialize(page))
 
     def post(self, request):
         serializer = ProductSerializer(data=request.data)  # Deserialize input data
@@ -34,7 +73,8 @@ class ProductListCreateView(APIView):
 class ProductListUpdateView(APIView):
     """
     Handles retrieving, updating, and deleting a single product by its ID.
-    GET: Returns details of a specific product.
+    GET: Returns details of a specific product (supports `fields` and
+    `expand` like the product list).
     PUT: Updates a product with the provided data.
     DELETE: Deletes the specified product.
     """
@@ -46,10 +86,10 @@ class ProductListUpdateView(APIView):
         except Products.DoesNotExist:
             raise Http404
 
+    @catalog_cached(stock=True)
     def get(self, request, pk):
-        product = self.get_object(pk)  # Get product by ID
-        serializer = ProductSerializer(product)  # Serialize product
-        return Response(serializer.data)
+        rows = PRODUCT_ROWS.for_request(request)  # Only the requested fields
+        return Response(rows.get(Products.objects.filter(pk=pk)))
 
     def put(self, request, pk):
         product = self.get_object(pk)
@@ -88,22 +128,179 @@ class ProductListUpdateView(APIView):
         return Response(response, status=status.HTTP_200_OK)
 
 
+class ProductStockView(APIView):
+    """
+    Handles stock-at-time queries on the inventory ledger.
+    GET: Returns the product's stock at the time `at` (ISO 8601, default
+    now) according to the ledger: its last snapshot before then plus the
+    movements since.
+    """
+
+    def get(self, request, pk):
+        serializer = StockLevelQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        at = serializer.validated_data.get("at", timezone.now())
+        quantity = stock_at(pk, at)
+        if quantity is None:
+            raise Http404
+        level = {"product": pk, "at": at, "stock_quantity": quantity}
+        return Response(StockLevelSerializer(level).data)
+
+
+class ProductMovementsView(APIView):
+    """
+    Handles a product's inventory ledger.
+    GET: Returns a page of the product's stock movements (sales,
+    cancellations, receipts, adjustments and corrections), newest first
+    (cursor paginated).
+    """
+
+    pagination_class = KeysetPagination
+    ordering = ("-created_at", "-id")
+
+    def get(self, request, pk):
+        if not Products.objects.filter(pk=pk).exists():
+            raise Http404
+        movements = StockMovement.objects.filter(product=pk)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(movements, request, view=self)  # One page
+        serializer = StockMovementSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ProductChangesView(APIView):
+    """
+    Handles incremental catalog refreshes for cashier terminals.
+    GET: Returns the products changed since the catalog version in `since`,
+    together with the current version to use on the next call.
+    `full_refresh` is true when products were deleted since then or when
+    too many changed, in which case the terminal should reload the catalog.
+    """
+
+    limit = 1000  # Above this many changes a full reload is cheaper
+
+    def get(self, request):
+        serializer = CatalogChangesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since = serializer.validated_data["since"]
+        version = catalog_version()  # Read before querying so nothing is skipped
+        products, full_refresh = changes_since(since, self.limit)
+        changes = [] if full_refresh else ProductSerializer(products, many=True).data
+        return Response(
+            {"version": version, "full_refresh": full_refresh, "products": changes}
+        )
+
+
+class ProductLowStockView(APIView):
+    """
+    Handles the list of products that need reordering.
+    GET: Returns a page of the products whose stock is at or below their
+    reorder level (cursor paginated, with `fields` and `expand` like the
+    product list). Served from a partial index holding only those
+    products, so its cost does not grow with the catalog.
+    """
+
+    pagination_class = KeysetPagination
+    ordering = ("id",)
+
+    @catalog_cached(stock=True)
+    def get(self, request):
+        rows = PRODUCT_ROWS.for_request(request)  # Only the requested fields
+        products = rows.values(low_stock_products(), *ordering_fields(self.ordering))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)  # One page
+        return paginator.get_paginated_response(rows.serialize(page))
+
+
+class StockAlertFeedView(APIView):
+    """
+    Handles the feed of reorder alerts, recorded whenever a product's stock
+    falls to its reorder level (`low` true) or goes back above it (false).
+    GET: Returns up to `limit` alerts recorded after the alert `after`, in
+    order, and `last`, the id to pass as `after` on the next call.
+    `expand=product` returns the products as objects.
+    """
+
+    def get(self, request):
+        serializer = StockAlertFeedSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        after = serializer.validated_data["after"]
+        rows = STOCK_ALERT_ROWS.for_request(request)  # Only the requested fields
+        alerts = rows.values(
+            alerts_after(after, serializer.validated_data["limit"]), "id"
+        )
+        page = list(alerts)
+        last = page[-1].id if page else after
+        return Response({"last": last, "alerts": rows.serialize(page)})
+
+
+class ProductSearchView(APIView):
+    """
+    Handles the cashier's product search.
+    GET: Returns the products whose name or SKU contains `q` (ranked,
+    prefix matches first), optionally filtered by `category`.
+    """
+
+    def get(self, request):
+        serializer = ProductSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        products = search_products(
+            serializer.validated_data["q"],
+            category=serializer.validated_data.get("category"),
+            limit=serializer.validated_data["limit"],
+        )
+        return Response({"results": ProductSerializer(products, many=True).data})
+
+
+class ProductSkuView(APIView):
+    """
+    Handles barcode scans, served from the in-process SKU index.
+    GET: Returns the product with the given SKU.
+    """
+
+    def get(self, request, sku):
+        product = sku_index.get(sku)
+        if product is None:
+            raise Http404
+        return Response(product)
+
+
+class ProductSkuResolveView(APIView):
+    """
+    Handles resolving many scanned SKUs in one request.
+    POST: Takes {"skus": [...]} and returns the products found, keyed by SKU,
+    and the list of SKUs that matched no product.
+    """
+
+    def post(self, request):
+        serializer = SkuResolveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        skus = serializer.validated_data["skus"]
+        products = sku_index.get_many(skus)
+        missing = [sku for sku in skus if sku not in products]
+        return Response({"products": products, "missing": missing})
+
+
 # Category Views
 
 
 class CategoryCreateListView(APIView):
     """
     Handles listing all categories and creating a new category.
-    GET: Returns a list of all categories.
+    GET: Returns a page of categories (cursor paginated).
     POST: Creates a new category with the provided data.
     """
 
+    pagination_class = KeysetPagination
+    ordering = ("id",)
+
+    @catalog_cached
     def get(self, request):
-        categories = Category.objects.all()  # Fetch all categories
-        serializer = CategorySerializer(
-            categories, many=True
-        )  # Serialize category list
-        return Response(serializer.data)
+        categories = Category.objects.all()  # Fetch categories
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(categories, request, view=self)  # One page
+        serializer = CategorySerializer(page, many=True)  # Serialize category page
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = CategorySerializer(data=request.data)  # Deserialize input data
@@ -132,6 +329,7 @@ class CategoryUpdateListView(APIView):
         except Category.DoesNotExist:
             raise Http404
 
+    @catalog_cached
     def get(self, request, pk):
         category = self.get_object(pk)  # Get category by ID
         serializer = CategorySerializer(category)  # Serialize category
@@ -158,3 +356,69 @@ class CategoryUpdateListView(APIView):
             "message": "Category deleted successfully",
         }
         return Response(response, status=status.HTTP_200_OK)
+
+
+class ProductImportView(APIView):
+    """
+    Handles bulk loading of supplier catalogs.
+    POST: Takes a CSV file (with a header line) or a JSON array of products,
+    either as the raw request body (Content-Type text/csv or application/json)
+    or as a multipart upload named `file`, and upserts them by SKU.
+    Each product gives sku, name, unit_price, category (by name) and
+    stock_quantity. Invalid rows are skipped and listed in the report.
+    Set `create_categories=true` to create categories that do not exist.
+    """
+
+    def get_upload(self, request):
+        # Returns (binary stream, format) or (None, None) if not understood
+        media_type = request.content_type.split(";")[0].strip().lower()
+        if media_type == "multipart/form-data":
+            upload = request.FILES.get("file")
+            if upload is None:
+                return None, None
+            name = upload.name.lower()
+            import_format = next(
+                (fmt for fmt in IMPORT_FORMATS if name.endswith(f".{fmt}")), None
+            )
+            return upload, import_format
+        import_format = {"text/csv": "csv", "application/json": "json"}.get(media_type)
+        return request.stream, import_format
+
+    def post(self, request):
+        options = ProductImportOptionsSerializer(data=request.query_params)
+        options.is_valid(raise_exception=True)
+        stream, import_format = self.get_upload(request)
+        if stream is None or import_format is None:
+            return Response(
+                {"message": "Send a CSV or JSON file as the body or as `file`."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        report = import_products(
+            stream, import_format, options.validated_data["create_categories"]
+        )
+        if report["aborted"]:
+            message, code = "Import stopped early", status.HTTP_400_BAD_REQUEST
+        else:
+            message, code = "Import finished", status.HTTP_200_OK
+        return Response({"message": message, "content": report}, status=code)
+
+
+class ProductAdjustView(APIView):
+    """
+    Handles price changes and stock receiving for many products at once.
+    POST: Takes {"adjustments": [...]}, each line naming a product by `product`
+    (id) or `sku` and giving a new `unit_price` and/or a `stock_delta` or an
+    absolute `stock_quantity`. All lines are applied in one transaction, or
+    none if any product is missing or would end up with negative stock.
+    """
+
+    def post(self, request):
+        serializer = ProductBatchAdjustmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = adjust_products(serializer.validated_data["adjustments"])
+        products = Products.objects.filter(pk__in=ids).order_by("id")
+        response = {
+            "message": "Products adjusted successfully",
+            "products": ProductSerializer(products, many=True).data,
+        }
+        return Response(response, status=status.HTTP_200_OK)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'retail_software.settings')
 
 application = get_asgi_application()
+
+# Load the SKU -> product map once per worker so scans skip the database
+from products.sku_index import warm_sku_index  # noqa: E402
+
+warm_sku_index()
@@ -0,0 +1,228 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds (seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_enabled():
+    return settings.PERFORMANCE_METRICS.get("ENABLED", False)
+
+
+def format_labels(names, values):
+    pairs = (
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A Prometheus counter with labels, e.g. requests per route and status.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, description, labels):
+        self.name, self.description, self.labels = name, description, labels
+        self.lock = threading.Lock()
+        self.values = {}  # Label values -> count
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Gauge:
+    """
+    A Prometheus gauge whose values are read when the metrics are scraped:
+    `collect` returns a label values -> value map, e.g. queue depths read
+    from the database.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, description, labels, collect):
+        self.name, self.description, self.labels = name, description, labels
+        self.collect = collect
+
+    def clear(self):
+        pass  # Nothing is kept between scrapes
+
+    def samples(self):
+        for labels, value in sorted(self.collect().items()):
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Histogram:
+    """
+    A Prometheus histogram with labels. Each observation costs one bisect
+    and a few additions under a lock; buckets are made cumulative only
+    when the metrics are scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels, buckets):
+        self.name, self.description, self.labels = name, description, labels
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}  # Label values -> [count per bucket..., +Inf, sum]
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def clear(self):
+        with self.lock:
+            self.series = {}
+
+    def samples(self):
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    format_labels(self.labels + ("le",), labels + (bound,)),
+                    cumulative,
+                )
+            label_text = format_labels(self.labels, labels)
+            yield f"{self.name}_sum", label_text, values[-1]
+            yield f"{self.name}_count", label_text, cumulative
+
+
+class Registry:
+    """
+    The metrics of this process. Each worker process keeps its own, so
+    Prometheus should scrape every worker (or run a single one per host).
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+ROUTE_LABELS = ("route", "method")
+
+requests_total = registry.register(
+    Counter(
+        "http_requests_total",
+        "Requests handled, by route, method and status code.",
+        ROUTE_LABELS + ("status",),
+    )
+)
+request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time spent handling a request, middleware included.",
+        ROUTE_LABELS,
+        DURATION_BUCKETS,
+    )
+)
+view_duration = registry.register(
+    Histogram(
+        "http_request_view_seconds",
+        "Time spent in the view outside the database (serialization included).",
+        ROUTE_LABELS,
+        DURATION_BUCKETS,
+    )
+)
+db_duration = registry.register(
+    Histogram(
+        "http_request_db_seconds",
+        "Time spent running database queries for a request.",
+        ROUTE_LABELS,
+        DURATION_BUCKETS,
+    )
+)
+render_duration = registry.register(
+    Histogram(
+        "http_request_render_seconds",
+        "Time spent rendering the response body (DRF renderers).",
+        ROUTE_LABELS,
+        DURATION_BUCKETS,
+    )
+)
+query_count = registry.register(
+    Histogram(
+        "http_request_queries",
+        "Database queries run for a request.",
+        ROUTE_LABELS,
+        QUERY_BUCKETS,
+    )
+)
+
+
+def has_metrics_token(authorization):
+    # Whether an Authorization header carries PERFORMANCE_METRICS["TOKEN"]
+    token = settings.PERFORMANCE_METRICS.get("TOKEN")
+    return bool(token) and constant_time_compare(authorization, f"Bearer {token}")
+
+
+def may_read_metrics(request):
+    # Staff users, or scrapers sending the metrics token
+    authorization = request.headers.get("Authorization", "")
+    return has_metrics_token(authorization) or request.user.is_staff
+
+
+def metrics_view(request):
+    """
+    Exposes the request metrics in the Prometheus text format.
+    Not found when the metrics are disabled, and forbidden to anyone but
+    staff users and scrapers with the metrics token: route-level traffic
+    and latency are not for the public.
+    """
+    if not metrics_enabled():
+        raise Http404
+    if not may_read_metrics(request):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
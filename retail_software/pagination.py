@@ -0,0 +1,150 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def ordering_fields(ordering):
+    # Field names of an ordering, without the "-" of descending fields
+    return [field.lstrip("-") for field in ordering]
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination for list endpoints.
+
+    Rows are ordered by the view's `ordering` (a tuple of field names whose
+    last entry must be unique, usually the primary key as tie-breaker).
+    The cursor stores the ordering values of the last row of a page, and the
+    next page is fetched with a WHERE clause on those values instead of an
+    OFFSET, so page N costs the same as page 1 when an index matches the
+    ordering.
+
+    Query parameters:
+        cursor    - opaque cursor taken from the `next` link of a previous page
+        page_size - number of rows per page (capped at `max_page_size`)
+    """
+
+    page_size = 50
+    max_page_size = 500
+    ordering = ("-id",)
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, "ordering", self.ordering)
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        # Fetch one extra row to know whether there is a next page
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def position_of(self, row):
+        # Ordering values of a row, in a JSON-friendly form
+        values = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            if isinstance(row, dict):
+                value = row[name]
+            elif isinstance(row, tuple):  # Named values_list() rows
+                value = getattr(row, name)
+            else:  # The column, so foreign keys give their id (no query)
+                value = getattr(row, row._meta.get_field(name).attname)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        return values
+
+    def after(self, position):
+        """
+        Build the WHERE clause selecting rows that sort after `position`:
+        (a > x) OR (a = x AND b > y) OR ... with the comparison flipped
+        for descending fields. The OR is ANDed with a plain range on the
+        first field (a >= x) so the database can seek into the index
+        instead of scanning it from the start.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        first = self.ordering[0]
+        bound = "lte" if first.startswith("-") else "gte"
+        return Q(**{f"{first.lstrip('-')}__{bound}": position[0]}) & condition
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        return self.parse_cursor(encoded, model)
+
+    def parse_cursor(self, encoded, model):
+        """
+        Decode a cursor into the ordering values of `model` it holds, each
+        converted by its model field, so a cursor that decodes but holds
+        values of the wrong type never reaches the query.
+        Raises NotFound for anything that is not a cursor for this ordering.
+        """
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(ordering_fields(self.ordering), position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:  # Ordering fields are never null
+            raise NotFound(self.invalid_cursor_message)
+        return values
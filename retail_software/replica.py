@@ -0,0 +1,174 @@
+import contextvars
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = "replica"  # Alias of the replica in settings.DATABASES
+PIN_COOKIE = "primary_pin"  # Set on clients that wrote recently
+
+# Database the current view's reads go to (None: the primary)
+_reads = contextvars.ContextVar("replica_reads", default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def snapshot_age():
+    # Seconds since the replica snapshot was refreshed, None if there is none
+    try:
+        return time.time() - os.stat(settings.REPLICA["SNAPSHOT"]).st_mtime
+    except OSError:
+        return None
+
+
+def replica_usable():
+    """
+    Whether the replica may serve reads: always for a streaming replica;
+    for a SQLite snapshot, while one exists that was refreshed less than
+    REPLICA["MAX_LAG"] seconds ago (e.g. not when the refresh stopped).
+    """
+    if not replica_configured():
+        return False
+    if not settings.REPLICA["SNAPSHOT"]:
+        return True
+    age = snapshot_age()
+    return age is not None and age < settings.REPLICA["MAX_LAG"]
+
+
+def alias_for(request):
+    # The database a @replica_reads view reads from for this request
+    if PIN_COOKIE in request.COOKIES or not replica_usable():
+        return None  # The client may read its own recent writes
+    return REPLICA
+
+
+@contextmanager
+def reading_from(alias):
+    # Route the reads of the block to `alias` (None: the primary)
+    token = _reads.set(alias)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def primary_reads():
+    # Route the reads of the block to the primary, e.g. data that is cached
+    return reading_from(None)
+
+
+def replica_reads(handler):
+    """
+    Decorator for read-only view handlers that can show data a little
+    behind the primary (reports, admin lists, exports): their queries go
+    to the replica while it is usable, so long reads do not compete with
+    checkout writes. Clients that wrote recently keep reading from the
+    primary (see PrimaryPinMiddleware), as does everything undecorated.
+    """
+
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        with reading_from(alias_for(request)):
+            return handler(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def stream_reads(iterable):
+    """
+    Keep the reads of a streamed response's `iterable` on the database the
+    view read from; it is consumed after the view has returned.
+    """
+    alias = _reads.get()  # Now, while the view runs
+
+    def stream():
+        iterator = iter(iterable)
+        while True:
+            with reading_from(alias):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    return stream()
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of @replica_reads views to the replica and every other
+    query to the primary ('default'): writes, reads elsewhere and
+    migrations, so read-after-write paths always see their writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _reads.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Even for objects read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Both databases hold the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class PrimaryPinMiddleware:
+    """
+    Pins clients to the primary for REPLICA["PIN_SECONDS"] after a write
+    (any request with an unsafe method), with a cookie, so that a report
+    or list read right after a checkout includes it even though the
+    replica has not caught up yet. Does nothing without a replica.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS") and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA["PIN_SECONDS"],
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+def refresh_snapshot(path=None, using=DEFAULT_DB_ALIAS):
+    """
+    Copy the primary SQLite database to the replica snapshot (default:
+    REPLICA["SNAPSHOT"]) with the online backup API, then swap it in
+    atomically. The copy is one read transaction: under WAL it does not
+    block writers, and queries already running on the old snapshot finish
+    on it. Returns the seconds the copy took.
+    """
+    source = connections[using]
+    if source.vendor != "sqlite":
+        raise ImproperlyConfigured("Snapshots are only made of SQLite databases.")
+    path = Path(path or settings.REPLICA["SNAPSHOT"])
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.unlink(missing_ok=True)
+    started = time.perf_counter()
+    source.ensure_connection()
+    target = sqlite3.connect(temporary)
+    try:
+        source.connection.backup(target)
+        # A rollback journal, so readers never look for a WAL of the old file
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+    os.replace(temporary, path)
+    return time.perf_counter() - started
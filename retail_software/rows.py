@@ -0,0 +1,381 @@
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import fields, relations, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+MAX_PROJECTIONS = 256  # ?fields=/?expand= variants compiled and kept per serializer
+
+# Fields whose representation of a database value is the value itself
+IDENTITY_FIELDS = (
+    fields.BooleanField,
+    fields.CharField,
+    fields.IntegerField,
+    fields.ReadOnlyField,
+)
+
+
+def decimal_converter(field):
+    # '{:f}' of the quantized value, as DecimalField does. Database values
+    # already have the field's decimal places, so quantizing can be skipped.
+    if (
+        not getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+        or field.localize
+        or field.normalize_output
+        or field.decimal_places is None
+    ):
+        return field.to_representation
+    places = field.decimal_places
+
+    def convert(value):
+        if type(value) is Decimal:
+            text = f"{value:f}"
+            if (
+                len(text) > places and text[-places - 1] == "."
+                if places
+                else "." not in text
+            ):
+                return text
+        return field.to_representation(value)
+
+    return convert
+
+
+def datetime_converter(field, tz):
+    # ISO 8601 in the current time zone with "Z" for UTC, as DateTimeField does
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    if (
+        output_format is None
+        or output_format.lower() != "iso-8601"
+        or hasattr(field, "timezone")
+        or tz is None
+    ):
+        return field.to_representation
+
+    utc = tz is dt_timezone.utc or getattr(tz, "key", None) in ("UTC", "Etc/UTC")
+
+    def convert(value):
+        if type(value) is not datetime or value.tzinfo is None:
+            return field.to_representation(value)
+        if utc and value.tzinfo is dt_timezone.utc:  # As the database returns them
+            return value.isoformat()[:-6] + "Z"
+        text = value.astimezone(tz).isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+    return convert
+
+
+def converter_for(field, tz):
+    # None when the database value is also the representation
+    if isinstance(field, fields.ChoiceField):
+        # Choices stored as strings are returned unchanged
+        if all(isinstance(key, str) for key in field.choices):
+            return None
+        return field.to_representation
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None  # The foreign key column holds the id
+    if isinstance(field, fields.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, fields.DateTimeField):
+        return datetime_converter(field, tz)
+    return field.to_representation
+
+
+def parse_field_list(value):
+    """
+    Parse a comma separated list of field names, dotted for the fields of
+    nested objects, into a tree: "id,items.quantity" gives
+    {"id": None, "items": {"quantity": None}}, None standing for the
+    whole field.
+    """
+    tree = {}
+    for name in value.split(","):
+        parts = name.strip().split(".")
+        if not all(parts):
+            continue
+        node = tree
+        for part in parts[:-1]:
+            if part in node and node[part] is None:
+                break  # The whole field is already selected
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+class RowSerializer:
+    """
+    Read-only fast path for a ModelSerializer on list endpoints.
+
+    Rows are fetched as `.values_list()` tuples and turned into the
+    serializer's output with one precomputed converter per field, instead
+    of building a model instance and running every field's
+    to_representation for each row. The result is identical to
+    `serializer_class(rows, many=True).data`.
+
+    Supported fields: model columns (through relations with dotted
+    sources), primary key relations and nested `many=True` serializers of
+    reverse foreign keys, which are fetched with one query per page like
+    prefetch_related. Anything else (e.g. SerializerMethodField) raises
+    ImproperlyConfigured when the serializer is compiled.
+
+    for_request() narrows the output to the `fields` a client asks for and
+    expands the foreign keys listed in `expandable` (dotted name ->
+    serializer of the related model) into objects. Only the columns, joins
+    and nested queries the output needs are fetched.
+    """
+
+    def __init__(
+        self, serializer_class, expandable=None, fields=None, expand=None, label=""
+    ):
+        self.serializer_class = serializer_class
+        self.expandable = expandable or {}
+        self.selected = fields  # Tree of selected fields, None for all
+        self.expanded = expand or {}  # Tree of expanded foreign keys
+        self.label = label  # Dotted prefix of this level, for error messages
+        self.projections = {}
+        self.compiled = False
+
+    def compile(self):
+        # Built once, on first use; threads racing here build equal copies
+        if self.compiled:
+            return
+        serializer = self.serializer_class()
+        self.model = serializer.Meta.model
+        available = {
+            name: field
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        }
+        self.check_names(available)
+        names = []
+        columns = []  # (name, values path, serializer field)
+        objects = []  # (name, foreign key path, RowSerializer of the related row)
+        nested = []  # (name, foreign key on the child, RowSerializer)
+        for name, field in available.items():
+            selection = self.selection(name)
+            if selection is False:
+                continue
+            names.append(name)
+            if isinstance(field, serializers.ListSerializer):
+                nested.append((name, *self.reverse_relation(field, selection)))
+            elif field.source == "*" or isinstance(
+                field, (serializers.BaseSerializer, fields.SerializerMethodField)
+            ):
+                raise ImproperlyConfigured(
+                    f"{self.serializer_class.__name__}.{name} cannot be "
+                    "serialized from .values() rows."
+                )
+            elif name in self.expanded or selection:
+                objects.append((name, *self.related_object(name, field, selection)))
+            else:
+                columns.append((name, field.source.replace(".", "__"), field))
+        paths = [path for _, path, _ in columns]
+        for _, path, child in objects:
+            # The foreign key tells missing objects apart, then their columns
+            paths += [path, *child.prefixed_paths]
+        pk_path = self.model._meta.pk.name  # Nested rows are matched by it
+        if nested:
+            paths.append(pk_path)
+        paths = list(dict.fromkeys(paths))
+        self.names, self.columns, self.nested = names, columns, nested
+        # (name, position of the foreign key, positions of the columns, child)
+        self.objects = [
+            (
+                name,
+                paths.index(path),
+                [paths.index(child_path) for child_path in child.prefixed_paths],
+                child,
+            )
+            for name, path, child in objects
+        ]
+        self.paths, self.pk_index = paths, paths.index(pk_path) if nested else None
+        # Objects and nested fields are added last, so keys may need reordering
+        self.reorder = names != [name for name, _, _ in columns + objects + nested]
+        self.converters_by_zone = {}
+        self.compiled = True
+
+    def check_names(self, available):
+        # Raise a ValidationError (400) for fields the serializer lacks
+        for param, tree in [("fields", self.selected), ("expand", self.expanded)]:
+            unknown = sorted(set(tree or ()) - set(available))
+            if unknown:
+                raise ValidationError(
+                    {
+                        param: [
+                            f"Unknown field '{self.label}{unknown[0]}'. Choose "
+                            f"from: {', '.join(self.label + n for n in available)}."
+                        ]
+                    }
+                )
+
+    def selection(self, name):
+        """
+        The fields selected within `name`: None for all of them, a tree of
+        field names, or False when the field itself is not selected.
+        Expanding a field selects it.
+        """
+        if self.selected is None:
+            return None
+        if name in self.selected:
+            return self.selected[name]
+        return None if name in self.expanded else False
+
+    def child_options(self, name, selection):
+        # Constructor arguments of the RowSerializer for the field `name`
+        prefix = name + "."
+        return {
+            "expandable": {
+                key[len(prefix) :]: serializer_class
+                for key, serializer_class in self.expandable.items()
+                if key.startswith(prefix)
+            },
+            "fields": selection,
+            "expand": self.expanded.get(name),
+            "label": self.label + prefix,
+        }
+
+    def reverse_relation(self, field, selection):
+        # (foreign key name on the child model, child RowSerializer)
+        for relation in self.model._meta.related_objects:
+            if relation.one_to_many and relation.get_accessor_name() == field.source:
+                child = RowSerializer(
+                    type(field.child), **self.child_options(field.field_name, selection)
+                )
+                child.compile()
+                return relation.field.name, child
+        raise ImproperlyConfigured(
+            f"{self.serializer_class.__name__}.{field.field_name} must be a "
+            "reverse foreign key to be serialized from .values() rows."
+        )
+
+    def related_object(self, name, field, selection):
+        """
+        (foreign key path, RowSerializer) of an expanded foreign key, whose
+        columns are joined into this serializer's rows.
+        """
+        if name not in self.expandable:
+            param = "fields" if selection else "expand"
+            raise ValidationError(
+                {param: [f"Field '{self.label}{name}' cannot be expanded."]}
+            )
+        child = RowSerializer(
+            self.expandable[name], **self.child_options(name, selection)
+        )
+        child.compile()
+        if child.nested:
+            raise ImproperlyConfigured(
+                f"{child.serializer_class.__name__} has nested serializers and "
+                "cannot be expanded."
+            )
+        path = field.source.replace(".", "__")
+        child.prefixed_paths = [f"{path}__{child_path}" for child_path in child.paths]
+        return path, child
+
+    def for_request(self, request):
+        """
+        This serializer narrowed to the request's `fields` and `expand`
+        query parameters, or itself when there are none. Both take comma
+        separated field names, dotted for the fields of nested objects:
+        ?fields=id,items.quantity&expand=items.product
+        Raises a ValidationError (400) for unknown or unexpandable fields.
+        """
+        fields = request.query_params.get("fields")
+        expand = request.query_params.get("expand", "")
+        if fields is None and not expand:
+            return self
+        key = (fields, expand)
+        projection = self.projections.get(key)
+        if projection is None:
+            selected = None if fields is None else parse_field_list(fields)
+            if selected == {}:
+                raise ValidationError({"fields": ["Select at least one field."]})
+            projection = RowSerializer(
+                self.serializer_class,
+                self.expandable,
+                selected,
+                parse_field_list(expand),
+            )
+            projection.compile()
+            if len(self.projections) < MAX_PROJECTIONS:
+                self.projections[key] = projection
+        return projection
+
+    def values(self, queryset, *extra):
+        """
+        The queryset of rows for serialize(): named tuples of the values,
+        so the paginator can read the ordering fields by name. `extra`
+        paths are fetched too (e.g. ordering fields that are not output).
+        """
+        self.compile()
+        paths = dict.fromkeys(self.paths + list(extra))
+        return queryset.values_list(*paths, named=True)
+
+    def get(self, queryset):
+        # The representation of the only row of `queryset`, or a 404
+        rows = list(self.values(queryset)[:1])
+        if not rows:
+            raise Http404
+        return self.serialize(rows)[0]
+
+    def converters(self):
+        # Built once per time zone: datetimes are rendered in the current one
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        converters = self.converters_by_zone.get(tz)
+        if converters is None:
+            converters = self.converters_by_zone[tz] = [
+                (name, self.paths.index(path), converter_for(field, tz))
+                for name, path, field in self.columns
+            ]
+        return converters
+
+    def serialize(self, rows):
+        """
+        Return the representation of `rows` (a list from values()) as a list
+        of dicts, with the nested serializers' rows fetched in one query each.
+        """
+        self.compile()
+        converters = self.converters()
+        data = [
+            {
+                name: value if convert is None or value is None else convert(value)
+                for name, index, convert in converters
+                for value in (row[index],)
+            }
+            for row in rows
+        ]
+        for name, key, positions, child in self.objects:
+            present = [row for row in rows if row[key] is not None]
+            related = iter(
+                child.serialize([[row[i] for i in positions] for row in present])
+            )
+            for item, row in zip(data, rows):
+                item[name] = None if row[key] is None else next(related)
+        if self.nested and rows:
+            ids = [row[self.pk_index] for row in rows]
+            for name, foreign_key, child in self.nested:
+                children = child.children_of(foreign_key, ids)
+                for item, pk in zip(data, ids):
+                    item[name] = children.get(pk, [])
+        if self.reorder:
+            data = [{name: item[name] for name in self.names} for item in data]
+        return data
+
+    def children_of(self, foreign_key, ids):
+        # Serialized rows pointing at each of `ids`, in the default order
+        self.compile()
+        queryset = self.model._default_manager.filter(**{f"{foreign_key}__in": ids})
+        # The parent's id is fetched after the row's own values
+        rows = list(queryset.values_list(*self.paths, foreign_key))
+        children = defaultdict(list)
+        for row, item in zip(rows, self.serialize(rows)):
+            children[row[-1]].append(item)
+        return children
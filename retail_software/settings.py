@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,12 +38,17 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'jobs.apps.JobsConfig',
     'products.apps.ProductsConfig',
     'rest_framework',
-    'sales.apps.SalesConfig'
+    'sales.apps.SalesConfig',
+    'benchmarks.apps.BenchmarksConfig',
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'retail_software.middleware.PerformanceMiddleware',
+    'retail_software.replica.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,12 +81,139 @@ WSGI_APPLICATION = 'retail_software.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Chosen with the DATABASE_PROFILE environment variable:
+#   sqlite          - tuned SQLite file (default)
+#   sqlite-untuned  - SQLite with the library defaults, for comparison
+#   postgresql      - PostgreSQL from the DATABASE_* variables
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+# Run on every new SQLite connection. WAL lets readers work alongside the
+# writer and makes commits cheap with synchronous=NORMAL (still safe
+# against application crashes); mmap and a larger page cache (in KiB when
+# negative) cut read syscalls.
+SQLITE_INIT_COMMAND = ';'.join([
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+])
+
+DATABASE_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND,
+            # Busy timeout: seconds a writer waits for the lock instead of failing
+            'timeout': 20,
+            # Take the write lock when a transaction starts, so concurrent
+            # writers queue on the busy timeout instead of failing with
+            # "database is locked" when upgrading a read lock
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # File-backed test database so concurrency tests can share it across threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    'sqlite-untuned': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DATABASE_NAME', 'retail'),
+        'USER': os.environ.get('DATABASE_USER', 'retail'),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        # Keep connections open between requests, checking them before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    },
+}
+
+# DATABASE_POOL=1 uses psycopg's connection pool (needs psycopg[pool]) instead
+# of persistent connections; Django requires CONN_MAX_AGE=0 with a pool.
+if os.environ.get('DATABASE_POOL') == '1':
+    DATABASE_PROFILES['postgresql']['CONN_MAX_AGE'] = 0
+    DATABASE_PROFILES['postgresql']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', '20')),
+        'timeout': 10,
+    }
 
 DATABASES = {
-    'default': {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
+}
+
+# Read replica (see retail_software/replica.py). Reports, admin lists and
+# exports read from it, everything else from the primary. DATABASE_REPLICA:
+#   (unset)    - no replica, every query goes to the primary
+#   snapshot   - SQLite: a copy of the database file, refreshed with the
+#                online backup API by manage.py refresh_replica --every 30
+#   <host>     - PostgreSQL: a streaming replica on that host
+DATABASE_REPLICA = os.environ.get('DATABASE_REPLICA', '')
+
+REPLICA = {
+    'SNAPSHOT': None,
+    # Seconds a snapshot serves reads for; older ones (refresh stopped) don't
+    'MAX_LAG': 120,
+    # Seconds a client reads from the primary after a write
+    'PIN_SECONDS': 30,
+}
+
+if DATABASE_REPLICA == 'snapshot':
+    REPLICA['SNAPSHOT'] = BASE_DIR / 'db.replica.sqlite3'
+    DATABASES['replica'] = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # Read only: the snapshot is replaced as a whole, never written
+        'NAME': f"file:{REPLICA['SNAPSHOT']}?mode=ro",
+        'OPTIONS': {
+            'init_command': ';'.join([
+                'PRAGMA mmap_size=268435456',
+                'PRAGMA cache_size=-65536',
+                'PRAGMA temp_store=MEMORY',
+            ]),
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
     }
+elif DATABASE_REPLICA:
+    DATABASES['replica'] = dict(
+        DATABASES['default'], HOST=DATABASE_REPLICA, TEST={'MIRROR': 'default'}
+    )
+
+DATABASE_ROUTERS = ['retail_software.replica.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Holds the catalog version and rendered catalog pages. With several worker
+# processes, point this at a shared backend (Redis or Memcached) so that a
+# write in one worker invalidates the catalog for all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+# The JSON renderer writes the same bytes as DRF's, faster when orjson is
+# installed.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'retail_software.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 
@@ -124,3 +257,56 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Mobile money collections (see sales/payments). The default points at the
+# local fake provider: python manage.py fake_payment_provider
+PAYMENT_PROVIDER = {
+    'BACKEND': 'sales.payments.providers.MoMoProvider',
+    'BASE_URL': os.environ.get('PAYMENT_PROVIDER_URL', 'http://127.0.0.1:8765'),
+    'API_KEY': os.environ.get('PAYMENT_PROVIDER_API_KEY', ''),
+    'SUBSCRIPTION_KEY': os.environ.get('PAYMENT_PROVIDER_SUBSCRIPTION_KEY', ''),
+    'ENVIRONMENT': os.environ.get('PAYMENT_PROVIDER_ENVIRONMENT', 'sandbox'),
+    'CALLBACK_URL': os.environ.get('PAYMENT_CALLBACK_URL', ''),
+    'CURRENCY': 'GHS',
+    'MAX_CONNECTIONS': 100,  # Concurrent requests to the provider per worker
+    'TIMEOUT': 10,  # Seconds per provider request
+}
+
+PAYMENT_VERIFICATION = {
+    'POLL_INTERVAL': 2,  # Seconds before the first status check, then doubled
+    'MAX_POLL_INTERVAL': 30,
+    'TIMEOUT': 600,  # Seconds before a worker stops following a collection
+    'MAX_IN_FLIGHT': 5000,  # Collections followed at once per worker
+}
+
+# Background jobs (see jobs/queue.py): side effects queued in the database
+# with the changes they follow up on, and run by python manage.py run_jobs.
+# EAGER runs them in the request right after the commit instead, without
+# storing them or needing a worker (tests, development).
+JOBS = {
+    'EAGER': os.environ.get('JOBS_EAGER') == '1',
+    'WORKERS': 2,  # Threads per run_jobs process
+    'POLL_INTERVAL': 1,  # Seconds a worker waits when no job is due
+    'MAX_ATTEMPTS': 5,  # Runs before a failing job is left failed
+    'RETRY_DELAY': 2,  # Seconds before the first retry, then doubled
+    'MAX_RETRY_DELAY': 600,
+    'LEASE': 600,  # Seconds before a running job is presumed lost and rerun
+}
+
+# Receipts of completed sales (see sales/receipts.py): rendered once by a
+# background job after the sale commits, and stored for reprints.
+RECEIPTS = {
+    'SHOP_NAME': os.environ.get('RECEIPT_SHOP_NAME', 'Retail POS'),
+    'WIDTH': 42,  # Characters per line of text receipts (80 mm thermal paper)
+}
+
+# Per-request timings (Server-Timing header) and the Prometheus histograms
+# served at /metrics (see retail_software/middleware.py). Off unless
+# PERFORMANCE_METRICS=1: disabled, the middleware is removed from the stack
+# and /metrics answers 404. Enabled, /metrics is only served to staff users
+# and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>"; so is the
+# job workers' metrics server (manage.py run_jobs --metrics-port).
+PERFORMANCE_METRICS = {
+    'ENABLED': os.environ.get('PERFORMANCE_METRICS', '0') == '1',
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
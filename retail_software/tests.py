@@ -0,0 +1,313 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import uuid
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from products.models import Category, Products
+from sales.checkout import checkout
+from sales.models import Sales
+from . import metrics, renderers, replica
+from .renderers import FastJSONRenderer
+from .replica import REPLICA, ReplicaRouter
+from .rows import RowSerializer
+
+
+METRICS = {"ENABLED": True, "TOKEN": "scrape-token"}
+SCRAPER = {"HTTP_AUTHORIZATION": "Bearer scrape-token"}
+
+
+@override_settings(PERFORMANCE_METRICS=METRICS)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        category = Category.objects.create(name="Snacks")
+        self.product = Products.objects.create(
+            name="Chips",
+            unit_price=Decimal("1.50"),
+            category=category,
+            sku="CHIPS",
+            stock_quantity=5,
+        )
+
+    def timings(self, response):
+        # Server-Timing entries as {name: (milliseconds, description)}
+        entries = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, *params = entry.split(";")
+            values = dict(param.split("=", 1) for param in params)
+            entries[name] = (float(values["dur"]), values.get("desc"))
+        return entries
+
+    def test_server_timing_header(self):
+        url = reverse("category-list-update", args=[self.product.category_id])
+        with self.assertNumQueries(1):  # Instrumentation adds no queries
+            response = self.client.get(url)
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {"db", "view", "render", "total"})
+        self.assertEqual(timings["db"][1], '"1 queries"')
+        self.assertGreaterEqual(
+            timings["total"][0], timings["view"][0] + timings["render"][0]
+        )
+
+    def test_metrics_endpoint(self):
+        url = reverse("product-list-update-delete", args=[self.product.pk])
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get("/no-such-page/")
+        response = self.client.get(reverse("metrics"), **SCRAPER)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn(
+            'http_requests_total{route="product-list-update-delete",method="GET",'
+            'status="200"} 2',
+            body,
+        )
+        self.assertIn(
+            'http_request_queries_bucket{route="product-list-update-delete",'
+            'method="GET",le="1"} 2',
+            body,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{route="unmatched",method="GET"} 1',
+            body,
+        )
+        self.assertIn("# TYPE http_request_db_seconds histogram", body)
+
+    def test_metrics_are_not_public(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        wrong = {"HTTP_AUTHORIZATION": "Bearer guess"}
+        self.assertEqual(self.client.get(url, **wrong).status_code, 403)
+        staff = User.objects.create_user("manager", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with override_settings(PERFORMANCE_METRICS={**METRICS, "TOKEN": ""}):
+            self.client.logout()
+            self.assertEqual(self.client.get(url, **SCRAPER).status_code, 403)
+
+    @override_settings(PERFORMANCE_METRICS={"ENABLED": False})
+    def test_disabled(self):
+        url = reverse("product-list-update-delete", args=[self.product.pk])
+        response = self.client.get(url)
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        self.assertEqual(list(metrics.request_duration.samples()), [])
+
+
+@skipUnless(settings.DATABASE_PROFILE == "sqlite", "Tuned SQLite profile only")
+class DatabaseProfileTests(TestCase):
+    def pragma(self, name, using=connection):
+        with using.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_sqlite_pragmas(self):
+        # Applied by init_command on every new connection
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        self.assertEqual(self.pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma("mmap_size"), 268435456)
+        self.assertEqual(self.pragma("cache_size"), -65536)
+        self.assertEqual(self.pragma("busy_timeout"), 20000)
+
+    def test_new_connections_are_tuned(self):
+        fresh = connection.copy()
+        try:
+            self.assertEqual(self.pragma("synchronous", fresh), 1)
+            self.assertEqual(self.pragma("cache_size", fresh), -65536)
+        finally:
+            fresh.close()
+
+
+class FastJSONRendererTests(TestCase):
+    data = {
+        "text": "Caf\u00e9 \u2028 \u2029 \"quoted\" \\ \x00\x1f \U0001f600",
+        "decimal": Decimal("12.50"),
+        "tiny": Decimal("0.00001"),
+        "moment": datetime.datetime(2025, 1, 2, 3, 4, 5, 678901, datetime.UTC),
+        "day": datetime.date(2025, 1, 2),
+        "id": uuid.UUID(int=7),
+        "nested": [1, True, None, {"k": ()}],
+    }
+
+    def assertSameAsDRF(self, data, media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, media_type),
+            JSONRenderer().render(data, media_type),
+        )
+
+    def test_matches_drf_output(self):
+        self.assertSameAsDRF(self.data)
+        self.assertSameAsDRF(self.data, "application/json; indent=4")
+        self.assertSameAsDRF({"big": 2**70, 1: "non-string key"})  # Fallbacks
+        self.assertSameAsDRF(None)
+
+    def test_without_orjson(self):
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertSameAsDRF(self.data)
+
+    def test_errors_match_drf(self):
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render({"nan": Decimal("NaN")})
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render({"object": object()})
+
+
+class RowSerializerTests(TestCase):
+    def test_rejects_fields_that_need_instances(self):
+        class NameSerializer(serializers.ModelSerializer):
+            shout = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Category
+                fields = ["id", "shout"]
+
+            def get_shout(self, category):
+                return category.name.upper()
+
+        with self.assertRaises(ImproperlyConfigured):
+            RowSerializer(NameSerializer).values(Category.objects.all())
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.snapshot = os.path.join(directory.name, "replica.sqlite3")
+        self.enterContext(
+            override_settings(REPLICA=dict(settings.REPLICA, SNAPSHOT=self.snapshot))
+        )
+        self.enterContext(
+            mock.patch.object(replica, "replica_configured", return_value=True)
+        )
+        category = Category.objects.create(name="Snacks")
+        self.product = Products.objects.create(
+            name="Chips",
+            unit_price=Decimal("1.50"),
+            category=category,
+            sku="CHIPS",
+            stock_quantity=5,
+        )
+
+    def refreshed(self, seconds_ago=0):
+        # Pretend the snapshot was refreshed `seconds_ago`
+        open(self.snapshot, "a").close()
+        refreshed_at = datetime.datetime.now().timestamp() - seconds_ago
+        os.utime(self.snapshot, (refreshed_at, refreshed_at))
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Sales), DEFAULT_DB_ALIAS)
+        with replica.reading_from(REPLICA):
+            self.assertEqual(router.db_for_read(Sales), REPLICA)
+            self.assertEqual(router.db_for_write(Sales), DEFAULT_DB_ALIAS)
+            with replica.primary_reads():
+                self.assertEqual(router.db_for_read(Sales), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(REPLICA, "sales"))
+        self.assertTrue(router.allow_migrate(DEFAULT_DB_ALIAS, "sales"))
+
+    def test_only_fresh_snapshots_serve_unpinned_clients(self):
+        request = RequestFactory().get("/")
+        self.assertIsNone(replica.alias_for(request))  # No snapshot yet
+        self.refreshed()
+        self.assertEqual(replica.alias_for(request), REPLICA)
+        request.COOKIES[replica.PIN_COOKIE] = "1"
+        self.assertIsNone(replica.alias_for(request))
+        del request.COOKIES[replica.PIN_COOKIE]
+        self.refreshed(settings.REPLICA["MAX_LAG"] + 1)  # The refresh stopped
+        self.assertIsNone(replica.alias_for(request))
+
+    def reads(self, method, url, data=None):
+        # The databases the request's reads were routed to
+        routed = []
+
+        def db_for_read(model, **hints):
+            routed.append(replica._reads.get() or DEFAULT_DB_ALIAS)
+            return DEFAULT_DB_ALIAS  # The test database stands in for both
+
+        with mock.patch.object(ReplicaRouter, "db_for_read", side_effect=db_for_read):
+            response = getattr(self.client, method)(url, data, "application/json")
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return set(routed), response
+
+    def test_reports_and_heavy_lists_read_from_the_replica(self):
+        self.refreshed()
+        for url in [
+            reverse("sales-heavy-list-create"),
+            reverse("sales-item-heavy-list-create"),
+            reverse("sales-report"),
+            reverse("sales-export", args=["ndjson"]),
+        ]:
+            self.assertEqual(self.reads("get", url)[0], {REPLICA}, url)
+        # Closed-day reports are cached, so built from the primary
+        closed = reverse("sales-report") + "?date_to=2020-01-01T00:00:00Z"
+        self.assertEqual(self.reads("get", closed)[0], {DEFAULT_DB_ALIAS})
+        self.assertEqual(
+            self.reads("get", reverse("sales-light-list-create"))[0],
+            {DEFAULT_DB_ALIAS},
+        )
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.refreshed()
+        cart = {
+            "items": [{"product": self.product.pk, "quantity": "1"}],
+            "payment_method": "cash",
+        }
+        routed, response = self.reads("post", reverse("sales-checkout"), cart)
+        self.assertEqual(routed, {DEFAULT_DB_ALIAS})
+        pin = response.cookies[replica.PIN_COOKIE]
+        self.assertEqual(pin["max-age"], settings.REPLICA["PIN_SECONDS"])
+        routed, _ = self.reads("get", reverse("sales-heavy-list-create"))
+        self.assertEqual(routed, {DEFAULT_DB_ALIAS})
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite only")
+class ReplicaSnapshotTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.snapshot = os.path.join(directory.name, "replica.sqlite3")
+        self.category = Category.objects.create(name="Snacks")
+
+    def add_product(self, sku):
+        Products.objects.create(
+            name=sku,
+            unit_price=Decimal("1.50"),
+            category=self.category,
+            sku=sku,
+            stock_quantity=5,
+        )
+
+    def read_snapshot(self, sql):
+        with sqlite3.connect(f"file:{self.snapshot}?mode=ro", uri=True) as snapshot:
+            return snapshot.execute(sql).fetchone()[0]
+
+    def test_refresh_copies_the_database(self):
+        count = "SELECT count(*) FROM products_products"
+        self.add_product("A")
+        replica.refresh_snapshot(self.snapshot)
+        self.assertEqual(self.read_snapshot(count), 1)
+        self.assertEqual(self.read_snapshot("PRAGMA journal_mode"), "delete")
+        self.add_product("B")
+        call_command("refresh_replica", "--path", self.snapshot, stdout=StringIO())
+        self.assertEqual(self.read_snapshot(count), 2)
+        self.assertFalse(os.path.exists(self.snapshot + ".tmp"))
+        no_snapshot = dict(settings.REPLICA, SNAPSHOT=None)
+        with override_settings(REPLICA=no_snapshot), self.assertRaises(CommandError):
+            call_command("refresh_replica", stdout=StringIO())
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'retail_software.settings')
 
 application = get_wsgi_application()
+
+# Load the SKU -> product map once per worker so scans skip the database
+from products.sku_index import warm_sku_index  # noqa: E402
+
+warm_sku_index()
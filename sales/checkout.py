@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+from products.models import Products
+from .models import CENTS, Sales, SaleItems
+from . import rollups, stock
+
+
+class CheckoutError(Exception):
+    """
+    Raised when a cart cannot be turned into a sale.
+    `errors` maps the index of each offending cart line to its error messages.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def resolve_products(lines):
+    """
+    Fetch every product referenced by the cart lines in a single query.
+    Lines reference products either by `product` (id) or by `sku`.
+    Returns two lookups: products keyed by id and products keyed by sku.
+    """
+    ids = {line["product"] for line in lines if line.get("product") is not None}
+    skus = {line["sku"] for line in lines if line.get("sku")}
+    by_id, by_sku = {}, {}
+    if ids or skus:
+        products = Products.objects.filter(Q(pk__in=ids) | Q(sku__in=skus))
+        for product in products:
+            by_id[product.pk] = product
+            by_sku[product.sku] = product
+    return by_id, by_sku
+
+
+def build_items(lines, by_id, by_sku):
+    """
+    Turn validated cart lines into unsaved SaleItems with their subtotals.
+    Raises CheckoutError listing every line whose product could not be found.
+    """
+    items, errors = [], {}
+    for index, line in enumerate(lines):
+        if line.get("product") is not None:
+            product = by_id.get(line["product"])
+        else:
+            product = by_sku.get(line["sku"])
+        if product is None:
+            errors[index] = ["Product not found."]
+            continue
+        subtotal = (line["quantity"] * product.unit_price).quantize(CENTS)
+        items.append(
+            SaleItems(product=product, quantity=line["quantity"], subtotal=subtotal)
+        )
+    if errors:
+        raise CheckoutError(errors)
+    return items
+
+
+def initial_status(payment_method):
+    # Cash is settled at the till; mobile payments wait for the provider
+    return "completed" if payment_method == "cash" else "pending"
+
+
+def checkout(lines, payment_method):
+    """
+    Create a sale and all of its items in one transaction.
+    Products are fetched in one batch, items are bulk inserted and the total
+    is computed once, so the query count does not grow with the cart size.
+    Cash sales are completed immediately and take their items out of stock
+    (raising InsufficientStock if any line cannot be fulfilled); mobile
+    payments stay pending until the provider confirms them.
+    """
+    by_id, by_sku = resolve_products(lines)
+    items = build_items(lines, by_id, by_sku)
+    status = initial_status(payment_method)
+    with transaction.atomic():
+        sale = Sales.objects.create(
+            status=status,
+            payment_method=payment_method,
+            total_amount=sum((item.subtotal for item in items), Decimal("0")),
+        )
+        for item in items:
+            item.sales = sale
+        SaleItems.objects.bulk_create(items)
+        rollups.items_added(sale, items)
+        if status == stock.STOCK_HOLDING_STATUS:
+            stock.deduct(
+                stock.item_quantities(items), reference=stock.sale_reference(sale)
+            )
+    return sale
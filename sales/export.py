@@ -0,0 +1,147 @@
+import csv
+import json
+
+from rest_framework import serializers
+
+from retail_software.pagination import KeysetPagination
+from .filters import filter_sales
+from .models import CENTS, Sales
+from .receipts import unit_price
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_ORDERING = ("date", "id")  # Oldest first, so a resumed export appends
+EXPORT_CHUNK_SIZE = 2000  # Sales fetched (with their items) per round trip
+
+CSV_COLUMNS = [
+    "sale_id",
+    "date",
+    "status",
+    "payment_method",
+    "total_amount",
+    "item_id",
+    "product_id",
+    "sku",
+    "product_name",
+    "quantity",
+    "unit_price",
+    "subtotal",
+    "cursor",
+]
+
+# Dates are written the way the API renders them
+DATETIME = serializers.DateTimeField()
+
+
+class Echo:
+    """
+    File-like object whose write() returns the line instead of storing it,
+    so csv.writer can format rows one at a time for a stream.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_paginator():
+    # Cursors are the list endpoints' keyset cursors over EXPORT_ORDERING
+    paginator = KeysetPagination()
+    paginator.ordering = EXPORT_ORDERING
+    return paginator
+
+
+def export_sales(params, cursor=None):
+    """
+    Iterate over the sales matching the list filters in `params`
+    (date_from, date_to, status, payment_method), oldest first, starting
+    after `cursor` when given.
+    Sales are read in chunks of EXPORT_CHUNK_SIZE with their items and
+    products prefetched per chunk (a server-side cursor on PostgreSQL), so
+    memory use does not depend on how many sales are exported.
+    Raises ValidationError or NotFound for bad filters or cursors.
+    """
+    paginator = export_paginator()
+    sales = filter_sales(Sales.objects.with_items(products=True), params)
+    sales = sales.order_by(*EXPORT_ORDERING)
+    if cursor:
+        sales = sales.filter(paginator.after(paginator.parse_cursor(cursor, Sales)))
+    return sales.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def sale_cursor(paginator, sale):
+    # Cursor resuming the export right after `sale`
+    return paginator.encode_cursor(paginator.position_of(sale))
+
+
+def sold_price(item):
+    # The unit price of the sale, not the product's current one
+    return unit_price(item).quantize(CENTS)
+
+
+def csv_lines(sales):
+    """
+    One CSV row per sale item, with the sale's columns repeated (a sale
+    without items gets a single row). Only the last row of each sale carries
+    a cursor: an interrupted download is resumed from the last row that has
+    one, after dropping the rows that follow it.
+    """
+    paginator, writer = export_paginator(), csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for sale in sales:
+        head = [
+            sale.pk,
+            DATETIME.to_representation(sale.date),
+            sale.status,
+            sale.payment_method,
+            sale.total_amount,
+        ]
+        items = [
+            [
+                item.pk,
+                item.product_id,
+                item.product.sku,
+                item.product.name,
+                item.quantity,
+                sold_price(item),
+                item.subtotal,
+            ]
+            for item in sale.saleitems_set.all()
+        ] or [[""] * 7]
+        items[-1].append(sale_cursor(paginator, sale))
+        yield "".join(writer.writerow(head + item) for item in items)
+
+
+def ndjson_lines(sales):
+    """
+    One JSON object per line and sale, with its items nested and the cursor
+    resuming the export after it.
+    """
+    paginator = export_paginator()
+    for sale in sales:
+        record = {
+            "id": sale.pk,
+            "date": DATETIME.to_representation(sale.date),
+            "status": sale.status,
+            "payment_method": sale.payment_method,
+            "total_amount": str(sale.total_amount),
+            "items": [
+                {
+                    "id": item.pk,
+                    "product": item.product_id,
+                    "sku": item.product.sku,
+                    "product_name": item.product.name,
+                    "quantity": str(item.quantity),
+                    "unit_price": str(sold_price(item)),
+                    "subtotal": None if item.subtotal is None else str(item.subtotal),
+                }
+                for item in sale.saleitems_set.all()
+            ],
+            "cursor": sale_cursor(paginator, sale),
+        }
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def export_lines(sales, export_format):
+    # Encoded lines of the export, produced as the sales are read
+    if export_format == "csv":
+        return csv_lines(sales)
+    return ndjson_lines(sales)
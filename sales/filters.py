@@ -0,0 +1,120 @@
+from rest_framework import serializers
+
+from .models import Sales, SalesRollup
+from .rollups import ROLLUP_STATUSES
+
+
+class SalesFilterSerializer(serializers.Serializer):
+    """
+    Validates the query parameters accepted by the sales list endpoints.
+    date_from is inclusive and date_to is exclusive; both accept a date
+    or a full ISO 8601 datetime.
+    """
+
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+    status = serializers.ChoiceField(choices=Sales.STATUS_CHOICES, required=False)
+    payment_method = serializers.ChoiceField(
+        choices=Sales.PAYMENT_METHOD_CHOICES, required=False
+    )
+
+
+class SaleItemsFilterSerializer(SalesFilterSerializer):
+    """
+    Query parameters for the sale item list endpoints.
+    Adds filtering by sale and product on top of the sale-level filters.
+    """
+
+    sales = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+
+
+# Maps each sale-level filter to the lookup it applies
+SALES_LOOKUPS = {
+    "date_from": "date__gte",
+    "date_to": "date__lt",
+    "status": "status",
+    "payment_method": "payment_method",
+}
+
+
+def filter_sales(queryset, params):
+    """
+    Apply the sale-level filters in `params` to a Sales queryset.
+    Raises a ValidationError (400) for malformed parameters.
+    """
+    serializer = SalesFilterSerializer(data=params)
+    serializer.is_valid(raise_exception=True)
+    lookups = {
+        SALES_LOOKUPS[name]: value for name, value in serializer.validated_data.items()
+    }
+    return queryset.filter(**lookups)
+
+
+def filter_sale_items(queryset, params):
+    """
+    Apply the item filters (sale, product) and the sale-level filters
+    in `params` to a SaleItems queryset.
+    """
+    serializer = SaleItemsFilterSerializer(data=params)
+    serializer.is_valid(raise_exception=True)
+    lookups = {}
+    for name, value in serializer.validated_data.items():
+        if name in SALES_LOOKUPS:
+            lookups["sales__" + SALES_LOOKUPS[name]] = value
+        else:
+            lookups[f"{name}_id"] = value
+    return queryset.filter(**lookups)
+
+
+class RollupFilterSerializer(serializers.Serializer):
+    """
+    Query parameters for the sales report endpoints.
+    Periods are matched by their start: date_from is inclusive and date_to
+    exclusive, so ranges should fall on hour or day boundaries.
+    """
+
+    granularity = serializers.ChoiceField(
+        choices=SalesRollup.GRANULARITY_CHOICES, default="day"
+    )
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+    status = serializers.ChoiceField(choices=ROLLUP_STATUSES, required=False)
+    payment_method = serializers.ChoiceField(
+        choices=Sales.PAYMENT_METHOD_CHOICES, required=False
+    )
+
+
+class ProductRollupFilterSerializer(RollupFilterSerializer):
+    """
+    Query parameters for the product and category reports.
+    Adds filtering by product and category.
+    """
+
+    product = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False)
+
+
+# Maps each report filter to the rollup lookup it applies
+ROLLUP_LOOKUPS = {
+    "granularity": "granularity",
+    "date_from": "period__gte",
+    "date_to": "period__lt",
+    "status": "status",
+    "payment_method": "payment_method",
+    "product": "product_id",
+    "category": "category_id",
+}
+
+
+def filter_rollups(queryset, params, serializer_class=RollupFilterSerializer):
+    """
+    Apply the report filters in `params` to a rollup queryset.
+    Raises a ValidationError (400) for malformed parameters.
+    """
+    serializer = serializer_class(data=params)
+    serializer.is_valid(raise_exception=True)
+    lookups = {
+        ROLLUP_LOOKUPS[name]: value for name, value in serializer.validated_data.items()
+    }
+    return queryset.filter(**lookups)
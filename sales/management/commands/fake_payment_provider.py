@@ -0,0 +1,56 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from sales.payments.fake import FakeProvider
+
+
+class Command(BaseCommand):
+    """
+    Runs the local fake mobile money provider (see sales.payments.fake), so
+    collections can be developed and load tested without the real API.
+    The default PAYMENT_PROVIDER settings point at it.
+    """
+
+    help = "Run a local fake mobile money provider server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=2.0,
+            help="Seconds a collection stays pending (default: 2).",
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0.1,
+            help="Share of collections that fail (default: 0.1).",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds added to every response (default: 0).",
+        )
+        parser.add_argument("--seed", type=int, help="Seed for repeatable outcomes.")
+
+    def handle(self, *args, **options):
+        provider = FakeProvider(
+            delay=options["delay"],
+            failure_rate=options["failure_rate"],
+            latency=options["latency"],
+            seed=options["seed"],
+        )
+        try:
+            asyncio.run(self.serve(provider, options["host"], options["port"]))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, provider, host, port):
+        server = await provider.serve(host, port)
+        self.stdout.write(f"Fake payment provider listening on http://{host}:{port}/")
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from sales.models import Sales
+from sales.payments.fake import FakeProvider
+from sales.payments.pipeline import MOBILE_PAYMENT, PaymentVerifier
+from sales.payments.providers import MoMoProvider
+
+
+class Command(BaseCommand):
+    """
+    Load tests the mobile money pipeline offline: creates pending mobile
+    payment sales, starts all their collections at once against a fake
+    provider started in-process (or --provider-url), and follows them until
+    they are settled. Reports throughput and the peak number in flight.
+    The sales are kept: run it against a development database.
+    """
+
+    help = "Load test mobile money collections against the fake provider."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sales", type=int, default=1000)
+        parser.add_argument(
+            "--connections",
+            type=int,
+            default=settings.PAYMENT_PROVIDER.get("MAX_CONNECTIONS", 100),
+            help="Connection pool size (default: PAYMENT_PROVIDER setting).",
+        )
+        parser.add_argument("--delay", type=float, default=1.0)
+        parser.add_argument("--failure-rate", type=float, default=0.1)
+        parser.add_argument("--latency", type=float, default=0.0)
+        parser.add_argument("--poll-interval", type=float, default=0.5)
+        parser.add_argument(
+            "--provider-url", help="Use this provider instead of an in-process fake."
+        )
+
+    def handle(self, *args, **options):
+        sales = Sales.objects.bulk_create(
+            Sales(
+                status="pending",
+                payment_method=MOBILE_PAYMENT,
+                total_amount=Decimal("10.00"),
+            )
+            for _ in range(options["sales"])
+        )
+        ids = [sale.pk for sale in sales]
+        elapsed, peak = async_to_sync(self.run)(ids, options)
+        counts = dict(
+            Sales.objects.filter(pk__in=ids).values_list("status").annotate(
+                count=models.Count("pk")
+            )
+        )
+        self.stdout.write(
+            f"{len(ids)} collections in {elapsed:.2f}s "
+            f"({len(ids) / elapsed:.0f}/s), peak {peak} in flight: "
+            + ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+        )
+
+    async def run(self, ids, options):
+        fake, server, url = None, None, options["provider_url"]
+        if url is None:
+            fake = FakeProvider(
+                delay=options["delay"],
+                failure_rate=options["failure_rate"],
+                latency=options["latency"],
+            )
+            server = await fake.serve(port=0)
+            url = "http://127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+        provider = MoMoProvider(
+            BASE_URL=url, MAX_CONNECTIONS=options["connections"], TIMEOUT=30
+        )
+        verifier = PaymentVerifier(
+            provider,
+            POLL_INTERVAL=options["poll_interval"],
+            MAX_POLL_INTERVAL=options["poll_interval"] * 4,
+            MAX_IN_FLIGHT=len(ids),
+        )
+        started = time.monotonic()
+        try:
+            await asyncio.gather(
+                *(verifier.start(pk, f"23324{pk % 10**7:07d}") for pk in ids)
+            )
+            peak = len(verifier.tasks)
+            await verifier.wait()
+        finally:
+            provider.close()
+            if server is not None:
+                await asyncio.sleep(0.01)  # Let handlers see the client leave
+                server.close()
+                fake.close()
+        return time.monotonic() - started, peak
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from sales.models import Sales
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds Sales.total_amount from the stored SaleItems subtotals.
+    Totals are normally kept current incrementally; this is the fallback
+    for rows changed outside the ORM (bulk deletes, manual SQL, imports).
+    Sales are processed in primary-key ranges with one aggregate UPDATE each.
+    """
+
+    help = "Recompute the total amount of every sale from its items."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of sale ids recomputed per UPDATE (default: 5000).",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        bounds = Sales.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            self.stdout.write("No sales to recompute.")
+            return
+        updated = 0
+        for start in range(bounds["low"], bounds["high"] + 1, chunk_size):
+            updated += Sales.objects.filter(
+                pk__gte=start, pk__lt=start + chunk_size
+            ).recompute_totals()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {updated} sales."))
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from retail_software.replica import refresh_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Refreshes the SQLite replica snapshot that reports, admin lists and
+    exports read from (DATABASE_REPLICA=snapshot): the primary database is
+    copied with the SQLite online backup API and swapped in atomically.
+    With --every, keeps refreshing until interrupted; reads fall back to
+    the primary once the snapshot is older than REPLICA["MAX_LAG"].
+    """
+
+    help = "Refresh the SQLite read replica snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=float,
+            help="Refresh every this many seconds instead of once.",
+        )
+        parser.add_argument(
+            "--path",
+            help="Write the snapshot here (default: REPLICA['SNAPSHOT']).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or settings.REPLICA["SNAPSHOT"]
+        if not path:
+            raise CommandError("Set DATABASE_REPLICA=snapshot or pass --path.")
+        every = options["every"]
+        if every and every >= settings.REPLICA["MAX_LAG"]:
+            raise CommandError(
+                f"--every must be under REPLICA['MAX_LAG'] "
+                f"({settings.REPLICA['MAX_LAG']}s), or the snapshot is never used."
+            )
+        try:
+            while True:
+                seconds = refresh_snapshot(path)
+                connection.close()  # No read transaction left open meanwhile
+                self.stdout.write(f"Refreshed {path} in {seconds:.2f}s.")
+                if not every:
+                    return
+                time.sleep(max(every - seconds, 0))
+        except KeyboardInterrupt:
+            pass
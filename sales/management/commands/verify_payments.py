@@ -0,0 +1,53 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from sales.models import Sales
+from sales.payments.pipeline import MOBILE_PAYMENT, get_verifier
+from sales.payments.providers import PENDING
+
+
+class Command(BaseCommand):
+    """
+    Follows every pending mobile money collection until it is settled.
+    Collections are normally followed by the ASGI worker that started them;
+    this picks up the ones left behind by a restart, a WSGI deployment or a
+    verification timeout. Safe to run from cron with --once.
+    """
+
+    help = "Check pending mobile money payments with the provider."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Check each payment once instead of polling until settled.",
+        )
+
+    def handle(self, *args, **options):
+        pending = list(
+            Sales.objects.filter(
+                status="pending",
+                payment_method=MOBILE_PAYMENT,
+                payment_reference__isnull=False,
+            ).values_list("pk", "payment_reference")
+        )
+        outcomes = async_to_sync(self.verify)(pending, options["once"])
+        settled = sum(outcome != PENDING for outcome in outcomes)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {len(pending)} payments: {settled} settled, "
+                f"{len(pending) - settled} still pending."
+            )
+        )
+
+    async def verify(self, pending, once):
+        verifier = get_verifier()
+        follow = verifier.check if once else verifier.follow
+        try:
+            return await asyncio.gather(
+                *(follow(sale_id, reference) for sale_id, reference in pending)
+            )
+        finally:
+            verifier.provider.close()
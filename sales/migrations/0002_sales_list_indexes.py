@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['date', 'id'], name='sales_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['status', 'date', 'id'], name='sales_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['payment_method', 'date', 'id'], name='sales_payment_date_idx'),
+        ),
+    ]
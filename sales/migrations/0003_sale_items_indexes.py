@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+        ('sales', '0002_sales_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='saleitems',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='products.products'),
+        ),
+        migrations.AlterField(
+            model_name='saleitems',
+            name='sales',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='sales.sales'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitems',
+            index=models.Index(fields=['sales', 'product'], name='sales_item_sale_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitems',
+            index=models.Index(fields=['product', 'id'], name='sales_item_product_id_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_index'),
+        ('sales', '0003_sale_items_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('period', models.DateTimeField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('mobile payment', 'Mobile Payment')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'period', 'payment_method', 'status'), name='sales_rollup_bucket_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('period', models.DateTimeField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('mobile payment', 'Mobile Payment')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='products.category')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'product', 'period'], name='product_rollup_product_idx'), models.Index(fields=['granularity', 'category', 'period'], name='product_rollup_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'period', 'payment_method', 'status', 'product', 'category'), name='product_rollup_bucket_uniq')],
+            },
+        ),
+    ]
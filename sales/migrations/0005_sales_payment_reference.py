@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sales',
+            name='payment_reference',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_sales_payment_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sales',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
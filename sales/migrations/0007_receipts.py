@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_sales_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Receipt',
+            fields=[
+                ('sale', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='sales.sales')),
+                ('text', models.TextField()),
+                ('html', models.TextField()),
+                ('rendered_at', models.DateTimeField()),
+            ],
+        ),
+    ]
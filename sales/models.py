@@ -1,5 +1,46 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from products.models import Products
+from . import receipts, rollups, stock
+
+CENTS = Decimal("0.01")
+ZERO = Value(Decimal("0"))
+
+
+class SalesQuerySet(models.QuerySet):
+    """
+    QuerySet for sales with database-side total maintenance.
+    """
+
+    def with_items(self, products=False):
+        """
+        Prefetch every sale's items in one extra query for the whole page.
+        With `products`, the items' products are joined in the same query.
+        """
+        items = SaleItems.objects.all()
+        if products:
+            items = items.select_related("product")
+        return self.prefetch_related(Prefetch("saleitems_set", queryset=items))
+
+    def add_to_total(self, amount):
+        # Apply a delta to the total in the database (no read-modify-write)
+        return self.update(total_amount=F("total_amount") + amount)
+
+    def recompute_totals(self):
+        """
+        Rebuild the total of every sale in this queryset from its items
+        with a single aggregate UPDATE.
+        """
+        item_totals = (
+            SaleItems.objects.filter(sales=OuterRef("pk"))
+            .values("sales")
+            .annotate(total=Sum("subtotal"))
+            .values("total")
+        )
+        return self.update(total_amount=Coalesce(Subquery(item_totals), ZERO))
 
 
 class Sales(models.Model):
@@ -29,6 +70,14 @@ class Sales(models.Model):
     payment_method = models.CharField(
         choices=PAYMENT_METHOD_CHOICES, max_length=20
     )  # How the sale was paid
+    payment_reference = models.CharField(
+        max_length=100, unique=True, null=True, blank=True
+    )  # Mobile money provider reference of the collection (see sales.payments)
+    idempotency_key = models.CharField(
+        max_length=64, unique=True, null=True, blank=True
+    )  # Terminal-generated key of a sale uploaded by batch sync (see sales.sync)
+
+    objects = SalesQuerySet.as_manager()
 
     def __str__(self):
         # String representation for easy identification in admin and logs
@@ -36,15 +85,79 @@ class Sales(models.Model):
 
     class Meta:
         ordering = ["-date"]  # Show most recent sales first
+        indexes = [
+            # Keyset pagination and date-range filters on the list endpoints
+            models.Index(fields=["date", "id"], name="sales_date_id_idx"),
+            # Status / payment method filters, still ordered by date
+            models.Index(fields=["status", "date", "id"], name="sales_status_date_idx"),
+            models.Index(
+                fields=["payment_method", "date", "id"], name="sales_payment_date_idx"
+            ),
+        ]
 
     def update_total(self):
         """
         Recalculate and update the total amount for this sale
-        by summing the subtotals of all related SaleItems.
+        by summing the subtotals of all related SaleItems in the database.
+        Items keep the total current incrementally; this is the fallback.
+        """
+        Sales.objects.filter(pk=self.pk).recompute_totals()
+        self.refresh_from_db(fields=["total_amount"])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the status and payment method to detect transitions
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        instance._loaded_payment_method = instance.__dict__.get("payment_method")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the sale and move stock when its status changes.
+        The transition is claimed with a conditional UPDATE on the previous
+        status, so two requests completing the same sale cannot both take stock.
+        The reporting rollups follow status and payment method changes.
+        """
+        adding = self._state.adding
+        previous = None if adding else self._loaded_status
+        previous_payment_method = None if adding else self._loaded_payment_method
+        changed = previous is not None and previous != self.status
+        with transaction.atomic():
+            if changed:
+                claimed = Sales.objects.filter(pk=self.pk, status=previous).update(
+                    status=self.status
+                )
+                if not claimed:
+                    raise stock.SaleStatusConflict()
+            super().save(*args, **kwargs)
+            if changed:
+                stock.apply_status_change(self, previous, self.status)
+            if adding:
+                rollups.sale_created(self)
+            elif changed or previous_payment_method != self.payment_method:
+                rollups.sale_changed(self, previous, previous_payment_method)
+            # A completed sale's receipt is rendered after the commit, and
+            # any later edit replaces it
+            if previous == receipts.RECEIPT_STATUS:
+                receipts.invalidate([self.pk])
+            if self.status == receipts.RECEIPT_STATUS:
+                receipts.schedule([self.pk])
+        self._loaded_status = self.status
+        self._loaded_payment_method = self.payment_method
+
+    def delete(self, *args, **kwargs):
+        """
+        Deleting a completed sale voids it: its items go back into stock.
+        A deleted sale is also taken out of the reporting rollups.
         """
-        total = sum(item.subtotal for item in self.saleitems_set.all())
-        self.total_amount = total
-        self.save(update_fields=["total_amount"])
+        with transaction.atomic():
+            if self.status == stock.STOCK_HOLDING_STATUS:
+                stock.restore(
+                    stock.sale_quantities(self), reference=stock.sale_reference(self)
+                )
+            rollups.sale_deleted(self)
+            return super().delete(*args, **kwargs)
 
 
 class SaleItems(models.Model):
@@ -54,11 +167,11 @@ class SaleItems(models.Model):
     """
 
     sales = models.ForeignKey(
-        Sales, on_delete=models.CASCADE
-    )  # The sale this item belongs to
+        Sales, on_delete=models.CASCADE, db_index=False
+    )  # The sale this item belongs to (indexed by sales_item_sale_product_idx)
     product = models.ForeignKey(
-        Products, on_delete=models.CASCADE
-    )  # The product being sold
+        Products, on_delete=models.CASCADE, db_index=False
+    )  # The product being sold (indexed by sales_item_product_id_idx)
     quantity = models.DecimalField(
         max_digits=10, decimal_places=2
     )  # Quantity of the product sold
@@ -66,22 +179,213 @@ class SaleItems(models.Model):
         max_digits=10, decimal_places=2, blank=True, null=True
     )  # Subtotal for this item
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember which sale and line the item was loaded with
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_sales_id = instance.sales_id
+        instance._loaded_line = (
+            instance.__dict__.get("product_id"),
+            instance.__dict__.get("quantity"),
+            instance.__dict__.get("subtotal"),
+        )
+        return instance
+
+    def stored_subtotal(self):
+        # The subtotal currently stored for this item, read inside the UPDATE
+        stored = SaleItems.objects.filter(pk=self.pk).values("subtotal")
+        return Coalesce(Subquery(stored), ZERO)
+
+    def previous_sale(self):
+        # The sale the stored item belongs to (None for a new item)
+        if self._state.adding:
+            return None
+        previous_sales_id = getattr(self, "_loaded_sales_id", self.sales_id)
+        if previous_sales_id == self.sales_id:
+            return self.sales
+        return Sales.objects.get(pk=previous_sales_id)
+
+    def stored_line(self):
+        # (product id, quantity, subtotal) of the item as it was loaded
+        return getattr(self, "_loaded_line", (None, None, None))
+
+    def held_stock(self, previous_sale):
+        # Stock held by the stored line (only completed sales hold stock)
+        product_id, quantity, _ = self.stored_line()
+        if previous_sale is None or product_id is None:
+            return {}
+        if previous_sale.status != stock.STOCK_HOLDING_STATUS:
+            return {}
+        return {product_id: quantity}
+
     def save(self, *args, **kwargs):
         """
         Calculate the subtotal before saving.
-        After saving, update the parent sale's total amount.
+        The parent sale's total is adjusted by the difference between the
+        new and the stored subtotal in a single UPDATE, so saving an item
+        costs the same no matter how many items the sale has.
         """
-        self.subtotal = self.quantity * self.product.unit_price
-        super().save(*args, **kwargs)
-        self.sales.update_total()
+        self.subtotal = (self.quantity * self.product.unit_price).quantize(CENTS)
+        sales = Sales.objects.filter(pk=self.sales_id)
+        previous_sale = self.previous_sale()
+        held = self.held_stock(previous_sale)
+        taken = {}
+        if self.sales.status == stock.STOCK_HOLDING_STATUS:
+            taken = {self.product_id: self.quantity}
+        with transaction.atomic():
+            # Lines of completed sales move stock by the net change in quantity
+            stock.rebalance(held, taken, stock.sale_reference(self.sales))
+            if previous_sale is None:
+                sales.add_to_total(self.subtotal)
+            elif previous_sale.pk == self.sales_id:
+                sales.add_to_total(self.subtotal - self.stored_subtotal())
+            else:
+                Sales.objects.filter(pk=previous_sale.pk).add_to_total(
+                    -self.stored_subtotal()
+                )
+                sales.add_to_total(self.subtotal)
+            super().save(*args, **kwargs)
+            rollups.line_changed(previous_sale, self.stored_line(), self.sales, self)
+            receipts.sales_changed(previous_sale, self.sales)
+        self._loaded_sales_id = self.sales_id
+        self._loaded_line = (self.product_id, self.quantity, self.subtotal)
 
     def delete(self, *args, **kwargs):
         """
-        When an item is deleted, update the parent sale's total amount.
+        When an item is deleted, subtract its stored subtotal from the parent sale
+        and, if the sale is completed, put the line back into stock.
         """
-        super().delete(*args, **kwargs)
-        self.sales.update_total()
+        previous_sale = self.previous_sale()
+        with transaction.atomic():
+            stock.rebalance(
+                self.held_stock(previous_sale), {}, stock.sale_reference(previous_sale)
+            )
+            Sales.objects.filter(pk=previous_sale.pk).add_to_total(
+                -self.stored_subtotal()
+            )
+            rollups.line_changed(previous_sale, self.stored_line(), None, None)
+            receipts.sales_changed(previous_sale)
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         # String representation for easy identification in admin and logs
         return f"{self.product.name} x {self.quantity} = {self.subtotal}"
+
+    class Meta:
+        indexes = [
+            # Items of a sale, and a given product within a sale
+            models.Index(
+                fields=["sales", "product"], name="sales_item_sale_product_idx"
+            ),
+            # Sales history of a product, most recent lines first
+            models.Index(fields=["product", "id"], name="sales_item_product_id_idx"),
+        ]
+
+
+class Receipt(models.Model):
+    """
+    The rendered receipt of a completed sale, kept for reprints.
+    Rendered once, off the request path, when the sale is completed, and
+    replaced whenever the sale or its items change (see sales.receipts).
+    """
+
+    sale = models.OneToOneField(
+        Sales, on_delete=models.CASCADE, primary_key=True
+    )  # The sale the receipt is for
+    text = models.TextField()  # Plain text for thermal printers
+    html = models.TextField()  # HTML for screens, e-mail and browser printing
+    rendered_at = models.DateTimeField()  # When the receipt was rendered
+
+    def __str__(self):
+        # String representation for easy identification in admin and logs
+        return f"Receipt for sale {self.sale_id}"
+
+
+class SalesRollup(models.Model):
+    """
+    Sales totals per hour or day, payment method and status.
+    Maintained incrementally as sales are settled, edited or deleted (see
+    sales.rollups) and rebuilt from the raw sales by `rebuild_rollups`.
+    Only completed and cancelled sales are rolled up.
+    """
+
+    GRANULARITY_CHOICES = [("hour", "Hour"), ("day", "Day")]
+    granularity = models.CharField(
+        choices=GRANULARITY_CHOICES, max_length=10
+    )  # Length of the period
+    period = models.DateTimeField()  # Start of the hour or day (project time zone)
+    payment_method = models.CharField(
+        choices=Sales.PAYMENT_METHOD_CHOICES, max_length=20
+    )  # Payment method of the sales counted
+    status = models.CharField(
+        choices=Sales.STATUS_CHOICES, max_length=20
+    )  # Status of the sales counted
+    sale_count = models.IntegerField(default=0)  # Number of sales
+    total_amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )  # Sum of the sales' totals
+
+    class Meta:
+        constraints = [
+            # One row per bucket; also the lookup index for the reports
+            models.UniqueConstraint(
+                fields=["granularity", "period", "payment_method", "status"],
+                name="sales_rollup_bucket_uniq",
+            ),
+        ]
+
+
+class ProductSalesRollup(models.Model):
+    """
+    Quantity and revenue sold per hour or day, product (and its category),
+    payment method and status. Maintained alongside SalesRollup.
+    """
+
+    granularity = models.CharField(
+        choices=SalesRollup.GRANULARITY_CHOICES, max_length=10
+    )  # Length of the period
+    period = models.DateTimeField()  # Start of the hour or day (project time zone)
+    payment_method = models.CharField(
+        choices=Sales.PAYMENT_METHOD_CHOICES, max_length=20
+    )  # Payment method of the sales counted
+    status = models.CharField(
+        choices=Sales.STATUS_CHOICES, max_length=20
+    )  # Status of the sales counted
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE, db_index=False
+    )  # Product sold
+    category = models.ForeignKey(
+        "products.Category", on_delete=models.CASCADE, db_index=False
+    )  # Category of the product when it was sold
+    quantity = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )  # Quantity sold
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )  # Sum of the lines' subtotals
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "granularity",
+                    "period",
+                    "payment_method",
+                    "status",
+                    "product",
+                    "category",
+                ],
+                name="product_rollup_bucket_uniq",
+            ),
+        ]
+        indexes = [
+            # Per-product and per-category reports over a date range
+            models.Index(
+                fields=["granularity", "product", "period"],
+                name="product_rollup_product_idx",
+            ),
+            models.Index(
+                fields=["granularity", "category", "period"],
+                name="product_rollup_category_idx",
+            ),
+        ]
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import random
+import re
+
+from .http import ConnectionPool, HttpError
+from .providers import FAILED, PENDING, SUCCESSFUL
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_PATH = re.compile(r"^/collection/v1_0/requesttopay(?:/([^/?]+))?/?$")
+REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    409: "Conflict",
+}
+
+
+class FakeProvider:
+    """
+    Local stand-in for the MoMo collections API, for development and
+    offline load tests (see `python manage.py fake_payment_provider`).
+
+    Every collection stays PENDING for `delay` seconds, then becomes FAILED
+    with probability `failure_rate` and SUCCESSFUL otherwise. Collections
+    sent with an X-Callback-Url header get a callback once settled.
+    Each response is held for `latency` seconds to mimic a real network.
+    Payers whose number starts with "000" are rejected outright.
+    State is kept in memory for as long as the server runs.
+    """
+
+    def __init__(self, delay=2.0, failure_rate=0.1, latency=0.0, seed=None):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.collections = {}  # reference -> collection
+        self.callbacks = {}  # Callback origin -> connection pool
+        self.connections = set()  # Writers of the open client connections
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        # Serve requests on one keep-alive connection until the client closes it
+        self.connections.add(writer)
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                status, data = await self.dispatch(*request)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                body = b"" if data is None else json.dumps(data).encode()
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n\r\n"
+                    ).encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    async def dispatch(self, method, path, headers, body):
+        match = COLLECTION_PATH.match(path)
+        if match is None:
+            return 404, {"message": "Not found"}
+        reference = match.group(1)
+        if method == "POST" and reference is None:
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"message": "Invalid JSON"}
+            return self.request_to_pay(headers, payload)
+        if method == "GET" and reference is not None:
+            collection = self.collections.get(reference)
+            if collection is None:
+                return 404, {"message": "Unknown reference"}
+            return 200, collection
+        return 404, {"message": "Not found"}
+
+    def request_to_pay(self, headers, payload):
+        reference = headers.get("x-reference-id")
+        if not reference:
+            return 400, {"message": "X-Reference-Id header is required"}
+        if reference in self.collections:
+            return 409, {"message": "Duplicate reference"}
+        phone = str(payload.get("payer", {}).get("partyId", ""))
+        if not phone or phone.startswith("000"):
+            return 400, {"message": "Invalid payer"}
+        self.collections[reference] = {
+            "referenceId": reference,
+            "externalId": payload.get("externalId"),
+            "amount": payload.get("amount"),
+            "currency": payload.get("currency"),
+            "status": PENDING,
+        }
+        outcome = FAILED if self.random.random() < self.failure_rate else SUCCESSFUL
+        asyncio.get_running_loop().call_later(
+            self.delay, self.settle, reference, outcome, headers.get("x-callback-url")
+        )
+        return 202, None
+
+    def settle(self, reference, outcome, callback_url):
+        collection = self.collections[reference]
+        collection["status"] = outcome
+        if callback_url:
+            asyncio.ensure_future(self.callback(callback_url, collection))
+
+    async def callback(self, url, collection):
+        origin, _, path = url.partition("://")[2].partition("/")
+        scheme = url.partition("://")[0]
+        pool = self.callbacks.get(origin)
+        if pool is None:
+            pool = self.callbacks[origin] = ConnectionPool(f"{scheme}://{origin}")
+        try:
+            await pool.request("POST", "/" + path, collection)
+        except HttpError as exc:
+            logger.warning("Callback for %s failed: %s", collection["referenceId"], exc)
+
+    def close(self):
+        # Drop the client connections (their handlers then stop) and pools
+        for writer in list(self.connections):
+            writer.close()
+        for pool in self.callbacks.values():
+            pool.close()
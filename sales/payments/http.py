@@ -0,0 +1,125 @@
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+
+
+class HttpError(Exception):
+    """
+    Raised when a provider cannot be reached or answers with something that
+    is not a well-formed HTTP response.
+    """
+
+
+class ConnectionPool:
+    """
+    Minimal asyncio HTTP/1.1 client for JSON APIs, keeping connections to a
+    single origin alive between requests.
+
+    At most `max_connections` requests are in flight at once; callers beyond
+    that wait for a free connection instead of opening new sockets. Idle
+    connections are reused, and a request that fails on a reused connection
+    (closed by the server in the meantime) is retried once on a fresh one.
+    A pool belongs to the event loop it is first used in.
+    """
+
+    def __init__(self, base_url, max_connections=100, timeout=10.0):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle = []  # (reader, writer) pairs ready for reuse
+
+    async def request(self, method, path, payload=None, headers=None):
+        """
+        Send a request and return (status code, decoded JSON body or None).
+        Raises HttpError on connection errors, timeouts and bad responses.
+        """
+        body = b"" if payload is None else json.dumps(payload).encode()
+        head = self.encode_head(method, path, body, headers or {})
+        async with self.slots:
+            for attempt in range(2):
+                reused = bool(self.idle)
+                connection = self.idle.pop() if reused else await self.connect()
+                try:
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self.exchange(connection, head + body), self.timeout
+                    )
+                except (OSError, asyncio.IncompleteReadError) as exc:
+                    connection[1].close()
+                    if reused and attempt == 0:
+                        continue  # Stale keep-alive connection: retry once
+                    raise HttpError(f"{method} {path}: {exc!r}") from exc
+                except BaseException:
+                    connection[1].close()  # Timeouts and cancellation
+                    raise
+                if keep_alive:
+                    self.idle.append(connection)
+                else:
+                    connection[1].close()
+                break
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError as exc:
+            raise HttpError(f"{method} {path}: invalid JSON body") from exc
+
+    async def connect(self):
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+                self.timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise HttpError(f"Cannot connect to {self.host}:{self.port}") from exc
+
+    def encode_head(self, method, path, body, headers):
+        lines = [
+            f"{method} {self.prefix}{path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Accept: application/json",
+            "Connection: keep-alive",
+            f"Content-Length: {len(body)}",
+        ]
+        if body:
+            lines.append("Content-Type: application/json")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def exchange(self, connection, message):
+        # Write one request and read its response: (status, body, keep_alive)
+        reader, writer = connection
+        writer.write(message)
+        await writer.drain()
+        status_line = await reader.readline()
+        parts = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise asyncio.IncompleteReadError(status_line, None)
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)  # Chunk and CRLF
+                if not size:
+                    break
+                body += chunk[:-2]
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body, keep_alive = await reader.read(), False
+        return status, body, keep_alive
+
+    def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
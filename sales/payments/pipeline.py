@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import uuid
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from ..models import Sales
+from ..stock import InsufficientStock, SaleStatusConflict
+from .providers import FAILED, PENDING, SUCCESSFUL, PaymentRejected, get_provider
+
+logger = logging.getLogger(__name__)
+
+MOBILE_PAYMENT = "mobile payment"
+# Sale status a final provider outcome moves a pending sale to
+SETTLED_STATUS = {SUCCESSFUL: "completed", FAILED: "cancelled"}
+
+
+class PaymentNotAllowed(APIException):
+    """
+    Raised when a collection is started for a sale that is not a pending
+    mobile payment.
+    """
+
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Only pending mobile payment sales can be collected."
+    default_code = "payment_not_allowed"
+
+
+def claim_reference(sale_id):
+    """
+    Give a pending mobile payment sale its provider reference, unless it
+    already has one: starting a collection again reuses the reference, so
+    the provider treats it as the same request. Returns the sale.
+    """
+    sale = Sales.objects.get(pk=sale_id)
+    if sale.payment_method != MOBILE_PAYMENT or sale.status != "pending":
+        raise PaymentNotAllowed()
+    if not sale.payment_reference:
+        # Conditional so two concurrent starts agree on a single reference
+        Sales.objects.filter(pk=sale.pk, payment_reference__isnull=True).update(
+            payment_reference=str(uuid.uuid4())
+        )
+        sale.refresh_from_db(fields=["payment_reference"])
+    return sale
+
+
+def release_reference(sale_id, reference):
+    # Forget a reference the provider refused, so the collection can be retried
+    Sales.objects.filter(pk=sale_id, payment_reference=reference).update(
+        payment_reference=None
+    )
+
+
+def settle(sale_id, outcome):
+    """
+    Move a pending sale to completed or cancelled after the provider's final
+    outcome. Completing it takes its items out of stock. Returns the new
+    status, or None when the sale was settled already (by a callback or
+    another worker) or cannot be completed for lack of stock.
+    """
+    try:
+        sale = Sales.objects.get(pk=sale_id, status="pending")
+    except Sales.DoesNotExist:
+        return None
+    sale.status = SETTLED_STATUS[outcome]
+    try:
+        sale.save()
+    except SaleStatusConflict:
+        return None
+    except InsufficientStock as exc:
+        # Paid but not fulfillable: leave it pending for a manager to resolve
+        logger.error("Sale %s paid but out of stock: %s", sale_id, exc.shortages)
+        return None
+    return sale.status
+
+
+class PaymentVerifier:
+    """
+    Follows collections until the provider reports a final outcome.
+
+    Each tracked collection is an asyncio task polling the provider with
+    exponential backoff (POLL_INTERVAL up to MAX_POLL_INTERVAL seconds) and
+    giving up after TIMEOUT seconds; a sale left pending is picked up again
+    by `manage.py verify_payments`. Thousands of collections can be in
+    flight: they only hold a connection while a status request is running,
+    and the provider's pool bounds how many run at once. At most
+    MAX_IN_FLIGHT collections are tracked per event loop.
+    """
+
+    def __init__(self, provider, **options):
+        self.provider = provider
+        self.poll_interval = options.get("POLL_INTERVAL", 2.0)
+        self.max_poll_interval = options.get("MAX_POLL_INTERVAL", 30.0)
+        self.timeout = options.get("TIMEOUT", 600.0)
+        self.max_in_flight = options.get("MAX_IN_FLIGHT", 5000)
+        self.tasks = {}  # reference -> polling task
+
+    async def start(self, sale_id, phone):
+        """
+        Start (or restart) the collection for a sale and track it.
+        Returns the sale with its payment reference.
+        """
+        sale = await sync_to_async(claim_reference)(sale_id)
+        reference = sale.payment_reference
+        try:
+            await self.provider.request_to_pay(
+                reference, sale.total_amount, phone, sale.pk
+            )
+        except PaymentRejected as exc:
+            await sync_to_async(release_reference)(sale.pk, reference)
+            raise ValidationError({"phone": [str(exc)]})
+        self.track(sale.pk, reference)
+        return sale
+
+    def track(self, sale_id, reference):
+        if reference in self.tasks:
+            return
+        if len(self.tasks) >= self.max_in_flight:
+            logger.warning("Not tracking payment %s: too many in flight", reference)
+            return
+        task = asyncio.create_task(self.follow(sale_id, reference))
+        self.tasks[reference] = task
+        task.add_done_callback(lambda _: self.tasks.pop(reference, None))
+
+    async def check(self, sale_id, reference):
+        """
+        Ask the provider once and settle the sale if the outcome is final.
+        Returns the outcome (PENDING on provider errors).
+        """
+        try:
+            outcome = await self.provider.collection_status(reference)
+        except Exception as exc:  # Unknown outcome: poll again later
+            logger.warning("Payment %s status unavailable: %s", reference, exc)
+            return PENDING
+        if outcome != PENDING:
+            await sync_to_async(settle)(sale_id, outcome)
+        return outcome
+
+    async def follow(self, sale_id, reference):
+        # Poll with backoff until a final outcome or the timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        delay = self.poll_interval
+        while loop.time() < deadline:
+            await asyncio.sleep(delay)
+            outcome = await self.check(sale_id, reference)
+            if outcome != PENDING:
+                return outcome
+            delay = min(delay * 2, self.max_poll_interval)
+        logger.warning("Payment %s still pending after %ss", reference, self.timeout)
+        return PENDING
+
+    async def notify(self, reference):
+        """
+        Handle a provider callback for `reference`. The callback body is not
+        trusted: the outcome is confirmed with a status request.
+        """
+        sale_id = await sync_to_async(
+            Sales.objects.filter(payment_reference=reference)
+            .values_list("pk", flat=True)
+            .first
+        )()
+        if sale_id is None:
+            return None
+        outcome = await self.check(sale_id, reference)
+        task = self.tasks.get(reference)
+        if outcome != PENDING and task is not None:
+            task.cancel()
+        return outcome
+
+    async def wait(self):
+        # Wait for every tracked collection to finish
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks.values()), return_exceptions=True)
+
+
+_verifiers = weakref.WeakKeyDictionary()  # Event loop -> verifier
+
+
+def get_verifier():
+    """
+    Return the verifier of the running event loop, configured from
+    settings.PAYMENT_VERIFICATION. Under an ASGI server all requests share
+    the server's loop, so tracked collections outlive the request that
+    started them.
+    """
+    loop = asyncio.get_running_loop()
+    verifier = _verifiers.get(loop)
+    if verifier is None:
+        verifier = PaymentVerifier(get_provider(), **settings.PAYMENT_VERIFICATION)
+        _verifiers[loop] = verifier
+    return verifier
@@ -0,0 +1,136 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .http import ConnectionPool, HttpError
+
+# Outcomes of a collection as reported by a provider
+PENDING, SUCCESSFUL, FAILED = "PENDING", "SUCCESSFUL", "FAILED"
+
+
+class ProviderError(Exception):
+    """
+    Raised when the provider cannot be reached or answers unexpectedly.
+    The outcome of the call is unknown, so it is safe to retry (collections
+    are idempotent on their reference).
+    """
+
+
+class PaymentRejected(Exception):
+    """
+    Raised when the provider refuses a collection request (e.g. an invalid
+    phone number). The request will not succeed if retried as is.
+    """
+
+
+class BaseProvider:
+    """
+    Interface of a mobile money provider.
+    A collection is identified by a reference chosen by the caller, so
+    starting the same collection twice never charges the customer twice.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    async def request_to_pay(self, reference, amount, phone, external_id):
+        # Ask the customer (by phone number) to approve a payment of `amount`
+        raise NotImplementedError
+
+    async def collection_status(self, reference):
+        # Return PENDING, SUCCESSFUL or FAILED for a collection
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MoMoProvider(BaseProvider):
+    """
+    MTN MoMo style collections API (also served by the fake provider, see
+    `python manage.py fake_payment_provider`):
+        POST /collection/v1_0/requesttopay          (X-Reference-Id header)
+        GET  /collection/v1_0/requesttopay/<reference>
+    Requests share a pool of keep-alive connections of MAX_CONNECTIONS.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.pool = ConnectionPool(
+            options["BASE_URL"],
+            max_connections=options.get("MAX_CONNECTIONS", 100),
+            timeout=options.get("TIMEOUT", 10.0),
+        )
+
+    def headers(self, **extra):
+        headers = {"X-Target-Environment": self.options.get("ENVIRONMENT", "sandbox")}
+        if self.options.get("API_KEY"):
+            headers["Authorization"] = f"Bearer {self.options['API_KEY']}"
+        if self.options.get("SUBSCRIPTION_KEY"):
+            headers["Ocp-Apim-Subscription-Key"] = self.options["SUBSCRIPTION_KEY"]
+        headers.update(extra)
+        return headers
+
+    async def call(self, method, path, payload=None, headers=None):
+        try:
+            return await self.pool.request(method, path, payload, headers)
+        except HttpError as exc:
+            raise ProviderError(str(exc)) from exc
+
+    async def request_to_pay(self, reference, amount, phone, external_id):
+        extra = {"X-Reference-Id": reference}
+        if self.options.get("CALLBACK_URL"):
+            extra["X-Callback-Url"] = self.options["CALLBACK_URL"]
+        status, data = await self.call(
+            "POST",
+            "/collection/v1_0/requesttopay",
+            {
+                "amount": str(amount),
+                "currency": self.options.get("CURRENCY", "GHS"),
+                "externalId": str(external_id),
+                "payer": {"partyIdType": "MSISDN", "partyId": phone},
+                "payerMessage": f"Payment for sale {external_id}",
+                "payeeNote": f"Sale {external_id}",
+            },
+            self.headers(**extra),
+        )
+        if status == 409:
+            return  # Already requested with this reference
+        if 400 <= status < 500:
+            raise PaymentRejected((data or {}).get("message", f"HTTP {status}"))
+        if status != 202:
+            raise ProviderError(f"Unexpected status {status} for request to pay")
+
+    async def collection_status(self, reference):
+        status, data = await self.call(
+            "GET", f"/collection/v1_0/requesttopay/{reference}", headers=self.headers()
+        )
+        if status == 404:
+            return FAILED  # The provider never accepted the request
+        if status != 200 or not isinstance(data, dict):
+            raise ProviderError(f"Unexpected status {status} for collection status")
+        outcome = data.get("status")
+        return outcome if outcome in (SUCCESSFUL, FAILED) else PENDING
+
+    def close(self):
+        self.pool.close()
+
+
+_providers = weakref.WeakKeyDictionary()  # Event loop -> provider
+
+
+def get_provider():
+    """
+    Return the provider configured in settings.PAYMENT_PROVIDER for the
+    running event loop. Connections cannot be shared between loops, so each
+    loop (the ASGI server's, or a command's) gets its own provider and pool.
+    """
+    loop = asyncio.get_running_loop()
+    provider = _providers.get(loop)
+    if provider is None:
+        options = dict(settings.PAYMENT_PROVIDER)
+        provider = import_string(options.pop("BACKEND"))(**options)
+        _providers[loop] = provider
+    return provider
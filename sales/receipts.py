@@ -0,0 +1,189 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from jobs.queue import enqueue, handler
+
+# Only completed sales get a receipt
+RECEIPT_STATUS = "completed"
+# Stored renderings of a receipt, by format name -> content type
+RECEIPT_FORMATS = {
+    "txt": "text/plain; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+}
+RENDER_BATCH_SIZE = 200  # Sales rendered per query
+RENDER_JOB = "sales.render_receipts"
+
+
+def format_quantity(quantity):
+    # "2" for whole quantities, "1.5" otherwise
+    if quantity == quantity.to_integral():
+        return f"{quantity:.0f}"
+    return f"{quantity.normalize():f}"
+
+
+def unit_price(item):
+    # The price the item was sold at, which the product may no longer have
+    if item.subtotal is None or not item.quantity:
+        return item.product.unit_price
+    return item.subtotal / item.quantity
+
+
+def receipt_lines(sale):
+    """
+    The content of a sale's receipt, shared by every format: a dict with
+    the shop name, sale id, local date, lines (name, quantity, unit price,
+    subtotal), total, payment method and provider reference.
+    """
+    return {
+        "shop_name": settings.RECEIPTS["SHOP_NAME"],
+        "sale": sale.pk,
+        "date": timezone.localtime(sale.date).strftime("%Y-%m-%d %H:%M"),
+        "lines": [
+            {
+                "name": item.product.name,
+                "quantity": format_quantity(item.quantity),
+                "unit_price": f"{unit_price(item):.2f}",
+                "subtotal": f"{item.subtotal or Decimal('0'):.2f}",
+            }
+            for item in sale.saleitems_set.all()
+        ],
+        "total": f"{sale.total_amount:.2f}",
+        "payment_method": sale.get_payment_method_display(),
+        "payment_reference": sale.payment_reference,
+    }
+
+
+def render_text(receipt):
+    """
+    Plain text receipt for thermal printers, settings.RECEIPTS["WIDTH"]
+    characters per line.
+    """
+    width = settings.RECEIPTS["WIDTH"]
+    rule = "-" * width
+
+    def columns(left, right):
+        # Left and right aligned on one line; the left text is cut to fit
+        left = left[: max(width - len(right) - 1, 0)]
+        return left + " " * (width - len(left) - len(right)) + right
+
+    lines = [
+        receipt["shop_name"][:width].center(width).rstrip(),
+        columns(f"Sale {receipt['sale']}", receipt["date"]),
+        rule,
+    ]
+    for line in receipt["lines"]:
+        lines.append(line["name"][:width])
+        lines.append(
+            columns(f"  {line['quantity']} x {line['unit_price']}", line["subtotal"])
+        )
+    lines += [rule, columns("TOTAL", receipt["total"])]
+    lines.append(columns("Paid by", receipt["payment_method"]))
+    if receipt["payment_reference"]:
+        lines.append(columns("Reference", receipt["payment_reference"]))
+    lines += [rule, "Thank you for shopping with us!".center(width).rstrip()]
+    return "\n".join(lines) + "\n"
+
+
+def render_html(receipt):
+    # HTML receipt for screens, e-mail and printing from a browser
+    return render_to_string("sales/receipt.html", receipt)
+
+
+def render(sale_ids):
+    """
+    Render and store the receipts of the completed sales among `sale_ids`
+    (the others are skipped): per batch, one query for the sales, one for
+    their items and products and one upsert into the receipt store.
+    Each batch is read and written in one transaction that locks its
+    sales, so an edit committed meanwhile is never overwritten by a
+    receipt rendered from the data it replaced.
+    Returns the number of receipts stored.
+    """
+    from .models import Receipt, Sales
+
+    sale_ids = sorted(set(sale_ids))
+    stored = 0
+    for start in range(0, len(sale_ids), RENDER_BATCH_SIZE):
+        with transaction.atomic():
+            sales = (
+                Sales.objects.select_for_update()
+                .filter(
+                    pk__in=sale_ids[start : start + RENDER_BATCH_SIZE],
+                    status=RECEIPT_STATUS,
+                )
+                .order_by("pk")
+                .with_items(products=True)
+            )
+            receipts = []
+            for sale in sales:
+                receipt = receipt_lines(sale)
+                receipts.append(
+                    Receipt(
+                        sale=sale,
+                        text=render_text(receipt),
+                        html=render_html(receipt),
+                        rendered_at=timezone.now(),
+                    )
+                )
+            Receipt.objects.bulk_create(
+                receipts,
+                update_conflicts=True,
+                unique_fields=["sale"],
+                update_fields=["text", "html", "rendered_at"],
+            )
+            stored += len(receipts)
+    return stored
+
+
+@handler(RENDER_JOB, batch_size=RENDER_BATCH_SIZE)
+def render_receipts(payloads):
+    # Background job: a batch of queued renderings in one render() call
+    render(payload["sale"] for payload in payloads)
+
+
+def schedule(sale_ids):
+    """
+    Queue the rendering of the receipts of `sale_ids` in the current
+    transaction; a job worker renders them once it commits, so requests do
+    not wait for it. Reprints render the receipts still missing.
+    """
+    enqueue(RENDER_JOB, ({"sale": pk} for pk in sale_ids))
+
+
+def invalidate(sale_ids):
+    # Drop the stored receipts of `sale_ids`, whose content changed
+    from .models import Receipt
+
+    Receipt.objects.filter(sale__in=sale_ids).delete()
+
+
+def sales_changed(*sales):
+    """
+    Drop the stored receipts of the completed sales among `sales` and
+    render them again after the commit. Other sales have no receipt, so
+    they cost nothing.
+    """
+    sale_ids = {
+        sale.pk for sale in sales if sale is not None and sale.status == RECEIPT_STATUS
+    }
+    if sale_ids:
+        invalidate(sale_ids)
+        schedule(sale_ids)
+
+
+def get_receipt(sale):
+    """
+    The stored receipt of a completed sale. A receipt that is missing
+    (still being rendered, or its rendering failed) is rendered now.
+    """
+    from .models import Receipt
+
+    receipt = Receipt.objects.filter(sale=sale.pk).first()
+    if receipt is None:
+        render([sale.pk])
+        receipt = Receipt.objects.filter(sale=sale.pk).first()
+    return receipt
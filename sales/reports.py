@@ -0,0 +1,55 @@
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from retail_software.replica import primary_reads
+from .rollups import period_start, reports_generation
+
+# Reports covering only closed days never change, so clients may keep them
+CLOSED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def closed_until(request):
+    # The report's exclusive end, or None when it is open-ended or malformed
+    value = request.query_params.get("date_to")
+    if not value:
+        return None
+    try:
+        return serializers.DateTimeField().to_internal_value(value)
+    except serializers.ValidationError:
+        return None  # The handler reports the error
+
+
+def closed_days_cached(get):
+    """
+    Decorator for report GET handlers.
+    A report whose date_to is at or before the start of the current day
+    only covers closed days, which no longer change: its data is cached
+    without expiry, keyed by generation and full path, and the response is
+    marked immutable for clients. Other reports are built on every request.
+    A late change to a closed day (e.g. an old sale cancelled) starts a new
+    server-side generation; clients holding the old response keep it.
+    Cached data is read from the primary, as a replica may not have the
+    change that started the generation yet.
+    """
+
+    @wraps(get)
+    def wrapper(view, request, *args, **kwargs):
+        end = closed_until(request)
+        if end is None or end > period_start(timezone.now(), "day"):
+            return get(view, request, *args, **kwargs)
+        key = f"reports:{reports_generation()}:{request.get_full_path()}"
+        data = cache.get(key)
+        if data is None:
+            with primary_reads():
+                response = get(view, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, timeout=None)
+        return Response(data, headers={"Cache-Control": CLOSED_CACHE_CONTROL})
+
+    return wrapper
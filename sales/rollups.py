@@ -0,0 +1,248 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from products.models import Products
+
+# Only settled sales are rolled up; pending sales have not happened yet
+ROLLUP_STATUSES = ("completed", "cancelled")
+GRANULARITIES = ("hour", "day")
+UPSERT_BATCH_SIZE = 500  # Rows per INSERT statement, well under parameter limits
+REPORTS_GENERATION_KEY = "reports:generation"
+
+SALES_KEY = ["granularity", "period", "payment_method", "status"]
+SALES_SUMS = ["sale_count", "total_amount"]
+PRODUCT_KEY = [
+    "granularity",
+    "period",
+    "payment_method",
+    "status",
+    "product",
+    "category",
+]
+PRODUCT_SUMS = ["quantity", "revenue"]
+
+
+def period_start(moment, granularity):
+    """
+    Start of the hour or day containing `moment`, in the project time zone.
+    """
+    local = timezone.localtime(moment)
+    if granularity == "hour":
+        return local.replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def reports_generation():
+    """
+    Return the generation of cached closed-day reports (see sales.reports).
+    Changing a closed day's rollups starts a new generation, so reports
+    cached before the change are no longer used.
+    """
+    generation = cache.get(REPORTS_GENERATION_KEY)
+    if generation is None:
+        cache.add(REPORTS_GENERATION_KEY, 0, timeout=None)
+        generation = cache.get(REPORTS_GENERATION_KEY)
+    return generation
+
+
+def bump_reports_generation():
+    cache.set(REPORTS_GENERATION_KEY, reports_generation() + 1, timeout=None)
+
+
+def upsert(model, key_fields, sum_fields, rows):
+    """
+    Add `rows` (tuples of key values followed by sum values) to a rollup
+    table: new keys are inserted, existing ones have their sums incremented,
+    with INSERT ... ON CONFLICT DO UPDATE (SQLite and PostgreSQL).
+    Rows sharing a key are merged first, as PostgreSQL refuses to update
+    the same row twice in one statement.
+    """
+    merged = {}
+    for row in rows:
+        key, sums = tuple(row[: len(key_fields)]), row[len(key_fields) :]
+        previous = merged.get(key, (0,) * len(sums))
+        merged[key] = tuple(a + b for a, b in zip(previous, sums))
+    rows = [key + sums for key, sums in merged.items()]
+    meta, quote = model._meta, connection.ops.quote_name
+    fields = [meta.get_field(name) for name in key_fields + sum_fields]
+    columns = [quote(field.column) for field in fields]
+    table = quote(meta.db_table)
+    updates = ", ".join(
+        f"{column} = {table}.{column} + excluded.{column}"
+        for column in columns[len(key_fields) :]
+    )
+    row_placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start : start + UPSERT_BATCH_SIZE]
+            params = [
+                field.get_db_prep_save(value, connection)
+                for row in batch
+                for field, value in zip(fields, row)
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES {', '.join([row_placeholder] * len(batch))} "
+                f"ON CONFLICT ({', '.join(columns[: len(key_fields)])}) "
+                f"DO UPDATE SET {updates}",
+                params,
+            )
+
+
+def record(moment, status, payment_method, sales, amount, lines):
+    """
+    Add a change to the hourly and daily rollups of the periods containing
+    `moment`: `sales` to the sale count, `amount` to the total and every
+    (product id, category id, quantity, revenue) line to the product rollup.
+    Negative values take a change back out. Unsettled statuses are ignored.
+    """
+    record_many([(moment, status, payment_method, sales, amount, lines)])
+
+
+def record_many(changes):
+    """
+    Apply several `record` changes, given as (moment, status, payment method,
+    sales, amount, lines) tuples, with one upsert per rollup table.
+    """
+    from .models import ProductSalesRollup, SalesRollup
+
+    sale_rows, product_rows, closed = [], [], False
+    today = period_start(timezone.now(), "day")
+    for moment, status, payment_method, sales, amount, lines in changes:
+        if status not in ROLLUP_STATUSES:
+            continue
+        for granularity in GRANULARITIES:
+            period = period_start(moment, granularity)
+            key = (granularity, period, payment_method, status)
+            if sales or amount:
+                sale_rows.append(key + (sales, amount))
+            for line in lines:
+                product_rows.append(key + tuple(line))
+        closed = closed or period_start(moment, "day") < today
+    upsert(SalesRollup, SALES_KEY, SALES_SUMS, sale_rows)
+    upsert(ProductSalesRollup, PRODUCT_KEY, PRODUCT_SUMS, product_rows)
+    if closed:
+        transaction.on_commit(bump_reports_generation)
+
+
+def sale_lines(sale):
+    """
+    The (product id, category id, quantity, revenue) lines of a stored sale,
+    aggregated per product in the database.
+    """
+    return list(
+        sale.saleitems_set.values("product", "product__category")
+        .annotate(quantity=Sum("quantity"), revenue=Sum("subtotal"))
+        .values_list("product", "product__category", "quantity", "revenue")
+        .order_by()
+    )
+
+
+def item_lines(items):
+    # Lines of items whose products are already loaded (no queries)
+    return [
+        (item.product_id, item.product.category_id, item.quantity, item.subtotal)
+        for item in items
+    ]
+
+
+def negate(lines):
+    return [
+        (product, category, -quantity, -(revenue or 0))
+        for product, category, quantity, revenue in lines
+    ]
+
+
+def sale_created(sale, lines=()):
+    # A new sale counts once; its lines are added as they are saved
+    record(sale.date, sale.status, sale.payment_method, 1, sale.total_amount, lines)
+
+
+def sales_added(sales):
+    """
+    Count new sales given as (sale, items) pairs, the items' products being
+    loaded, with one upsert per rollup table for the whole batch.
+    """
+    changes = []
+    for sale, items in sales:
+        lines = item_lines(items)
+        changes.append(
+            (sale.date, sale.status, sale.payment_method, 1, sale.total_amount, lines)
+        )
+    record_many(changes)
+
+
+def items_added(sale, items):
+    # Lines bulk inserted into a sale whose total already includes them
+    record(sale.date, sale.status, sale.payment_method, 0, 0, item_lines(items))
+
+
+def sale_changed(sale, previous_status, previous_payment_method):
+    """
+    Move a stored sale between rollup buckets after its status or payment
+    method changed: out of the previous bucket and into the new one (either
+    of which may be unsettled, and then is skipped).
+    """
+    if (
+        previous_status not in ROLLUP_STATUSES
+        and sale.status not in ROLLUP_STATUSES
+    ):
+        return
+    lines = sale_lines(sale)
+    record(
+        sale.date,
+        previous_status,
+        previous_payment_method,
+        -1,
+        -sale.total_amount,
+        negate(lines),
+    )
+    record(sale.date, sale.status, sale.payment_method, 1, sale.total_amount, lines)
+
+
+def sale_deleted(sale):
+    # Take a sale and all of its lines back out of the rollups
+    if sale.status in ROLLUP_STATUSES:
+        sale.refresh_from_db(fields=["total_amount"])  # Items may have moved it
+        record(
+            sale.date,
+            sale.status,
+            sale.payment_method,
+            -1,
+            -sale.total_amount,
+            negate(sale_lines(sale)),
+        )
+
+
+def line_changed(old_sale, old_line, new_sale, new_item):
+    """
+    Keep the rollups in step when a line of a sale is added, edited, moved
+    to another sale or deleted. `old_line` is the stored
+    (product id, quantity, subtotal) of the line in `old_sale`, and
+    `new_item` the saved item in `new_sale`; either side may be None.
+    The sale totals move with the line revenue, as the sales' totals do.
+    """
+    changes = []
+    if old_sale is not None and old_sale.status in ROLLUP_STATUSES and old_line:
+        product_id, quantity, subtotal = old_line
+        if new_item is not None and new_item.product_id == product_id:
+            category_id = new_item.product.category_id
+        else:
+            category_id = Products.objects.values_list("category", flat=True).get(
+                pk=product_id
+            )
+        changes.append(
+            (old_sale, [(product_id, category_id, -quantity, -(subtotal or 0))])
+        )
+    if new_sale is not None and new_sale.status in ROLLUP_STATUSES and new_item:
+        if changes and changes[0][0].pk == new_sale.pk:
+            changes[0][1].extend(item_lines([new_item]))
+        else:
+            changes.append((new_sale, item_lines([new_item])))
+    for sale, lines in changes:
+        amount = sum((line[3] for line in lines), Decimal("0"))
+        record(sale.date, sale.status, sale.payment_method, 0, amount, lines)
@@ -1,17 +1,27 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Sales, SaleItems
+from rest_framework.fields import empty
+from .models import Sales, SaleItems, SalesRollup, ProductSalesRollup
+
+
+def whole_quantity(quantity):
+    # Products are stocked in whole units, so lines are too
+    if quantity != quantity.to_integral_value():
+        raise serializers.ValidationError("Quantity must be a whole number.")
 
 
 class SalesItemLightSerializer(serializers.ModelSerializer):
     """
     Lightweight serializer for sale items.
     Used for cashier views where only basic item info is needed.
-    Returns: id, product, and quantity.
+    Returns: id, sales, product, and quantity.
     """
 
     class Meta:
         model = SaleItems
-        fields = ["id", "product", "quantity"]
+        fields = ["id", "sales", "product", "quantity"]
+        extra_kwargs = {"quantity": {"validators": [whole_quantity]}}
 
 
 class SalesItemHeavySerializer(serializers.ModelSerializer):
@@ -23,12 +33,13 @@ class SalesItemHeavySerializer(serializers.ModelSerializer):
 
     product_name = serializers.CharField(source="product.name", read_only=True)
     unit_price = serializers.DecimalField(
-        source="product.unit_price", max_digits=10, decimal_places=2
+        source="product.unit_price", max_digits=10, decimal_places=2, read_only=True
     )
 
     class Meta:
         model = SaleItems
         fields = "__all__"
+        extra_kwargs = {"quantity": {"validators": [whole_quantity]}}
 
 
 class SalesLightSerializer(serializers.ModelSerializer):
@@ -37,7 +48,7 @@ class SalesLightSerializer(serializers.ModelSerializer):
     Used for cashier views to show basic sale info and a list of items (with minimal details).
     """
 
-    items = SalesItemLightSerializer(source="salesitems_set", many=True, read_only=True)
+    items = SalesItemLightSerializer(source="saleitems_set", many=True, read_only=True)
 
     class Meta:
         model = Sales
@@ -50,8 +61,145 @@ class SalesHeavySerializer(serializers.ModelSerializer):
     Used for admin or business owner views to show all sale info and a list of items (with full details).
     """
 
-    items = SalesItemHeavySerializer(source="salesitems_set", many=True, read_only=True)
+    items = SalesItemHeavySerializer(source="saleitems_set", many=True, read_only=True)
 
     class Meta:
         model = Sales
-        fields = ["id", "date", "status", "payment_method", "items"]
+        fields = [
+            "id",
+            "date",
+            "status",
+            "payment_method",
+            "payment_reference",
+            "items",
+        ]
+        read_only_fields = ["payment_reference"]  # Set by the payment pipeline
+
+
+class CartLineSerializer(serializers.Serializer):
+    """
+    A single line of a checkout cart.
+    The product is referenced either by its id (`product`) or by its `sku`.
+    """
+
+    product = serializers.IntegerField(required=False)
+    sku = serializers.CharField(max_length=100, required=False)
+    quantity = serializers.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        min_value=Decimal("0.01"),
+        validators=[whole_quantity],
+    )
+
+    def validate(self, attrs):
+        # Exactly one way of identifying the product must be given
+        if ("product" in attrs) == ("sku" in attrs):
+            raise serializers.ValidationError(
+                "Provide either 'product' or 'sku' for each line."
+            )
+        return attrs
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """
+    Input serializer for the checkout endpoint.
+    Takes the whole cart and the payment method in a single request.
+    """
+
+    payment_method = serializers.ChoiceField(choices=Sales.PAYMENT_METHOD_CHOICES)
+    items = CartLineSerializer(many=True, allow_empty=False)
+
+
+class SyncSaleSerializer(CheckoutSerializer):
+    """
+    A complete sale recorded by a terminal, as uploaded by batch sync.
+    The terminal's idempotency key identifies it across retries, and `date`
+    is when it recorded the sale (default: when it is stored).
+    """
+
+    idempotency_key = serializers.CharField(max_length=64)
+    date = serializers.DateTimeField(required=False)
+
+
+class SalesSyncSerializer(serializers.Serializer):
+    """
+    Input serializer for the batch sync endpoint.
+    Every sale must carry an idempotency key, which the results are keyed
+    by; the rest of each sale is validated on its own (see sales.sync), so
+    one bad sale does not hold back the others.
+    """
+
+    sales = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=1000
+    )
+
+    def validate_sales(self, sales):
+        key_field = SyncSaleSerializer().fields["idempotency_key"]
+        errors = {}
+        for index, sale in enumerate(sales):
+            try:
+                key_field.run_validation(sale.get("idempotency_key", empty))
+            except serializers.ValidationError as exc:
+                errors[index] = {"idempotency_key": exc.detail}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return sales
+
+
+class SalesRollupSerializer(serializers.ModelSerializer):
+    """
+    One bucket of the sales report: number and total of the sales with a
+    given payment method and status in an hour or day.
+    """
+
+    class Meta:
+        model = SalesRollup
+        fields = [
+            "granularity",
+            "period",
+            "payment_method",
+            "status",
+            "sale_count",
+            "total_amount",
+        ]
+
+
+class ProductSalesRollupSerializer(serializers.ModelSerializer):
+    """
+    One bucket of the product report: quantity and revenue of a product
+    sold with a given payment method and status in an hour or day.
+    """
+
+    class Meta:
+        model = ProductSalesRollup
+        fields = [
+            "granularity",
+            "period",
+            "payment_method",
+            "status",
+            "product",
+            "category",
+            "quantity",
+            "revenue",
+        ]
+
+
+class CategorySalesSerializer(serializers.Serializer):
+    """
+    One row of the category report: quantity and revenue of a category
+    in an hour or day, summed over the products and filters selected.
+    """
+
+    period = serializers.DateTimeField()
+    category = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class PaymentStartSerializer(serializers.Serializer):
+    """
+    Input serializer for starting a mobile money collection for a sale.
+    `phone` is the payer's mobile money number in international format.
+    """
+
+    phone = serializers.RegexField(r"^\+?\d{9,15}$", max_length=16)
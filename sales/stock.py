@@ -0,0 +1,226 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from products import ledger
+from products.cache import invalidate_stock
+from products.models import Products, StockMovement
+
+# The only status in which a sale holds stock
+STOCK_HOLDING_STATUS = "completed"
+
+
+class InsufficientStock(APIException):
+    """
+    Raised when completing a sale would take a product's stock below zero.
+    `shortages` maps each offending product id to the quantity requested.
+    The surrounding transaction is rolled back, so no line is applied.
+    """
+
+    status_code = status.HTTP_409_CONFLICT
+    default_code = "insufficient_stock"
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(
+            {
+                "detail": "Not enough stock to complete the sale.",
+                "products": {pk: str(qty) for pk, qty in shortages.items()},
+            }
+        )
+
+
+class FractionalQuantity(APIException):
+    """
+    Raised when stock would move by part of a unit: stock levels are whole
+    numbers. `quantities` maps each offending product id to its quantity.
+    Raised before any stock is moved.
+    """
+
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_code = "fractional_quantity"
+
+    def __init__(self, quantities):
+        self.quantities = quantities
+        super().__init__(
+            {
+                "detail": "Stock can only move by whole units.",
+                "products": {pk: str(qty) for pk, qty in quantities.items()},
+            }
+        )
+
+
+class SaleStatusConflict(APIException):
+    """
+    Raised when a sale's status was changed by someone else between
+    loading and saving it, so the stock movement cannot be applied safely.
+    """
+
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The sale status was changed by another request."
+    default_code = "sale_status_conflict"
+
+
+def sale_reference(sale):
+    # How the ledger refers to the sale that moved stock
+    return f"sale {sale.pk}"
+
+
+def sale_quantities(sale):
+    """
+    Total quantity per product for a stored sale, aggregated in the database.
+    """
+    rows = (
+        sale.saleitems_set.values("product")
+        .annotate(quantity=Sum("quantity"))
+        .values_list("product", "quantity")
+    )
+    return dict(rows)
+
+
+def item_quantities(items):
+    """
+    Total quantity per product for a list of (possibly unsaved) SaleItems.
+    """
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[item.product_id] += item.quantity
+    return dict(quantities)
+
+
+def check_whole(quantities):
+    # Stock is counted in whole units (Products.stock_quantity is an integer)
+    fractional = {
+        pk: quantity
+        for pk, quantity in quantities.items()
+        if quantity != int(quantity)
+    }
+    if fractional:
+        raise FractionalQuantity(fractional)
+
+
+def per_product(quantities):
+    # CASE expression yielding each product's (whole) quantity in a single UPDATE
+    return Case(
+        *(
+            When(pk=pk, then=Value(int(quantity)))
+            for pk, quantity in quantities.items()
+        ),
+        output_field=IntegerField(),
+    )
+
+
+def deduct(quantities, reason=StockMovement.SALE, reference=""):
+    """
+    Take stock for every product in `quantities` (product id -> quantity).
+    All products are decremented by one conditional UPDATE that only matches
+    rows with enough stock left, so concurrent sales can never oversell and
+    no value is read into Python first. If any row did not match, the update
+    is rolled back and InsufficientStock lists the short products.
+    The movements are appended to the ledger in the same transaction.
+    Raises FractionalQuantity first if any quantity is not a whole number.
+    """
+    deduct_many({reference: quantities}, reason)
+
+
+def deduct_many(references, reason=StockMovement.SALE):
+    """
+    Take stock for several sales at once: `references` maps each sale's
+    ledger reference to its product id -> quantity map. Their total is
+    taken with the single UPDATE of deduct(), and each sale's movements are
+    recorded under its own reference.
+    """
+    quantities = defaultdict(int)
+    entries = []
+    for reference, taken in references.items():
+        for pk, quantity in taken.items():
+            quantities[pk] += quantity
+        entries += ledger.movements(
+            {pk: -quantity for pk, quantity in taken.items()}, reason, reference
+        )
+    if not quantities:
+        return
+    check_whole(quantities)
+    requested = per_product(quantities)
+    try:
+        with transaction.atomic():
+            updated = Products.objects.filter(
+                pk__in=quantities, stock_quantity__gte=requested
+            ).update(
+                stock_quantity=F("stock_quantity") - requested,
+                updated_at=timezone.now(),
+            )
+            if updated != len(quantities):
+                raise InsufficientStock({})
+            ledger.write(entries)
+            invalidate_stock()  # Versioned apart from the rest of the catalog
+    except InsufficientStock:
+        # Only reached on failure: report which products fell short
+        available = dict(
+            Products.objects.filter(pk__in=quantities).values_list(
+                "pk", "stock_quantity"
+            )
+        )
+        raise InsufficientStock(
+            {
+                pk: quantity
+                for pk, quantity in quantities.items()
+                if available.get(pk, 0) < quantity
+            }
+        )
+
+
+def restore(quantities, reason=StockMovement.CANCELLATION, reference=""):
+    """
+    Give back stock for every product in `quantities` (product id -> quantity)
+    with a single UPDATE, and append the movements to the ledger.
+    """
+    if not quantities:
+        return
+    check_whole(quantities)
+    with transaction.atomic():
+        Products.objects.filter(pk__in=quantities).update(
+            stock_quantity=F("stock_quantity") + per_product(quantities),
+            updated_at=timezone.now(),
+        )
+        ledger.record(quantities, reason, reference)
+        invalidate_stock()
+
+
+def rebalance(released, taken, reference=""):
+    """
+    Apply the net stock change of replacing the `released` quantities with
+    the `taken` ones (both product id -> quantity), e.g. when a line of a
+    completed sale is edited. Only the difference per product is written.
+    """
+    net = defaultdict(int)
+    for product_id, quantity in taken.items():
+        net[product_id] += quantity
+    for product_id, quantity in released.items():
+        net[product_id] -= quantity
+    deduct(
+        {pk: quantity for pk, quantity in net.items() if quantity > 0},
+        reference=reference,
+    )
+    restore(
+        {pk: -quantity for pk, quantity in net.items() if quantity < 0},
+        reference=reference,
+    )
+
+
+def apply_status_change(sale, previous, current):
+    """
+    Move stock when a sale enters or leaves the completed status:
+    completing a sale takes its items out of stock, and cancelling
+    (or reopening) a completed sale puts them back.
+    """
+    if previous == current:
+        return
+    if current == STOCK_HOLDING_STATUS:
+        deduct(sale_quantities(sale), reference=sale_reference(sale))
+    elif previous == STOCK_HOLDING_STATUS:
+        restore(sale_quantities(sale), reference=sale_reference(sale))
@@ -0,0 +1,183 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from . import receipts, rollups, stock
+from .checkout import CheckoutError, build_items, initial_status, resolve_products
+from .models import Sales, SaleItems
+from .serializers import SyncSaleSerializer
+
+SYNC_CHUNK_SIZE = 100  # Sales committed per transaction
+
+
+def rejected(errors):
+    return {"result": "rejected", "errors": errors}
+
+
+def stored_results(keys):
+    """
+    Results of the sales already stored under any of `keys`, in one query:
+    a replayed sale is reported with its id and current status.
+    """
+    rows = Sales.objects.filter(idempotency_key__in=keys).values_list(
+        "idempotency_key", "pk", "status"
+    )
+    return {
+        key: {"result": "duplicate", "id": pk, "status": status}
+        for key, pk, status in rows
+    }
+
+
+def sync_sales(entries, chunk_size=SYNC_CHUNK_SIZE):
+    """
+    Store a batch of complete sales uploaded by a terminal, skipping the
+    ones already stored under the same idempotency key.
+    Every sale is validated on its own and the products of the whole batch
+    are fetched in one query. New sales are then written `chunk_size` at a
+    time, each chunk in one transaction with bulk inserts, so a large batch
+    neither holds a long write lock nor costs queries per sale.
+    Returns a result per idempotency key; the first sale wins when a key
+    appears twice in the batch.
+    """
+    results, valid = {}, {}
+    for entry in entries:
+        key = entry["idempotency_key"]
+        if key in results or key in valid:
+            continue
+        serializer = SyncSaleSerializer(data=entry)
+        if serializer.is_valid():
+            valid[key] = serializer.validated_data
+        else:
+            results[key] = rejected(serializer.errors)
+    results.update(stored_results(list(valid)))
+    new = {key: sale for key, sale in valid.items() if key not in results}
+    lines = [line for sale in new.values() for line in sale["items"]]
+    by_id, by_sku = resolve_products(lines)
+    built = {}
+    for key, sale in new.items():
+        try:
+            built[key] = (sale, build_items(sale["items"], by_id, by_sku))
+        except CheckoutError as exc:
+            results[key] = rejected({"items": exc.errors})
+    keys = list(built)
+    for start in range(0, len(keys), chunk_size):
+        chunk = {key: built[key] for key in keys[start : start + chunk_size]}
+        results.update(save_chunk(chunk))
+    return results
+
+
+def save_chunk(chunk):
+    """
+    Store a chunk of new sales (idempotency key -> (sale data, items)) in
+    one transaction and return their results. If another request stored
+    some of the keys in the meantime (a concurrent replay), the unique
+    index rejects the chunk; it is retried without them.
+    """
+    try:
+        with transaction.atomic():
+            return insert_sales(chunk)
+    except IntegrityError:
+        results = stored_results(list(chunk))
+        if not results:
+            raise
+        rest = {key: value for key, value in chunk.items() if key not in results}
+        with transaction.atomic():
+            results.update(insert_sales(rest))
+        return results
+
+
+def insert_sales(chunk):
+    """
+    Store the chunk's sales, taking stock for the cash ones with a single
+    UPDATE. Only if a product falls short are the cash sales tried one by
+    one to find those that cannot be fulfilled; just they are rejected and
+    the others stored.
+    """
+    try:
+        with transaction.atomic():
+            return store_sales(chunk)
+    except stock.InsufficientStock:
+        pass
+    results = {key: rejected(errors) for key, errors in shortfalls(chunk).items()}
+    rest = {key: value for key, value in chunk.items() if key not in results}
+    results.update(store_sales(rest))
+    return results
+
+
+def holds_stock(sale):
+    return initial_status(sale["payment_method"]) == stock.STOCK_HOLDING_STATUS
+
+
+def shortfalls(chunk):
+    """
+    Errors of the chunk's cash sales that cannot be fulfilled, by key,
+    taking stock for one sale after the other in a savepoint that is then
+    rolled back: the stock is only taken for good by store_sales().
+    """
+    errors = {}
+    with transaction.atomic():
+        for key, (sale, items) in chunk.items():
+            if not holds_stock(sale):
+                continue
+            try:
+                stock.deduct(stock.item_quantities(items))
+            except stock.InsufficientStock as exc:
+                errors[key] = exc.detail
+        transaction.set_rollback(True)
+    return errors
+
+
+def store_sales(chunk):
+    """
+    Bulk insert the chunk's sales, dated when the terminal recorded them,
+    take stock for the cash ones (each sale's movements under its own
+    ledger reference, as at checkout), then bulk insert their items and
+    count them in the rollups. Raises InsufficientStock if a product falls
+    short. Items are built afresh, so a rolled back attempt leaves nothing
+    on the ones the next attempt inserts.
+    """
+    sales, dated = [], []
+    for key, (sale, items) in chunk.items():
+        stored = Sales(
+            status=initial_status(sale["payment_method"]),
+            payment_method=sale["payment_method"],
+            total_amount=sum((item.subtotal for item in items), Decimal("0")),
+            idempotency_key=key,
+        )
+        lines = [
+            SaleItems(
+                sales=stored,
+                product=item.product,
+                quantity=item.quantity,
+                subtotal=item.subtotal,
+            )
+            for item in items
+        ]
+        sales.append((stored, lines))
+        if sale.get("date"):
+            dated.append((stored, sale["date"]))
+    Sales.objects.bulk_create([sale for sale, items in sales])
+    # The inserts are dated now (auto_now_add): restore the terminals' dates
+    for sale, date in dated:
+        sale.date = date
+    Sales.objects.bulk_update([sale for sale, date in dated], ["date"])
+    stock.deduct_many(
+        {
+            stock.sale_reference(sale): stock.item_quantities(items)
+            for sale, items in sales
+            if sale.status == stock.STOCK_HOLDING_STATUS
+        }
+    )
+    SaleItems.objects.bulk_create([item for sale, items in sales for item in items])
+    rollups.sales_added(sales)
+    receipts.schedule(
+        sale.pk for sale, items in sales if sale.status == receipts.RECEIPT_STATUS
+    )
+    return {
+        sale.idempotency_key: {
+            "result": "created",
+            "id": sale.pk,
+            "status": sale.status,
+        }
+        for sale, items in sales
+    }
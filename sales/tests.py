@@ -1,3 +1,1248 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager
+from unittest import mock, skipUnless
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from jobs import queue
+from jobs.models import Job
+from products.models import Category, Products, StockMovement
+from products.serializers import ProductSerializer
+from retail_software.pagination import KeysetPagination
+from . import receipts, rollups
+from .checkout import checkout
+from .models import ProductSalesRollup, Receipt, Sales, SaleItems, SalesRollup
+from .payments.fake import FakeProvider
+from .payments.pipeline import get_verifier
+from .payments.providers import MoMoProvider, get_provider
+from .serializers import (
+    SalesHeavySerializer,
+    SalesItemHeavySerializer,
+    SalesItemLightSerializer,
+    SalesLightSerializer,
+)
+from .stock import InsufficientStock, SaleStatusConflict
+from .sync import sync_sales
+
+
+def make_products(count, stock=100):
+    # Helper to create `count` products in a single category
+    category = Category.objects.create(name="Beverages")
+    return Products.objects.bulk_create(
+        Products(
+            name=f"Product {i}",
+            unit_price=Decimal("2.50"),
+            category=category,
+            sku=f"SKU-{i}",
+            stock_quantity=stock,
+        )
+        for i in range(count)
+    )
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.products = make_products(100)
+        self.url = reverse("sales-checkout")
+
+    def checkout(self, items, payment_method="cash"):
+        return self.client.post(
+            self.url,
+            {"payment_method": payment_method, "items": items},
+            content_type="application/json",
+        )
+
+    def test_creates_sale_with_all_items(self):
+        response = self.checkout(
+            [
+                {"product": self.products[0].pk, "quantity": "2"},
+                {"sku": self.products[1].sku, "quantity": "3"},
+            ]
+        )
+        self.assertEqual(response.status_code, 201)
+        content = response.json()["content"]
+        self.assertEqual(content["status"], "completed")
+        self.assertEqual(len(content["items"]), 2)
+        sale = Sales.objects.get(pk=content["id"])
+        self.assertEqual(sale.total_amount, Decimal("12.50"))
+        self.assertEqual(sale.saleitems_set.count(), 2)
+
+    def test_mobile_payment_stays_pending(self):
+        response = self.checkout(
+            [{"product": self.products[0].pk, "quantity": "1"}], "mobile payment"
+        )
+        self.assertEqual(response.json()["content"]["status"], "pending")
+
+    def test_unknown_product_rejects_whole_cart(self):
+        response = self.checkout(
+            [
+                {"product": self.products[0].pk, "quantity": "1"},
+                {"sku": "does-not-exist", "quantity": "1"},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("1", response.json()["items"])
+        self.assertFalse(Sales.objects.exists())
+        self.assertFalse(SaleItems.objects.exists())
+
+    def test_fractional_quantity_is_rejected(self):
+        # Stock is counted in whole units
+        response = self.checkout([{"product": self.products[0].pk, "quantity": "1.5"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("quantity", response.json()["items"][0])
+        self.assertFalse(Sales.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 100)
+
+    def test_line_needs_exactly_one_product_reference(self):
+        response = self.checkout([{"quantity": "1"}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        counts = []
+        for size in (1, 100):
+            items = [{"product": p.pk, "quantity": "1"} for p in self.products[:size]]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.checkout(items).status_code, 201)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SaleTotalTests(TestCase):
+    def setUp(self):
+        self.products = make_products(60)
+        self.sale = Sales.objects.create(status="pending", payment_method="cash")
+
+    def add_item(self, product, quantity="1"):
+        return self.client.post(
+            reverse("sales-item-light-list-create"),
+            {"sales": self.sale.pk, "product": product.pk, "quantity": quantity},
+            content_type="application/json",
+        )
+
+    def total(self):
+        self.sale.refresh_from_db()
+        return self.sale.total_amount
+
+    def test_items_keep_total_current(self):
+        self.add_item(self.products[0], "2")
+        item = SaleItems.objects.get()
+        self.assertEqual(self.total(), Decimal("5.00"))
+        response = self.client.patch(
+            reverse("sales-item-light-detail", args=[item.pk]),
+            {"quantity": "4"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.total(), Decimal("10.00"))
+        self.client.delete(reverse("sales-item-light-detail", args=[item.pk]))
+        self.assertEqual(self.total(), Decimal("0.00"))
+
+    def test_moving_item_between_sales_moves_subtotal(self):
+        other = Sales.objects.create(status="pending", payment_method="cash")
+        self.add_item(self.products[0], "2")
+        item = SaleItems.objects.get()
+        item.sales = other
+        item.save()
+        self.assertEqual(self.total(), Decimal("0.00"))
+        other.refresh_from_db()
+        self.assertEqual(other.total_amount, Decimal("5.00"))
+
+    def test_query_count_stays_flat_as_sale_grows(self):
+        counts = []
+        for index, product in enumerate(self.products):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.add_item(product).status_code, 201)
+            if index in (1, 59):
+                counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.total(), Decimal("150.00"))
+
+    def test_recompute_totals_command(self):
+        self.add_item(self.products[0], "2")
+        Sales.objects.update(total_amount=0)
+        call_command("recompute_totals", chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.total(), Decimal("5.00"))
+
+
+class StockTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2, stock=10)
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock_quantity
+
+    def pending_sale(self, quantity):
+        sale = Sales.objects.create(status="pending", payment_method="cash")
+        SaleItems.objects.create(
+            sales=sale, product=self.products[0], quantity=Decimal(quantity)
+        )
+        return sale
+
+    def set_status(self, sale, new_status):
+        return self.client.patch(
+            reverse("sales-light-detail", args=[sale.pk]),
+            {"status": new_status},
+            content_type="application/json",
+        )
+
+    def test_completing_and_cancelling_moves_stock(self):
+        sale = self.pending_sale("3")
+        self.assertEqual(self.stock(self.products[0]), 10)
+        self.assertEqual(self.set_status(sale, "completed").status_code, 200)
+        self.assertEqual(self.stock(self.products[0]), 7)
+        self.assertEqual(self.set_status(sale, "cancelled").status_code, 200)
+        self.assertEqual(self.stock(self.products[0]), 10)
+
+    def test_oversell_is_rejected(self):
+        sale = self.pending_sale("11")
+        response = self.set_status(sale, "completed")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(str(self.products[0].pk), response.json()["products"])
+        self.assertEqual(self.stock(self.products[0]), 10)
+        sale.refresh_from_db()
+        self.assertEqual(sale.status, "pending")
+
+    def test_fractional_quantities_never_move_stock(self):
+        sale = self.pending_sale("1.5")
+        response = self.set_status(sale, "completed")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["products"], {str(self.products[0].pk): "1.5"})
+        self.assertEqual(self.stock(self.products[0]), 10)
+        sale.refresh_from_db()
+        self.assertEqual(sale.status, "pending")
+        response = self.client.post(
+            reverse("sales-item-light-list-create"),
+            {"sales": sale.pk, "product": self.products[1].pk, "quantity": "2.5"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_cash_checkout_takes_stock(self):
+        response = self.client.post(
+            reverse("sales-checkout"),
+            {
+                "payment_method": "cash",
+                "items": [
+                    {"product": self.products[0].pk, "quantity": "4"},
+                    {"product": self.products[1].pk, "quantity": "11"},
+                ],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(response.json()["products"]), [str(self.products[1].pk)])
+        self.assertEqual(self.stock(self.products[0]), 10)
+        self.assertFalse(Sales.objects.exists())
+
+    def test_editing_completed_line_moves_net_quantity(self):
+        sale = self.pending_sale("3")
+        self.set_status(sale, "completed")
+        item = SaleItems.objects.get()
+        item.quantity = Decimal("5")
+        item.save()
+        self.assertEqual(self.stock(self.products[0]), 5)
+        item.delete()
+        self.assertEqual(self.stock(self.products[0]), 10)
+
+    def test_stale_status_change_is_refused(self):
+        sale = self.pending_sale("3")
+        stale = Sales.objects.get(pk=sale.pk)
+        sale.status = "completed"
+        sale.save()
+        stale.status = "completed"
+        with self.assertRaises(SaleStatusConflict):
+            stale.save()
+        self.assertEqual(self.stock(self.products[0]), 7)
+
+
+class CatalogStockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_products(2, stock=10)
+        self.urls = [reverse("product-list-create"), reverse("category-list-create")]
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_sales_keep_catalog_pages_cached(self):
+        products, categories = self.urls
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        line = {"product": self.products[0].pk, "quantity": Decimal("3")}
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout([line], "cash")
+        for url, etag in zip(self.urls, etags):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        # Pages showing stock levels follow them once STOCK_STALENESS has passed
+        with mock.patch("products.cache.STOCK_STALENESS", 0):
+            response = self.revalidate(products, etags[0])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["results"][0]["stock_quantity"], 7)
+            self.assertEqual(self.revalidate(categories, etags[1]).status_code, 304)
+            # Not again until the next stock change
+            etag = response["ETag"]
+            self.assertEqual(self.revalidate(products, etag).status_code, 304)
+
+    def test_product_writes_invalidate_at_once(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = "Renamed"
+            self.products[0].save()
+        for url, etag in zip(self.urls, etags):
+            self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+
+class ConcurrentStockTests(TransactionTestCase):
+    """
+    Many terminals checking out the same hot products at once must never
+    lose an update or take stock below zero.
+    """
+
+    terminals = 20
+    checkouts_per_terminal = 10
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        products = make_products(3, stock=150)
+        barrier = threading.Barrier(self.terminals)
+        sold = Counter()
+        lock = threading.Lock()
+
+        def terminal():
+            barrier.wait()
+            try:
+                lines = [{"product": p.pk, "quantity": Decimal("1")} for p in products]
+                for _ in range(self.checkouts_per_terminal):
+                    while True:
+                        try:
+                            checkout(lines, "cash")
+                        except InsufficientStock:
+                            break
+                        except OperationalError:
+                            continue  # database busy: retry like a terminal would
+                        with lock:
+                            sold["sales"] += 1
+                        break
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=terminal) for _ in range(self.terminals)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sold["sales"], 150)
+        self.assertEqual(Sales.objects.count(), 150)
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock_quantity, 0)
+            # Every sale that took stock is in the ledger, and no other
+            movements = StockMovement.objects.filter(product=product)
+            self.assertEqual(movements.count(), 150)
+            self.assertEqual(
+                movements.aggregate(total=Sum("quantity"))["total"], -150
+            )
+
+
+class SalesListTests(TestCase):
+    def setUp(self):
+        # Several sales share each timestamp so the id tie-breaker matters
+        moments = [timezone.now() - timedelta(days=day) for day in range(5)]
+        for index in range(25):
+            sale = Sales.objects.create(
+                status="pending" if index % 2 else "completed",
+                payment_method="cash" if index % 3 else "mobile payment",
+            )
+            Sales.objects.filter(pk=sale.pk).update(date=moments[index % 5])
+
+    def collect(self, url, **params):
+        # Follow the `next` links and return every row, page by page
+        rows, pages = [], 0
+        response = self.client.get(url, {"page_size": 4, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            rows.extend(body["results"])
+            pages += 1
+            if not body["next"]:
+                return rows, pages
+            response = self.client.get(body["next"])
+
+    def test_pages_cover_every_sale_once_in_order(self):
+        rows, pages = self.collect(reverse("sales-light-list-create"))
+        self.assertEqual(pages, 7)
+        expected = Sales.objects.order_by("-date", "-id").values_list("id", flat=True)
+        self.assertEqual([row["id"] for row in rows], list(expected))
+
+    def test_filters(self):
+        start = (timezone.now() - timedelta(days=2, hours=1)).isoformat()
+        rows, _ = self.collect(
+            reverse("sales-heavy-list-create"),
+            status="pending",
+            payment_method="cash",
+            date_from=start,
+        )
+        expected = Sales.objects.filter(
+            status="pending", payment_method="cash", date__gte=start
+        )
+        self.assertTrue(rows)
+        self.assertEqual(
+            {row["id"] for row in rows}, set(expected.values_list("id", flat=True))
+        )
+
+    def test_invalid_parameters(self):
+        url = reverse("sales-light-list-create")
+        self.assertEqual(self.client.get(url, {"cursor": "nope"}).status_code, 404)
+        # Cursors that decode but hold values of the wrong type
+        for position in (["abc", 1], [{"x": 1}, 1], ["2026-01-01", "zz"], [None, 1]):
+            cursor = KeysetPagination().encode_cursor(position)
+            for name in ("sales-light-list-create", "sales-heavy-list-create"):
+                with self.subTest(position=position, name=name):
+                    response = self.client.get(reverse(name), {"cursor": cursor})
+                    self.assertEqual(response.status_code, 404)
+        response = self.client.get(url, {"date_from": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url, {"status": "lost"}).status_code, 400)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Each read endpoint has a fixed query budget that must not grow with
+    the number of sales or items on the page.
+    """
+
+    budgets = {
+        "sales-heavy-list-create": 2,
+        "sales-light-list-create": 2,
+        "sales-item-heavy-list-create": 1,
+        "sales-item-light-list-create": 1,
+    }
+    detail_budgets = {
+        "sales-heavy-detail": 2,
+        "sales-light-detail": 2,
+        "sales-item-heavy-detail": 1,
+        "sales-item-light-detail": 1,
+    }
+
+    def setUp(self):
+        products = make_products(4)
+        for _ in range(10):
+            sale = Sales.objects.create(status="pending", payment_method="cash")
+            SaleItems.objects.bulk_create(
+                SaleItems(sales=sale, product=p, quantity=1, subtotal=p.unit_price)
+                for p in products
+            )
+
+    def test_list_endpoints(self):
+        for name, budget in self.budgets.items():
+            with self.subTest(name), self.assertNumQueries(budget):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_detail_endpoints(self):
+        ids = {
+            "sales": Sales.objects.values_list("pk", flat=True).first(),
+            "sales-item": SaleItems.objects.values_list("pk", flat=True).first(),
+        }
+        for name, budget in self.detail_budgets.items():
+            pk = ids["sales-item" if name.startswith("sales-item") else "sales"]
+            with self.subTest(name), self.assertNumQueries(budget):
+                response = self.client.get(reverse(name, args=[pk]))
+                self.assertEqual(response.status_code, 200)
+
+    def test_heavy_items_include_product_details(self):
+        content = self.client.get(reverse("sales-heavy-list-create")).json()
+        item = content["results"][0]["items"][0]
+        self.assertEqual(item["product_name"], "Product 0")
+        self.assertEqual(item["unit_price"], "2.50")
+
+
+class ListSerializationTests(TestCase):
+    """
+    The list endpoints serialize `.values()` rows without the model
+    serializers; their output must stay byte-identical to them.
+    """
+
+    def setUp(self):
+        products = make_products(3)
+        Products.objects.filter(pk=products[0].pk).update(name="Th\u00e9 \u2029 vert")
+        for index in range(6):
+            sale = Sales.objects.create(
+                status="pending", payment_method=["cash", "mobile payment"][index % 2]
+            )
+            SaleItems.objects.bulk_create(
+                SaleItems(
+                    sales=sale,
+                    product=product,
+                    quantity=Decimal("1.25"),
+                    subtotal=None if line == 1 else product.unit_price,
+                )
+                for line, product in enumerate(products[: index % 4])
+            )
+
+    def assertRendersAs(self, name, serializer_class, queryset):
+        response = self.client.get(reverse(name), {"page_size": 4})
+        expected = serializer_class(queryset[:4], many=True).data
+        body = {"next": response.json()["next"], "results": expected}
+        self.assertEqual(response.content, JSONRenderer().render(body))
+
+    def test_sales_lists(self):
+        sales = Sales.objects.order_by("-date", "-id")
+        self.assertRendersAs(
+            "sales-heavy-list-create",
+            SalesHeavySerializer,
+            sales.with_items(products=True),
+        )
+        self.assertRendersAs(
+            "sales-light-list-create", SalesLightSerializer, sales.with_items()
+        )
+
+    def test_sale_item_lists(self):
+        items = SaleItems.objects.select_related("product").order_by("-id")
+        self.assertRendersAs(
+            "sales-item-heavy-list-create", SalesItemHeavySerializer, items
+        )
+        self.assertRendersAs(
+            "sales-item-light-list-create", SalesItemLightSerializer, items
+        )
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2)
+        self.sale = Sales.objects.create(status="pending", payment_method="cash")
+        SaleItems.objects.bulk_create(
+            SaleItems(sales=self.sale, product=p, quantity=2, subtotal=Decimal("5.00"))
+            for p in self.products
+        )
+
+    def get(self, name, *args, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query["sql"] for query in queries]
+
+    def test_fields_skip_unrequested_items(self):
+        body, queries = self.get("sales-heavy-list-create", fields="id,status")
+        self.assertEqual(body["results"], [{"id": self.sale.pk, "status": "pending"}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("payment_reference", queries[0])
+
+    def test_nested_fields_skip_the_product_join(self):
+        body, queries = self.get("sales-heavy-list-create", fields="id,items.quantity")
+        items = body["results"][0]["items"]
+        self.assertEqual(items, [{"quantity": "2.00"}, {"quantity": "2.00"}])
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("products_products", queries[1])
+        _, queries = self.get("sales-heavy-list-create")  # Product names by default
+        self.assertIn("products_products", queries[1])
+
+    def test_expand_items_product(self):
+        body, queries = self.get(
+            "sales-light-list-create",
+            fields="id,items.product.name",
+            expand="items.product",
+        )
+        items = body["results"][0]["items"]
+        self.assertEqual(items[0], {"product": {"name": "Product 0"}})
+        self.assertEqual(len(queries), 2)  # The products are joined to the items
+
+    def test_expand_item_product(self):
+        body, _ = self.get("sales-item-light-list-create", expand="product")
+        item = body["results"][-1]
+        self.assertEqual(item["product"], ProductSerializer(self.products[0]).data)
+        self.assertEqual(item["quantity"], "2.00")
+
+    def test_detail_projection(self):
+        body, _ = self.get("sales-light-detail", self.sale.pk, fields="status")
+        self.assertEqual(body, {"status": "pending"})
+        response = self.client.get(reverse("sales-light-detail", args=[0]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse("sales-heavy-detail", args=[self.sale.pk]), {"expand": "status"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite")
+class QueryPlanTests(TestCase):
+    """
+    EXPLAINs the hot sales queries and fails if any of them falls back to a
+    full table scan or sorts the rows instead of reading them from an index.
+    """
+
+    def setUp(self):
+        products = make_products(3)
+        sale = Sales.objects.create(status="pending", payment_method="cash")
+        SaleItems.objects.bulk_create(
+            SaleItems(sales=sale, product=p, quantity=1, subtotal=p.unit_price)
+            for p in products
+        )
+        self.sale, self.product = sale, products[0]
+
+    def hot_queries(self):
+        now = timezone.now()
+        recent = Sales.objects.order_by("-date", "-id")
+        items = SaleItems.objects.all()
+        paginator = KeysetPagination()
+        paginator.ordering = ("-date", "-id")
+        return {
+            "recent sales": recent[:51],
+            "next page": recent.filter(
+                paginator.after([now, self.sale.pk])
+            )[:51],
+            "sales by date range": recent.filter(
+                date__gte=now - timedelta(days=1), date__lt=now
+            )[:51],
+            "pending sales": recent.filter(status="pending")[:51],
+            "sales by payment method": recent.filter(payment_method="cash")[:51],
+            "items of a page of sales": items.filter(sales__in=[self.sale.pk]),
+            "product within a sale": items.filter(
+                sales=self.sale, product=self.product
+            ),
+            "product sales history": items.filter(product=self.product).order_by(
+                "-id"
+            )[:51],
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            plan = queryset.explain()
+            with self.subTest(name, plan=plan):
+                self.assertNotRegex(plan, r"SCAN \w+\s*$|SCAN \w+\n")
+                self.assertNotIn("TEMP B-TREE", plan)
+                if name != "recent sales":
+                    # Everything but the first page must seek into an index
+                    self.assertIn("SEARCH", plan)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_products(3)
+
+    def checkout(self, payment_method="cash", quantity="2"):
+        return checkout(
+            [
+                {"product": self.products[0].pk, "quantity": Decimal(quantity)},
+                {"product": self.products[1].pk, "quantity": Decimal("1")},
+            ],
+            payment_method,
+        )
+
+    def day(self, **filters):
+        # The (sale count, total) of today's daily buckets matching `filters`
+        rows = SalesRollup.objects.filter(granularity="day", **filters)
+        return (
+            sum(row.sale_count for row in rows),
+            sum((row.total_amount for row in rows), Decimal("0")),
+        )
+
+    def snapshot(self):
+        # Every non-empty rollup bucket, for comparison with a rebuild
+        sales = SalesRollup.objects.exclude(sale_count=0, total_amount=0)
+        products = ProductSalesRollup.objects.exclude(quantity=0, revenue=0)
+        return (
+            set(sales.values_list(*rollups.SALES_KEY, *rollups.SALES_SUMS)),
+            set(products.values_list(*rollups.PRODUCT_KEY, *rollups.PRODUCT_SUMS)),
+        )
+
+    def test_checkout_and_status_changes_update_rollups(self):
+        self.checkout()
+        self.assertEqual(self.day(status="completed"), (1, Decimal("7.50")))
+        pending = self.checkout("mobile payment")
+        self.assertEqual(self.day(payment_method="mobile payment"), (0, 0))
+        pending.status = "completed"
+        pending.save()
+        self.assertEqual(self.day(status="completed"), (2, Decimal("15.00")))
+        pending.status = "cancelled"
+        pending.save()
+        self.assertEqual(self.day(status="completed"), (1, Decimal("7.50")))
+        self.assertEqual(self.day(status="cancelled"), (1, Decimal("7.50")))
+        pending.delete()
+        self.assertEqual(self.day(status="cancelled"), (0, 0))
+        hour = SalesRollup.objects.get(granularity="hour", payment_method="cash")
+        self.assertEqual(hour.period, rollups.period_start(timezone.now(), "hour"))
+
+    def test_item_edits_update_rollups(self):
+        sale = self.checkout()
+        item = sale.saleitems_set.get(product=self.products[0])
+        item.quantity = Decimal("4")
+        item.save()
+        self.assertEqual(self.day(), (1, Decimal("12.50")))
+        line = ProductSalesRollup.objects.get(
+            granularity="day", product=self.products[0]
+        )
+        self.assertEqual((line.quantity, line.revenue), (4, Decimal("10.00")))
+        item.delete()
+        self.assertEqual(self.day(), (1, Decimal("2.50")))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.checkout()
+        sale = self.checkout("mobile payment", "3")
+        sale.status = "completed"
+        sale.save()
+        item = sale.saleitems_set.get(product=self.products[1])
+        item.sales = self.checkout()
+        item.save()
+        self.checkout("mobile payment")  # Pending: not rolled up
+        expected = self.snapshot()
+        call_command("rebuild_rollups", chunk_size=2, stdout=StringIO())
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_reports(self):
+        self.checkout()
+        sale = self.checkout("mobile payment")
+        sale.status = "completed"
+        sale.save()
+        response = self.client.get(reverse("sales-report"), {"page_size": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIsNotNone(response.json()["next"])
+        self.assertNotIn("Cache-Control", response)
+        response = self.client.get(
+            reverse("sales-report-products"), {"product": self.products[0].pk}
+        )
+        rows = response.json()["results"]
+        self.assertEqual(
+            {row["payment_method"] for row in rows}, {"cash", "mobile payment"}
+        )
+        response = self.client.get(reverse("sales-report-categories"))
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "period": rows[0]["period"],
+                    "category": self.products[0].category_id,
+                    "quantity": "6.00",
+                    "revenue": "15.00",
+                }
+            ],
+        )
+        response = self.client.get(reverse("sales-report"), {"granularity": "week"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_report_pages_through_foreign_keys(self):
+        self.checkout()
+        url, seen = reverse("sales-report-products"), []
+        params = {"granularity": "day", "page_size": 1}
+        while url:
+            with self.assertNumQueries(1):  # No product fetched for the cursor
+                response = self.client.get(url, params)
+            seen += [row["product"] for row in response.json()["results"]]
+            url, params = response.json()["next"], None
+        self.assertEqual(seen, [self.products[0].pk, self.products[1].pk])
+
+    def test_closed_days_are_cached(self):
+        self.checkout()
+        Sales.objects.update(date=timezone.now() - timedelta(days=2))
+        call_command("rebuild_rollups", stdout=StringIO())
+        today = rollups.period_start(timezone.now(), "day")
+        params = {"date_to": today.isoformat()}
+        response = self.client.get(reverse("sales-report"), params)
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIn("immutable", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse("sales-report"), params)
+        self.assertEqual(cached.json(), response.json())
+        # A late change to a closed day is picked up by the server
+        with self.captureOnCommitCallbacks(execute=True):
+            Sales.objects.get().delete()
+        response = self.client.get(reverse("sales-report"), params)
+        self.assertEqual(response.json()["results"][0]["sale_count"], 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2)
+        for index in range(5):
+            sale = checkout(
+                [
+                    {"product": self.products[0].pk, "quantity": Decimal("1")},
+                    {"product": self.products[1].pk, "quantity": Decimal(index + 1)},
+                ],
+                "cash" if index % 2 else "mobile payment",
+            )
+            Sales.objects.filter(pk=sale.pk).update(
+                date=timezone.now() - timedelta(days=5 - index)
+            )
+        Sales.objects.create(status="pending", payment_method="cash")  # No items
+
+    def export(self, export_format, **params):
+        url = reverse("sales-export", args=[export_format])
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_has_a_row_per_item(self):
+        rows = list(csv.DictReader(StringIO(self.export("csv"))))
+        self.assertEqual(len(rows), 11)
+        expected = Sales.objects.order_by("date", "id").values_list("id", flat=True)
+        self.assertEqual(
+            list(dict.fromkeys(int(row["sale_id"]) for row in rows)), list(expected)
+        )
+        # Only the last row of a sale marks a resumable point
+        self.assertEqual([bool(row["cursor"]) for row in rows[:2]], [False, True])
+        self.assertEqual(rows[1]["subtotal"], "2.50")
+        self.assertEqual(rows[-1]["item_id"], "")
+
+    def test_ndjson_resumes_from_cursor(self):
+        lines = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[0]["items"][1]["quantity"], "1.00")
+        resumed = self.export("ndjson", cursor=lines[2]["cursor"])
+        self.assertEqual(
+            [json.loads(line)["id"] for line in resumed.splitlines()],
+            [line["id"] for line in lines[3:]],
+        )
+
+    def test_lines_keep_the_price_they_were_sold_at(self):
+        Products.objects.update(unit_price=Decimal("9.99"))
+        rows = list(csv.DictReader(StringIO(self.export("csv"))))
+        self.assertEqual(
+            {(row["unit_price"], row["quantity"], row["subtotal"]) for row in rows[:2]},
+            {("2.50", "1.00", "2.50")},
+        )
+        line = json.loads(self.export("ndjson").splitlines()[1])["items"][1]
+        self.assertEqual((line["unit_price"], line["subtotal"]), ("2.50", "5.00"))
+
+    def test_filters_and_errors(self):
+        start = (timezone.now() - timedelta(days=2, hours=1)).isoformat()
+        lines = self.export("ndjson", date_from=start, payment_method="cash")
+        self.assertEqual(len(lines.splitlines()), 2)  # Day 1 sale and the pending one
+        url = reverse("sales-export", args=["csv"])
+        self.assertEqual(self.client.get(url, {"cursor": "nope"}).status_code, 404)
+        cursor = KeysetPagination().encode_cursor(["2026-01-01", "zz"])
+        self.assertEqual(self.client.get(url, {"cursor": cursor}).status_code, 404)
+        self.assertEqual(self.client.get(url, {"status": "lost"}).status_code, 400)
+        url = reverse("sales-export", args=["xml"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_queries_grow_with_chunks_not_rows(self):
+        with self.assertNumQueries(2):  # Sales, then items with their products
+            self.export("csv")
+        with mock.patch("sales.export.EXPORT_CHUNK_SIZE", 2):
+            with self.assertNumQueries(4):  # Sales once, items per chunk of 2
+                self.export("csv")
+
+    def test_command(self):
+        output = StringIO()
+        call_command(
+            "export_sales", "--format", "ndjson", "--status", "completed", stdout=output
+        )
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        with self.assertRaises(CommandError):
+            call_command("export_sales", "--cursor", "nope", stdout=StringIO())
+
+
+RECEIPTS = {"SHOP_NAME": "Corner Shop", "WIDTH": 32}
+# Background jobs run right after the commit, so tests can read receipts
+EAGER_JOBS = dict(settings.JOBS, EAGER=True)
+
+
+@override_settings(RECEIPTS=RECEIPTS, JOBS=EAGER_JOBS)
+class ReceiptTests(TestCase):
+    def setUp(self):
+        self.products = make_products(2)
+
+    def checkout(self, payment_method="cash"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return checkout(
+                [
+                    {"product": self.products[0].pk, "quantity": Decimal("2")},
+                    {"product": self.products[1].pk, "quantity": Decimal("3")},
+                ],
+                payment_method,
+            )
+
+    def reprint(self, sale, receipt_format="txt"):
+        return self.client.get(reverse("sales-receipt", args=[sale.pk, receipt_format]))
+
+    def test_completed_checkout_renders_a_receipt(self):
+        sale = self.checkout()
+        receipt = Receipt.objects.get(sale=sale)
+        lines = receipt.text.splitlines()
+        self.assertEqual(lines[0], "Corner Shop".center(32).rstrip())
+        self.assertTrue(all(len(line) <= 32 for line in lines))
+        self.assertIn("  2 x 2.50".ljust(28) + "5.00", lines)
+        self.assertIn("  3 x 2.50".ljust(28) + "7.50", lines)
+        self.assertIn("TOTAL".ljust(27) + "12.50", lines)
+        self.assertIn("<td>Product 1</td>", receipt.html)
+        # Pending sales have none until they are completed
+        pending = self.checkout("mobile payment")
+        self.assertFalse(Receipt.objects.filter(sale=pending).exists())
+        self.assertEqual(self.reprint(pending).status_code, 409)
+        pending.status = "completed"
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+        self.assertTrue(Receipt.objects.filter(sale=pending).exists())
+
+    def test_reprints_are_served_from_the_store(self):
+        sale = self.checkout()
+        with self.assertNumQueries(2):  # The sale's status, then its receipt
+            response = self.reprint(sale)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(response.content.decode(), sale.receipt.text)
+        response = self.reprint(sale, "html")
+        self.assertEqual(response["Content-Type"], "text/html; charset=utf-8")
+        self.assertEqual(self.reprint(sale, "pdf").status_code, 404)
+        missing = self.client.get(reverse("sales-receipt", args=[0, "txt"]))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_missing_receipts_are_rendered_on_reprint(self):
+        sale = self.checkout()
+        Receipt.objects.all().delete()
+        response = self.reprint(sale)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("12.50", response.content.decode())
+        self.assertTrue(Receipt.objects.filter(sale=sale).exists())
+
+    def test_edits_invalidate_the_receipt(self):
+        sale = self.checkout()
+        item = sale.saleitems_set.get(product=self.products[0])
+        item.quantity = Decimal("4")
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertIn("4 x 2.50", Receipt.objects.get(sale=sale).text)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertNotIn("Product 0", Receipt.objects.get(sale=sale).text)
+        sale.refresh_from_db()
+        sale.status = "cancelled"
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.save()
+        self.assertFalse(Receipt.objects.filter(sale=sale).exists())
+        self.assertEqual(self.reprint(sale).status_code, 409)
+
+    def test_rendering_is_a_background_job(self):
+        with override_settings(JOBS=dict(settings.JOBS, EAGER=False)):
+            sale = self.checkout()
+            self.assertFalse(Receipt.objects.filter(sale=sale).exists())
+            job = Job.objects.get()
+            self.assertEqual(job.kind, receipts.RENDER_JOB)
+            self.assertEqual(job.payload, {"sale": sale.pk})
+            self.assertEqual(queue.drain(), 1)
+        self.assertTrue(Receipt.objects.filter(sale=sale).exists())
+        self.assertFalse(Job.objects.exists())
+
+
+class PaymentTests(TestCase):
+    """
+    Runs collections end to end against the fake provider, served on a free
+    port of the test's event loop.
+    """
+
+    def setUp(self):
+        self.products = make_products(1, stock=10)
+        self.sale = checkout(
+            [{"product": self.products[0].pk, "quantity": Decimal("2")}],
+            "mobile payment",
+        )
+
+    @asynccontextmanager
+    async def provider(self, **options):
+        fake = FakeProvider(delay=0.05, seed=1, **options)
+        server = await fake.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        provider_settings = {
+            "BACKEND": "sales.payments.providers.MoMoProvider",
+            "BASE_URL": f"http://127.0.0.1:{port}",
+            "MAX_CONNECTIONS": 2,
+        }
+        verification = {"POLL_INTERVAL": 0.02, "MAX_POLL_INTERVAL": 0.05}
+        try:
+            with override_settings(
+                PAYMENT_PROVIDER=provider_settings, PAYMENT_VERIFICATION=verification
+            ):
+                yield fake
+                await get_verifier().wait()
+        finally:
+            get_provider().close()
+            fake.close()
+            await self.stop(server)
+
+    async def stop(self, server):
+        # Let connection handlers see their clients leave before closing
+        await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+
+    async def pay(self, sale, phone="233240000000"):
+        return await self.async_client.post(
+            reverse("sales-pay", args=[sale.pk]),
+            {"phone": phone},
+            content_type="application/json",
+        )
+
+    async def test_successful_collection_completes_sale(self):
+        async with self.provider(failure_rate=0):
+            response = await self.pay(self.sale)
+            self.assertEqual(response.status_code, 202)
+            reference = response.json()["content"]["payment_reference"]
+            # Starting again resends the same collection
+            again = await self.pay(self.sale)
+            self.assertEqual(again.json()["content"]["payment_reference"], reference)
+        await self.sale.arefresh_from_db()
+        self.assertEqual(self.sale.status, "completed")
+        self.assertEqual(self.sale.payment_reference, reference)
+        product = await Products.objects.aget(pk=self.products[0].pk)
+        self.assertEqual(product.stock_quantity, 8)
+
+    async def test_failed_collection_cancels_sale(self):
+        async with self.provider(failure_rate=1):
+            self.assertEqual((await self.pay(self.sale)).status_code, 202)
+        await self.sale.arefresh_from_db()
+        self.assertEqual(self.sale.status, "cancelled")
+
+    async def test_rejected_and_disallowed_payments(self):
+        async with self.provider():
+            response = await self.pay(self.sale, phone="000111222333")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("phone", response.json())
+            await self.sale.arefresh_from_db()
+            self.assertIsNone(self.sale.payment_reference)  # Can be retried
+            response = await self.pay(self.sale, phone="not a phone")
+            self.assertEqual(response.status_code, 400)
+            cash = await Sales.objects.acreate(status="pending", payment_method="cash")
+            self.assertEqual((await self.pay(cash)).status_code, 409)
+            missing = Sales(pk=self.sale.pk + 100)
+            self.assertEqual((await self.pay(missing)).status_code, 404)
+
+    async def test_callback_settles_without_polling(self):
+        # Polling never comes round; only the callback can settle the sale
+        verification = {"POLL_INTERVAL": 60, "TIMEOUT": 0.5}
+        async with self.provider(failure_rate=0) as fake:
+            with override_settings(PAYMENT_VERIFICATION=verification):
+                response = await self.pay(self.sale)
+                reference = response.json()["content"]["payment_reference"]
+                url = reverse("sales-payment-callback")
+                await asyncio.sleep(0.1)
+                self.assertEqual(fake.collections[reference]["status"], "SUCCESSFUL")
+                response = await self.async_client.post(
+                    url, {"referenceId": reference}, content_type="application/json"
+                )
+                self.assertEqual(response.status_code, 200)
+                unknown = await self.async_client.post(
+                    url, {"referenceId": "nope"}, content_type="application/json"
+                )
+                self.assertEqual(unknown.status_code, 404)
+        await self.sale.arefresh_from_db()
+        self.assertEqual(self.sale.status, "completed")
+
+    async def test_pool_reuses_connections(self):
+        fake = FakeProvider(delay=10)
+        connections_made = []
+
+        async def counting(reader, writer):
+            connections_made.append(writer)
+            await fake.handle_connection(reader, writer)
+
+        server = await asyncio.start_server(counting, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        provider = MoMoProvider(BASE_URL=f"http://127.0.0.1:{port}", MAX_CONNECTIONS=3)
+        try:
+            await asyncio.gather(
+                *(
+                    provider.request_to_pay(f"ref-{i}", 1, "233240000000", i)
+                    for i in range(30)
+                )
+            )
+            statuses = await asyncio.gather(
+                *(provider.collection_status(f"ref-{i}") for i in range(30))
+            )
+        finally:
+            provider.close()
+            await self.stop(server)
+        self.assertEqual(set(statuses), {"PENDING"})
+        self.assertLessEqual(len(connections_made), 3)
+
+    def test_verify_payments_command(self):
+        async def start_and_forget():
+            async with self.provider(failure_rate=0):
+                verifier = get_verifier()
+                await verifier.provider.request_to_pay(
+                    "resumed", self.sale.total_amount, "233240000000", self.sale.pk
+                )
+                await asyncio.sleep(0.1)
+                await sync_to_async(
+                    Sales.objects.filter(pk=self.sale.pk).update
+                )(payment_reference="resumed")
+                with override_settings(PAYMENT_VERIFICATION={"POLL_INTERVAL": 0}):
+                    await sync_to_async(call_command)(
+                        "verify_payments", "--once", stdout=output
+                    )
+
+        output = StringIO()
+        async_to_sync(start_and_forget)()
+        self.assertIn("1 settled", output.getvalue())
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.status, "completed")
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.products = make_products(3, stock=5)
+        self.url = reverse("sales-sync")
+
+    def entry(self, key, quantity="1", payment_method="cash", product=0):
+        return {
+            "idempotency_key": key,
+            "payment_method": payment_method,
+            "items": [{"product": self.products[product].pk, "quantity": quantity}],
+        }
+
+    def sync(self, sales):
+        return self.client.post(
+            self.url, {"sales": sales}, content_type="application/json"
+        )
+
+    def test_replayed_batch_creates_nothing_twice(self):
+        batch = [
+            self.entry("t1-1", "2"),
+            self.entry("t1-2", payment_method="mobile payment"),
+            self.entry("t1-1", "3"),  # Same key again: the first one wins
+        ]
+        response = self.sync(batch)
+        self.assertEqual(response.status_code, 200)
+        content = response.json()["content"]
+        self.assertEqual(content["t1-1"]["result"], "created")
+        self.assertEqual(content["t1-1"]["status"], "completed")
+        self.assertEqual(content["t1-2"]["status"], "pending")
+        sale = Sales.objects.get(pk=content["t1-1"]["id"])
+        self.assertEqual(sale.total_amount, Decimal("5.00"))
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 3)
+        self.assertEqual(
+            SalesRollup.objects.get(granularity="day", status="completed").sale_count, 1
+        )
+        replay = self.sync(batch).json()["content"]
+        self.assertEqual(replay["t1-1"], {**content["t1-1"], "result": "duplicate"})
+        self.assertEqual(Sales.objects.count(), 2)
+        self.assertEqual(SaleItems.objects.count(), 2)
+
+    def test_bad_sales_are_rejected_alone(self):
+        response = self.sync(
+            [
+                self.entry("ok"),
+                self.entry("bad-quantity", "-1"),
+                {**self.entry("unknown"), "items": [{"sku": "nope", "quantity": "1"}]},
+                self.entry("short", "10", product=1),
+            ]
+        )
+        content = response.json()["content"]
+        self.assertEqual(content["ok"]["result"], "created")
+        self.assertEqual(content["bad-quantity"]["result"], "rejected")
+        self.assertIn("items", content["unknown"]["errors"])
+        self.assertIn("products", content["short"]["errors"])
+        keys = Sales.objects.values_list("idempotency_key", flat=True)
+        self.assertEqual(list(keys), ["ok"])
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].stock_quantity, 5)
+        # Only the stored sale's stock was taken, under its own reference
+        self.assertEqual(
+            list(StockMovement.objects.values_list("reference", "quantity")),
+            [(f"sale {content['ok']['id']}", Decimal("-1"))],
+        )
+
+    def test_sales_keep_their_references_and_dates(self):
+        recorded = timezone.now() - timedelta(days=2)
+        content = self.sync(
+            [
+                {**self.entry("early", "2"), "date": recorded.isoformat()},
+                self.entry("late"),
+            ]
+        ).json()["content"]
+        early = Sales.objects.get(pk=content["early"]["id"])
+        self.assertEqual(early.date, recorded)
+        late = Sales.objects.get(pk=content["late"]["id"])
+        self.assertGreater(late.date, recorded + timedelta(days=1))
+        self.assertEqual(
+            dict(StockMovement.objects.values_list("reference", "quantity")),
+            {f"sale {early.pk}": Decimal("-2"), f"sale {late.pk}": Decimal("-1")},
+        )
+        # Counted in the day the terminal recorded the sale
+        days = SalesRollup.objects.filter(granularity="day").order_by("period")
+        self.assertEqual(
+            [(day.period, day.sale_count) for day in days],
+            [
+                (rollups.period_start(recorded, "day"), 1),
+                (rollups.period_start(late.date, "day"), 1),
+            ],
+        )
+
+    def test_every_sale_needs_a_key(self):
+        response = self.sync([self.entry("ok"), {"payment_method": "cash"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("idempotency_key", response.json()["sales"]["1"])
+        self.assertFalse(Sales.objects.exists())
+
+    def test_queries_grow_with_chunks_not_sales(self):
+        Products.objects.update(stock_quantity=100)
+        counts = []
+        for prefix, size in (("a", 2), ("b", 40)):
+            batch = [self.entry(f"{prefix}{i}", product=i % 3) for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.sync(batch).status_code, 200)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        with mock.patch("sales.sync.SYNC_CHUNK_SIZE", 10):
+            batch = [self.entry(f"c{i}", product=i % 3) for i in range(40)]
+            content = self.sync(batch).json()["content"]
+            self.assertEqual({r["result"] for r in content.values()}, {"created"})
+        self.assertEqual(Sales.objects.count(), 82)
+
+    def test_concurrent_replay_is_reported_as_duplicate(self):
+        # Stored by another request after the keys were checked
+        Sales.objects.create(
+            status="completed", payment_method="cash", idempotency_key="raced"
+        )
+        duplicate = {"raced": {"result": "duplicate", "id": 1, "status": "completed"}}
+        with mock.patch("sales.sync.stored_results", side_effect=[{}, duplicate]):
+            results = sync_sales([self.entry("raced"), self.entry("other")])
+        self.assertEqual(results["raced"]["result"], "duplicate")
+        self.assertEqual(results["other"]["result"], "created")
+        self.assertEqual(Sales.objects.count(), 2)
+        item = SaleItems.objects.get()
+        self.assertEqual(item.sales_id, results["other"]["id"])
+
+    def test_retried_chunk_inserts_new_items(self):
+        # The first attempt fails after inserting its items, then is retried
+        sales_added, attempts = rollups.sales_added, []
+
+        def fail_once(sales):
+            attempts.append([item for sale, items in sales for item in items])
+            if len(attempts) == 1:
+                raise IntegrityError("raced")
+            sales_added(sales)
+
+        duplicate = {"raced": {"result": "duplicate", "id": 1, "status": "completed"}}
+        with mock.patch("sales.sync.stored_results", side_effect=[{}, duplicate]):
+            with mock.patch("sales.sync.rollups.sales_added", fail_once):
+                results = sync_sales([self.entry("raced"), self.entry("other")])
+        self.assertEqual(results["other"]["result"], "created")
+        # Not the instances the rolled back insert set a pk and sale on
+        self.assertFalse({id(item) for item in attempts[0]} & set(map(id, attempts[1])))
+        item = SaleItems.objects.get()
+        self.assertEqual(item.sales_id, results["other"]["id"])
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 4)
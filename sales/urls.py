@@ -8,6 +8,15 @@ from .views import (
     SalesItemLightCreateList,
     SalesItemHeavyViewUpdateDelete,
     SalesItemHeavyCreateList,
+    SalesCheckout,
+    SalesSync,
+    SalesReport,
+    ProductSalesReport,
+    CategorySalesReport,
+    SalesExport,
+    SalesReceipt,
+    SalesPayment,
+    PaymentCallback,
 )
 
 urlpatterns = [
@@ -75,4 +84,49 @@ urlpatterns = [
         SalesItemHeavyViewUpdateDelete.as_view(),
         name="sales-item-heavy-detail",
     ),
+    # Cashier: Check out a whole cart in one request
+    # POST: /checkout/ - creates a sale and all of its items in one transaction
+    path("checkout/", SalesCheckout.as_view(), name="sales-checkout"),
+    # Terminal: Upload sales recorded offline, many at a time
+    # POST: /sync/ - stores new sales once per idempotency key
+    path("sync/", SalesSync.as_view(), name="sales-sync"),
+    # Admin: Sales reports by hour or day (read from the rollup tables)
+    # GET: /reports/sales/ - totals per payment method and status
+    # GET: /reports/products/ - quantity and revenue per product
+    # GET: /reports/categories/ - quantity and revenue per category
+    path("reports/sales/", SalesReport.as_view(), name="sales-report"),
+    path(
+        "reports/products/",
+        ProductSalesReport.as_view(),
+        name="sales-report-products",
+    ),
+    path(
+        "reports/categories/",
+        CategorySalesReport.as_view(),
+        name="sales-report-categories",
+    ),
+    # Accounting: Stream sales history with line items
+    # GET: /export/csv/ - one CSV row per sale item
+    # GET: /export/ndjson/ - one JSON sale (with its items) per line
+    path(
+        "export/<str:export_format>/", SalesExport.as_view(), name="sales-export"
+    ),
+    # Cashier: Reprint the receipt of a completed sale
+    # GET: /<id>/receipt/txt/ - plain text for thermal printers
+    # GET: /<id>/receipt/html/ - HTML
+    path(
+        "<int:pk>/receipt/<str:receipt_format>/",
+        SalesReceipt.as_view(),
+        name="sales-receipt",
+    ),
+    # Cashier: Collect a pending sale by mobile money
+    # POST: /<id>/pay/ - asks the provider to collect the sale's total
+    path("<int:pk>/pay/", SalesPayment.as_view(), name="sales-pay"),
+    # Provider: Notification that a collection is settled
+    # POST: /payments/callback/ - confirms the outcome and settles the sale
+    path(
+        "payments/callback/",
+        PaymentCallback.as_view(),
+        name="sales-payment-callback",
+    ),
 ]
@@ -1,4 +1,11 @@
-from django.http import Http404
+import json
+
+from django.db.models import Sum
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
@@ -7,8 +14,46 @@ from .serializers import (
     SalesLightSerializer,
     SalesItemHeavySerializer,
     SalesItemLightSerializer,
+    CheckoutSerializer,
+    SalesRollupSerializer,
+    ProductSalesRollupSerializer,
+    CategorySalesSerializer,
+    PaymentStartSerializer,
+    SalesSyncSerializer,
+)
+from .models import Sales, SaleItems, SalesRollup, ProductSalesRollup
+from .checkout import checkout, CheckoutError
+from .sync import sync_sales
+from .filters import (
+    filter_sales,
+    filter_sale_items,
+    filter_rollups,
+    ProductRollupFilterSerializer,
+)
+from .reports import closed_days_cached
+from .export import EXPORT_FORMATS, export_sales, export_lines
+from .receipts import RECEIPT_FORMATS, RECEIPT_STATUS, get_receipt
+from .payments.pipeline import get_verifier
+from .payments.providers import ProviderError
+from products.serializers import ProductSerializer
+from retail_software.pagination import KeysetPagination, ordering_fields
+from retail_software.replica import replica_reads, stream_reads
+from retail_software.rows import RowSerializer
+
+# Read-only fast paths for the GET views (same output as the serializers).
+# Clients narrow them with ?fields= and expand products with ?expand=.
+SALES_HEAVY_ROWS = RowSerializer(
+    SalesHeavySerializer, expandable={"items.product": ProductSerializer}
+)
+SALES_LIGHT_ROWS = RowSerializer(
+    SalesLightSerializer, expandable={"items.product": ProductSerializer}
+)
+SALES_ITEM_HEAVY_ROWS = RowSerializer(
+    SalesItemHeavySerializer, expandable={"product": ProductSerializer}
+)
+SALES_ITEM_LIGHT_ROWS = RowSerializer(
+    SalesItemLightSerializer, expandable={"product": ProductSerializer}
 )
-from .models import Sales, SaleItems
 
 # Sales Views
 
@@ -17,14 +62,26 @@ from .models import Sales, SaleItems
 class SalesHeavyCreateList(APIView):
     """
     Handles listing all sales and creating a new sale with detailed (heavy) serializer.
-    GET: Returns a list of all sales with detailed information.
+    GET: Returns a page of sales with detailed information.
+    Supports date_from, date_to, status and payment_method filters, and
+    `fields`/`expand` projections: ?fields=id,date would skip the items query
+    and ?fields=id,items.quantity&expand=items.product joins the products.
     POST: Creates a new sale with the provided data.
     """
 
+    pagination_class = KeysetPagination
+    ordering = ("-date", "-id")  # Most recent first, id breaks ties
+
+    @replica_reads
     def get(self, request):
-        sales = Sales.objects.all()  # Fetch all sales
-        serializer = SalesHeavySerializer(sales, many=True)  # Serialize sales list
-        return Response(serializer.data)
+        rows = SALES_HEAVY_ROWS.for_request(request)  # Only the requested fields
+        sales = filter_sales(
+            rows.values(Sales.objects.all(), *ordering_fields(self.ordering)),
+            request.query_params,
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(sales, request, view=self)  # One page
+        return paginator.get_paginated_response(rows.serialize(page))
 
     def post(self, request):
         serializer = SalesHeavySerializer(data=request.data)  # Deserialize input data
@@ -40,7 +97,7 @@ class SalesHeavyCreateList(APIView):
 class SalesHeavyViewUpdateDelete(APIView):
     """
     Handles retrieving, updating, partially updating, and deleting a single sale by its ID (heavy serializer).
-    GET: Returns details of a specific sale.
+    GET: Returns details of a specific sale (supports `fields` and `expand`).
     PUT: Updates a sale with the provided data.
     PATCH: Partially updates a sale.
     DELETE: Deletes the specified sale.
@@ -49,14 +106,13 @@ class SalesHeavyViewUpdateDelete(APIView):
     def get_object(self, pk):
         # Get sale by ID or raise 404 if not found
         try:
-            return Sales.objects.get(pk=pk)
+            return Sales.objects.with_items(products=True).get(pk=pk)
         except Sales.DoesNotExist:
             raise Http404
 
     def get(self, request, pk):
-        sales = self.get_object(pk)  # Get sale by ID
-        serializer = SalesHeavySerializer(sales)  # Serialize sale
-        return Response(serializer.data)
+        rows = SALES_HEAVY_ROWS.for_request(request)  # Only the requested fields
+        return Response(rows.get(Sales.objects.filter(pk=pk)))
 
     def put(self, request, pk):
         sales = self.get_object(pk)
@@ -101,14 +157,24 @@ class SalesHeavyViewUpdateDelete(APIView):
 class SalesLightsCreateList(APIView):
     """
     Handles listing all sales and creating a new sale with basic (light) serializer.
-    GET: Returns a list of all sales with basic information.
+    GET: Returns a page of sales with basic information.
+    Supports date_from, date_to, status and payment_method filters, and
+    `fields`/`expand` projections (see SalesHeavyCreateList).
     POST: Creates a new sale with the provided data.
     """
 
+    pagination_class = KeysetPagination
+    ordering = ("-date", "-id")  # Most recent first, id breaks ties
+
     def get(self, request):
-        sales = Sales.objects.all()  # Fetch all sales
-        serializer = SalesLightSerializer(sales, many=True)  # Serialize sales list
-        return Response(serializer.data)
+        rows = SALES_LIGHT_ROWS.for_request(request)  # Only the requested fields
+        sales = filter_sales(
+            rows.values(Sales.objects.all(), *ordering_fields(self.ordering)),
+            request.query_params,
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(sales, request, view=self)  # One page
+        return paginator.get_paginated_response(rows.serialize(page))
 
     def post(self, request):
         serializer = SalesLightSerializer(data=request.data)  # Deserialize input data
@@ -125,7 +191,7 @@ class SalesLightsCreateList(APIView):
 class SalesLightViewUpdateDelete(APIView):
     """
     Handles retrieving, updating, partially updating, and deleting a single sale by its ID (light serializer).
-    GET: Returns details of a specific sale.
+    GET: Returns details of a specific sale (supports `fields` and `expand`).
     PUT: Updates a sale with the provided data.
     PATCH: Partially updates a sale.
     DELETE: Deletes the specified sale.
@@ -134,14 +200,13 @@ class SalesLightViewUpdateDelete(APIView):
     def get_object(self, pk):
         # Get sale by ID or raise 404 if not found
         try:
-            return Sales.objects.get(pk=pk)
+            return Sales.objects.with_items().get(pk=pk)
         except Sales.DoesNotExist:
             raise Http404
 
     def get(self, request, pk):
-        sales = self.get_object(pk)
-        serializer = SalesLightSerializer(sales)
-        return Response(serializer.data)
+        rows = SALES_LIGHT_ROWS.for_request(request)  # Only the requested fields
+        return Response(rows.get(Sales.objects.filter(pk=pk)))
 
     def put(self, request, pk):
         sales = self.get_object(pk)
@@ -182,16 +247,25 @@ class SalesLightViewUpdateDelete(APIView):
 class SalesItemHeavyCreateList(APIView):
     """
     Handles listing all sale items and creating a new sale item with detailed (heavy) serializer.
-    GET: Returns a list of all sale items with detailed information.
+    GET: Returns a page of sale items with detailed information.
+    Supports sales, product and the sale-level filters, and `fields` and
+    `expand=product` projections; products are only joined when needed.
     POST: Creates a new sale item with the provided data.
     """
 
+    pagination_class = KeysetPagination
+    ordering = ("-id",)  # Most recently added first
+
+    @replica_reads
     def get(self, request):
-        items = SaleItems.objects.all()  # Fetch all sale items
-        serializer = SalesItemHeavySerializer(
-            items, many=True
-        )  # Serialize sale items list
-        return Response(serializer.data)
+        rows = SALES_ITEM_HEAVY_ROWS.for_request(request)  # Only the requested fields
+        items = filter_sale_items(
+            rows.values(SaleItems.objects.all(), *ordering_fields(self.ordering)),
+            request.query_params,
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(items, request, view=self)  # One page
+        return paginator.get_paginated_response(rows.serialize(page))
 
     def post(self, request):
         serializer = SalesItemHeavySerializer(
@@ -209,7 +283,7 @@ class SalesItemHeavyCreateList(APIView):
 class SalesItemHeavyViewUpdateDelete(APIView):
     """
     Handles retrieving, updating, partially updating, and deleting a single sale item by its ID (heavy serializer).
-    GET: Returns details of a specific sale item.
+    GET: Returns details of a specific sale item (`fields` and `expand`).
     PUT: Updates a sale item with the provided data.
     PATCH: Partially updates a sale item.
     DELETE: Deletes the specified sale item.
@@ -218,14 +292,13 @@ class SalesItemHeavyViewUpdateDelete(APIView):
     def get_object(self, pk):
         # Get sale item by ID or raise 404 if not found
         try:
-            return SaleItems.objects.get(pk=pk)
+            return SaleItems.objects.select_related("product").get(pk=pk)
         except SaleItems.DoesNotExist:
             raise Http404
 
     def get(self, request, pk):
-        item = self.get_object(pk)
-        serializer = SalesItemHeavySerializer(item)
-        return Response(serializer.data)
+        rows = SALES_ITEM_HEAVY_ROWS.for_request(request)  # Only the requested fields
+        return Response(rows.get(SaleItems.objects.filter(pk=pk)))
 
     def put(self, request, pk):
         item = self.get_object(pk)
@@ -268,16 +341,24 @@ class SalesItemHeavyViewUpdateDelete(APIView):
 class SalesItemLightCreateList(APIView):
     """
     Handles listing all sale items and creating a new sale item with basic (light) serializer.
-    GET: Returns a list of all sale items with basic information.
+    GET: Returns a page of sale items with basic information.
+    Supports sales, product and the sale-level filters, and `fields` and
+    `expand=product` projections.
     POST: Creates a new sale item with the provided data.
     """
 
+    pagination_class = KeysetPagination
+    ordering = ("-id",)  # Most recently added first
+
     def get(self, request):
-        items = SaleItems.objects.all()  # Fetch all sale items
-        serializer = SalesItemLightSerializer(
-            items, many=True
-        )  # Serialize sale items list
-        return Response(serializer.data)
+        rows = SALES_ITEM_LIGHT_ROWS.for_request(request)  # Only the requested fields
+        items = filter_sale_items(
+            rows.values(SaleItems.objects.all(), *ordering_fields(self.ordering)),
+            request.query_params,
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(items, request, view=self)  # One page
+        return paginator.get_paginated_response(rows.serialize(page))
 
     def post(self, request):
         serializer = SalesItemLightSerializer(
@@ -295,7 +376,7 @@ class SalesItemLightCreateList(APIView):
 class SalesItemLightViewUpdateDelete(APIView):
     """
     Handles retrieving, updating, partially updating, and deleting a single sale item by its ID (light serializer).
-    GET: Returns details of a specific sale item.
+    GET: Returns details of a specific sale item (`fields` and `expand`).
     PUT: Updates a sale item with the provided data.
     PATCH: Partially updates a sale item.
     DELETE: Deletes the specified sale item.
@@ -309,9 +390,8 @@ class SalesItemLightViewUpdateDelete(APIView):
             raise Http404
 
     def get(self, request, pk):
-        item = self.get_object(pk)
-        serializer = SalesItemLightSerializer(item)
-        return Response(serializer.data)
+        rows = SALES_ITEM_LIGHT_ROWS.for_request(request)  # Only the requested fields
+        return Response(rows.get(SaleItems.objects.filter(pk=pk)))
 
     def put(self, request, pk):
         item = self.get_object(pk)
@@ -349,3 +429,252 @@ class SalesItemLightViewUpdateDelete(APIView):
             {"message": "Item deleted successfully"},
             status=status.HTTP_204_NO_CONTENT,
         )
+
+
+# Checkout View
+class SalesCheckout(APIView):
+    """
+    Handles checking out a whole cart in a single request.
+    POST: Creates a sale and all of its items in one transaction
+    and returns the finished sale with detailed (heavy) information.
+    """
+
+    def post(self, request):
+        serializer = CheckoutSerializer(data=request.data)  # Validate the cart
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sale = checkout(
+                serializer.validated_data["items"],
+                serializer.validated_data["payment_method"],
+            )
+        except CheckoutError as exc:
+            return Response(
+                {"items": exc.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+        # Reload the stored sale with its items and products in two queries
+        sale = Sales.objects.with_items(products=True).get(pk=sale.pk)
+        serializer = SalesHeavySerializer(sale)
+        return Response(
+            {"message": "Transaction successful", "content": serializer.data},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class SalesSync(APIView):
+    """
+    Handles terminals uploading the sales they recorded while offline.
+    POST: Takes {"sales": [...]}, each a checkout cart with a terminal
+    generated `idempotency_key` and the `date` it was recorded (optional),
+    and stores the new ones in chunked transactions. Returns a result per
+    key: created (with the sale id and status), duplicate (already stored
+    by an earlier upload) or rejected (with its errors). Replaying a batch
+    is cheap and creates nothing twice.
+    """
+
+    def post(self, request):
+        serializer = SalesSyncSerializer(data=request.data)  # Keys only
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        results = sync_sales(serializer.validated_data["sales"])
+        return Response(
+            {"message": "Sync complete", "content": results},
+            status=status.HTTP_200_OK,
+        )
+
+
+# Report Views (read only the rollup tables)
+class SalesReport(APIView):
+    """
+    Sales totals per hour or day, payment method and status.
+    GET: Returns a page of rollup buckets, oldest period first.
+    Supports granularity (hour/day, default day), date_from, date_to,
+    status and payment_method filters.
+    """
+
+    pagination_class = KeysetPagination
+    ordering = ("period", "payment_method", "status")  # Unique per granularity
+
+    @replica_reads
+    @closed_days_cached
+    def get(self, request):
+        rollups = filter_rollups(SalesRollup.objects.all(), request.query_params)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rollups, request, view=self)  # One page
+        serializer = SalesRollupSerializer(page, many=True)  # Serialize buckets
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ProductSalesReport(APIView):
+    """
+    Quantity and revenue sold per hour or day, product, payment method and status.
+    GET: Returns a page of rollup buckets, oldest period first.
+    Supports the sales report filters plus product and category.
+    """
+
+    pagination_class = KeysetPagination
+    ordering = ("period", "payment_method", "status", "product", "category")
+
+    @replica_reads
+    @closed_days_cached
+    def get(self, request):
+        rollups = filter_rollups(
+            ProductSalesRollup.objects.all(),
+            request.query_params,
+            ProductRollupFilterSerializer,
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rollups, request, view=self)  # One page
+        serializer = ProductSalesRollupSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class CategorySalesReport(APIView):
+    """
+    Quantity and revenue sold per hour or day and category.
+    GET: Returns a page of category totals, oldest period first, summed over
+    payment methods and statuses unless filtered by them.
+    Supports the product report filters.
+    """
+
+    pagination_class = KeysetPagination
+    ordering = ("period", "category")
+
+    @replica_reads
+    @closed_days_cached
+    def get(self, request):
+        rollups = filter_rollups(
+            ProductSalesRollup.objects.all(),
+            request.query_params,
+            ProductRollupFilterSerializer,
+        )
+        totals = rollups.values("period", "category").annotate(
+            quantity=Sum("quantity"), revenue=Sum("revenue")
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(totals, request, view=self)  # One page
+        serializer = CategorySalesSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class SalesExport(APIView):
+    """
+    Streams sales history with its line items for accounting.
+    GET: Returns every matching sale, oldest first, as CSV (one row per item)
+    or NDJSON (one sale per line), written while the database is read.
+    Supports date_from, date_to, status and payment_method filters and a
+    `cursor` taken from a previous export to resume after its last sale.
+    """
+
+    @replica_reads
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        sales = export_sales(
+            request.query_params, request.query_params.get("cursor")
+        )  # Validates filters and cursor before anything is streamed
+        response = StreamingHttpResponse(
+            stream_reads(export_lines(sales, export_format)),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="sales.{export_format}"'
+        )
+        return response
+
+
+class SalesReceipt(APIView):
+    """
+    Handles receipt reprints.
+    GET: Returns the stored receipt of a completed sale as plain text (for
+    thermal printers) or HTML. Receipts are rendered in the background when
+    the sale is completed and again after any edit; one that is not ready
+    yet is rendered on the spot.
+    """
+
+    def get(self, request, pk, receipt_format):
+        if receipt_format not in RECEIPT_FORMATS:
+            raise Http404
+        sale = Sales.objects.filter(pk=pk).only("status").first()
+        if sale is None:
+            raise Http404
+        if sale.status != RECEIPT_STATUS:
+            return Response(
+                {"detail": "Only completed sales have a receipt."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        receipt = get_receipt(sale)
+        if receipt is None:  # Completed and then changed meanwhile
+            return Response(
+                {"detail": "The sale changed, retry."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        content = receipt.text if receipt_format == "txt" else receipt.html
+        return HttpResponse(content, content_type=RECEIPT_FORMATS[receipt_format])
+
+
+# Mobile money views (async: collections are followed on the ASGI event loop)
+@method_decorator(csrf_exempt, name="dispatch")
+class SalesPayment(View):
+    """
+    Handles starting a mobile money collection for a pending sale.
+    POST: Takes {"phone": "..."}, asks the provider to collect the sale's total
+    and returns the payment reference right away (202). The provider's answer
+    is followed in the background and moves the sale to completed or
+    cancelled. Posting again resends the same collection (same reference).
+    Runs on the ASGI entry point; under WSGI the sale stays pending until a
+    callback arrives or `manage.py verify_payments` runs.
+    """
+
+    async def post(self, request, pk):
+        try:
+            data = json.loads(request.body or b"{}")
+            serializer = PaymentStartSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+            verifier = get_verifier()
+            sale = await verifier.start(pk, serializer.validated_data["phone"])
+        except ValueError:
+            return JsonResponse({"detail": "Invalid JSON."}, status=400)
+        except Sales.DoesNotExist:
+            return JsonResponse({"detail": "Not found."}, status=404)
+        except ProviderError as exc:
+            return JsonResponse(
+                {"detail": f"Payment provider unavailable, retry later: {exc}"},
+                status=502,
+            )
+        except APIException as exc:
+            # Same body as DRF's exception handler gives the other endpoints
+            detail = exc.detail
+            if not isinstance(detail, dict):
+                detail = {"detail": detail}
+            return JsonResponse(detail, status=exc.status_code)
+        response = {
+            "message": "Payment requested",
+            "content": {
+                "id": sale.pk,
+                "status": sale.status,
+                "payment_reference": sale.payment_reference,
+            },
+        }
+        return JsonResponse(response, status=202)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class PaymentCallback(View):
+    """
+    Handles the provider's notification that a collection is settled.
+    POST: Takes the provider's body (with `referenceId`); the outcome is
+    confirmed with the provider before the sale is completed or cancelled.
+    """
+
+    async def post(self, request):
+        try:
+            reference = json.loads(request.body or b"{}").get("referenceId")
+        except (ValueError, AttributeError):
+            reference = None
+        if not reference:
+            return JsonResponse({"detail": "referenceId is required."}, status=400)
+        outcome = await get_verifier().notify(str(reference))
+        if outcome is None:
+            return JsonResponse({"detail": "Not found."}, status=404)
+        return JsonResponse({"message": "Callback received", "status": outcome})